@@ -3,10 +3,67 @@ Django admin configuration for appointments and providers.
 Enhanced with custom displays, filters, and analytics dashboard.
 """
 
+from datetime import datetime, timedelta
+
 from django.contrib import admin
+from django.contrib.admin import helpers
+from django.db.models import Count, Max, Q, Sum
+from django.template.response import TemplateResponse
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Appointment, Provider
+from .cancellation import cancel_appointments, provider_schedule
+from .forms import CancelScheduleForm, ProviderAdminForm
+from .models import (
+    Appointment, AppointmentArchive, AppointmentSeries, CalendarCredential, Clinic, PriceRule, Provider,
+    WaitlistEntry,
+)
+from .pagination import EstimatedCountPaginator, KeysetChangeList
+from .routers import replica_reads
+from .search import search_appointments
+from .tasks import (
+    cancel_payment_intents,
+    enqueue_in_batches,
+    resync_calendar_events,
+    send_confirmation_emails,
+)
+
+
+class AppointmentMonthFilter(admin.SimpleListFilter):
+    """
+    Lightweight replacement for date_hierarchy.
+    
+    Month choices span the first to the last appointment, found with two indexed
+    MIN/MAX lookups rather than a DISTINCT scan of the table, and each choice
+    filters with an indexed range on appointment_time.
+    """
+    title = 'appointment month'
+    parameter_name = 'appointment_month'
+    
+    def lookups(self, request, model_admin):
+        times = model_admin.get_queryset(request).order_by('appointment_time').values_list('appointment_time', flat=True)
+        first, last = times.first(), times.last()
+        if first is None:
+            return []
+        first, last = timezone.localtime(first), timezone.localtime(last)
+        choices = []
+        # Newest month first, like the changelist's ordering
+        for month_index in range(last.year * 12 + last.month - 1, first.year * 12 + first.month - 2, -1):
+            year, month = divmod(month_index, 12)
+            choices.append((f'{year}-{month + 1:02d}', f'{year}-{month + 1:02d}'))
+        return choices
+    
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            year, month = (int(part) for part in self.value().split('-'))
+            start = timezone.make_aware(datetime(year, month, 1))
+        except ValueError:
+            return queryset.none()
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        end = timezone.make_aware(datetime(year, month, 1))
+        return queryset.filter(appointment_time__gte=start, appointment_time__lt=end)
 
 
 @admin.register(Appointment)
@@ -18,6 +75,7 @@ class AppointmentAdmin(admin.ModelAdmin):
         'client_email',
         'appointment_time',
         'appointment_type',
+        'status',
         'is_paid',
         'amount_paid',
         'confirmation_sent',
@@ -26,11 +84,14 @@ class AppointmentAdmin(admin.ModelAdmin):
     ]
     
     list_filter = [
+        'status',
         'is_paid',
+        'clinic',
         'provider',
         'appointment_type',
         'confirmation_sent',
         'calendar_synced',
+        AppointmentMonthFilter,
         'appointment_time',
         'created_at',
     ]
@@ -39,18 +100,21 @@ class AppointmentAdmin(admin.ModelAdmin):
         'provider__name',
         'client_email',
         'stripe_payment_intent_id',
+        'notes',
     ]
     
     readonly_fields = [
         'stripe_payment_intent_id',
         'google_calendar_event_id',
+        'status',
+        'cancelled_at',
         'created_at',
         'updated_at',
     ]
     
     fieldsets = (
         ('Appointment Details', {
-            'fields': ('provider', 'appointment_time', 'appointment_type', 'notes')
+            'fields': ('provider', 'appointment_time', 'appointment_type', 'notes', 'status', 'cancelled_at')
         }),
         ('Patient Information', {
             'fields': ('client_email',)
@@ -68,19 +132,82 @@ class AppointmentAdmin(admin.ModelAdmin):
         }),
     )
     
-    date_hierarchy = 'appointment_time'
     ordering = ['-appointment_time']
     
+    actions = [
+        'mark_paid',
+        'resend_confirmation',
+        'resync_calendar',
+        'cancel_appointments',
+    ]
+    
+    # Large-table changelist: join provider up front, estimate counts and
+    # skip the unfiltered total so each page stays a bounded indexed query
+    list_select_related = ['provider']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    keyset_field = 'appointment_time'
+    
+    def get_changelist(self, request, **kwargs):
+        """Use a changelist that supports keyset navigation for deep pages."""
+        return KeysetChangeList
+
     def get_queryset(self, request):
-        """Optimize queryset with select_related if needed in future."""
-        return super().get_queryset(request)
+        """Join the provider for change/delete pages and actions too (__str__ reads it)."""
+        return super().get_queryset(request).select_related('provider')
+
+    def get_search_results(self, request, queryset, search_term):
+        """Search through the full-text index, falling back to LIKE when it can't answer."""
+        if search_term:
+            results = search_appointments(queryset, search_term)
+            if results is not None:
+                return results, False
+        return super().get_search_results(request, queryset, search_term)
     
     def changelist_view(self, request, extra_context=None):
         """Override changelist view to add analytics dashboard link."""
         extra_context = extra_context or {}
         extra_context['dashboard_url'] = reverse('admin_dashboard')
         extra_context['show_dashboard_link'] = True
-        return super().changelist_view(request, extra_context=extra_context)
+        extra_context['archive_url'] = reverse('admin:appointments_appointmentarchive_changelist')
+        extra_context['export_url'] = reverse('export_appointments')
+        if request.method == 'POST':
+            # Bulk actions read and write the primary
+            return super().changelist_view(request, extra_context=extra_context)
+        return replica_reads(super().changelist_view)(request, extra_context=extra_context)
+    
+    # Bulk actions: one set-based UPDATE plus side effects enqueued in batches,
+    # so "select all" over tens of thousands of rows returns quickly
+    def mark_paid(self, request, queryset):
+        """Confirm selected appointments that are awaiting payment."""
+        updated = queryset.transition(Appointment.STATUS_CONFIRMED, is_paid=True)
+        self.message_user(request, f'{updated} appointment(s) marked as paid.')
+    mark_paid.short_description = 'Mark selected appointments as paid'
+    
+    def resend_confirmation(self, request, queryset):
+        """Queue confirmation emails for selected confirmed appointments."""
+        appointment_ids = queryset.filter(
+            status=Appointment.STATUS_CONFIRMED
+        ).values_list('pk', flat=True)
+        queued = enqueue_in_batches(send_confirmation_emails, appointment_ids)
+        self.message_user(request, f'Confirmation emails queued for {queued} appointment(s).')
+    resend_confirmation.short_description = 'Resend confirmation emails'
+    
+    def resync_calendar(self, request, queryset):
+        """Queue Google Calendar resync for appointments whose patient connected a calendar."""
+        appointment_ids = queryset.filter(
+            status__in=[Appointment.STATUS_PENDING_PAYMENT, Appointment.STATUS_CONFIRMED],
+            client_email__in=CalendarCredential.objects.values('client_email'),
+        ).values_list('pk', flat=True)
+        queued = enqueue_in_batches(resync_calendar_events, appointment_ids)
+        self.message_user(request, f'Calendar resync queued for {queued} appointment(s).')
+    resync_calendar.short_description = 'Resync with Google Calendar'
+    
+    def cancel_appointments(self, request, queryset):
+        """Cancel selected appointments and queue patient emails, calendar cleanup and refunds."""
+        cancelled = cancel_appointments(queryset)
+        self.message_user(request, f'{cancelled} appointment(s) cancelled; patient notifications and refunds queued.')
+    cancel_appointments.short_description = 'Cancel selected appointments'
     
     # Custom display methods
     def colored_payment_status(self, obj):
@@ -109,9 +236,51 @@ class AppointmentAdmin(admin.ModelAdmin):
     calendar_status.short_description = 'Calendar Synced'
 
 
+class BookingActivityFilter(admin.SimpleListFilter):
+    """Filter providers by whether they received bookings recently."""
+    title = 'booking activity'
+    parameter_name = 'booking_activity'
+    
+    # Window used for the "recent" / "no bookings" split
+    ACTIVITY_WINDOW = timedelta(days=30)
+    
+    def lookups(self, request, model_admin):
+        return [
+            ('recent', 'Booked in last 30 days'),
+            ('inactive', 'No bookings in 30 days'),
+        ]
+    
+    def queryset(self, request, queryset):
+        cutoff = timezone.now() - self.ACTIVITY_WINDOW
+        if self.value() == 'recent':
+            return queryset.filter(_last_booked_at__gte=cutoff)
+        if self.value() == 'inactive':
+            return queryset.filter(Q(_last_booked_at__lt=cutoff) | Q(_last_booked_at__isnull=True))
+        return queryset
+
+
+class PriceRuleInline(admin.TabularInline):
+    """Per-provider price rules, edited alongside the base prices."""
+    model = PriceRule
+    extra = 0
+    fields = [
+        'appointment_type',
+        'start_time',
+        'end_time',
+        'valid_from',
+        'valid_until',
+        'price',
+        'priority',
+        'is_active',
+    ]
+
+
 @admin.register(Provider)
 class ProviderAdmin(admin.ModelAdmin):
     """Admin interface for providers with pricing and revenue tracking."""
+    form = ProviderAdminForm
+    inlines = [PriceRuleInline]
+    
     list_display = [
         'id',
         'name',
@@ -120,12 +289,16 @@ class ProviderAdmin(admin.ModelAdmin):
         'follow_up_price',
         'is_active',
         'appointment_count',
+        'paid_count',
+        'total_revenue',
         'created_at',
     ]
     
     list_filter = [
         'is_active',
+        'clinic',
         'specialty',
+        BookingActivityFilter,
         'created_at',
     ]
     
@@ -135,19 +308,22 @@ class ProviderAdmin(admin.ModelAdmin):
         'specialty',
     ]
     
+    actions = ['cancel_schedule']
+    
     readonly_fields = [
         'created_at',
         'updated_at',
         'appointment_count',
+        'paid_count',
         'total_revenue',
     ]
     
     fieldsets = (
         ('Provider Information', {
-            'fields': ('name', 'specialty', 'email', 'phone', 'is_active')
+            'fields': ('clinic', 'name', 'specialty', 'email', 'phone', 'is_active')
         }),
         ('Pricing Configuration', {
-            'fields': ('consultation_price', 'follow_up_price'),
+            'fields': ('consultation_price', 'follow_up_price', 'reprice_pending'),
             'description': 'Set different prices for consultation and follow-up appointments'
         }),
         ('About', {
@@ -155,7 +331,7 @@ class ProviderAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
         ('Statistics', {
-            'fields': ('appointment_count', 'total_revenue'),
+            'fields': ('appointment_count', 'paid_count', 'total_revenue'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
@@ -164,32 +340,262 @@ class ProviderAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        """Annotate booking statistics in one grouped query instead of per-row lookups."""
+        return super().get_queryset(request).annotate(
+            _appointment_count=Count('appointments'),
+            _paid_count=Count('appointments', filter=Q(appointments__is_paid=True)),
+            _total_revenue=Sum('appointments__amount_paid', filter=Q(appointments__is_paid=True)),
+            _last_booked_at=Max('appointments__created_at'),
+        )
+    
     def appointment_count(self, obj):
         """Display total number of appointments."""
-        count = obj.appointments.count()
         return format_html(
             '<span style="font-weight: bold; color: #417690;">{}</span>',
-            count
+            obj._appointment_count
         )
     appointment_count.short_description = 'Total Appointments'
+    appointment_count.admin_order_field = '_appointment_count'
+    
+    def paid_count(self, obj):
+        """Display number of paid appointments."""
+        return obj._paid_count
+    paid_count.short_description = 'Paid Appointments'
+    paid_count.admin_order_field = '_paid_count'
     
     def total_revenue(self, obj):
         """Display total revenue from this provider."""
-        from django.db.models import Sum
-        revenue = obj.appointments.filter(is_paid=True).aggregate(
-            total=Sum('amount_paid')
-        )['total'] or 0
+        revenue = obj._total_revenue or 0
         return format_html(
             '<span style="font-weight: bold; color: green;">${}</span>',
             f'{revenue:.2f}'
         )
     total_revenue.short_description = 'Total Revenue'
+    total_revenue.admin_order_field = '_total_revenue'
+    
+    def cancel_schedule(self, request, queryset):
+        """Cancel the selected providers' appointments in a time range, asked for on an intermediate page."""
+        # Default to today's whole schedule
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        form = CancelScheduleForm(request.POST if 'apply' in request.POST else None, initial={
+            'start': today,
+            'end': today + timedelta(days=1),
+        })
+        if form.is_bound and form.is_valid():
+            schedule = provider_schedule(
+                list(queryset.values_list('pk', flat=True)), form.cleaned_data['start'], form.cleaned_data['end'],
+            )
+            cancelled = cancel_appointments(schedule, reason=form.cleaned_data['reason'] or None)
+            self.message_user(request, f'{cancelled} appointment(s) cancelled; patient notifications and refunds queued.')
+            return None
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Cancel provider schedule',
+            'opts': self.model._meta,
+            'providers': queryset,
+            'form': form,
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, 'admin/appointments/provider/cancel_schedule.html', context)
+    cancel_schedule.short_description = "Cancel selected providers' schedule"
     
     def save_model(self, request, obj, form, change):
         """Custom save to handle price updates."""
         super().save_model(request, obj, form, change)
         
         # Optionally update future unpaid appointments with new prices
-        if change and ('consultation_price' in form.changed_data or 'follow_up_price' in form.changed_data):
-            # This is optional - you might not want to update existing appointments
-            pass
+        if not change or not form.cleaned_data.get('reprice_pending'):
+            return
+        changed_types = [
+            appointment_type
+            for appointment_type, field in Provider.PRICE_FIELDS.items()
+            if field in form.changed_data
+        ]
+        if not changed_types:
+            return
+        
+        repriced, stale_intent_ids = obj.reprice_pending_appointments(changed_types)
+        enqueue_in_batches(cancel_payment_intents, stale_intent_ids)
+        
+        summary = ', '.join(f'{count} {appointment_type}' for appointment_type, count in repriced.items())
+        message = f'Repriced pending appointments ({summary}); {len(stale_intent_ids)} payment intent(s) cancelled.'
+        # Audit trail in the admin history for this provider
+        self.log_change(request, obj, message)
+        self.message_user(request, message)
+
+
+@admin.register(Clinic)
+class ClinicAdmin(admin.ModelAdmin):
+    """Admin interface for clinics (tenants) and the database each one uses."""
+    list_display = [
+        'name',
+        'slug',
+        'domain',
+        'database',
+        'is_active',
+    ]
+    
+    list_filter = [
+        'is_active',
+        'database',
+    ]
+    
+    search_fields = [
+        'name',
+        'slug',
+        'domain',
+    ]
+    
+    prepopulated_fields = {'slug': ('name',)}
+    readonly_fields = ['created_at', 'updated_at']
+
+
+class SeriesAppointmentInline(admin.TabularInline):
+    """Read-only list of the sessions booked in a series."""
+    model = Appointment
+    fields = ['appointment_time', 'status', 'is_paid', 'amount_paid']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    show_change_link = True
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(AppointmentSeries)
+class AppointmentSeriesAdmin(admin.ModelAdmin):
+    """Admin interface for recurring appointment series."""
+    list_display = [
+        'provider',
+        'client_email',
+        'appointment_type',
+        'first_appointment_time',
+        'interval_weeks',
+        'occurrences',
+        'created_at',
+    ]
+    
+    list_filter = [
+        'interval_weeks',
+        'appointment_type',
+        'clinic',
+    ]
+    
+    search_fields = [
+        '^client_email',
+        '=stripe_payment_intent_id',
+    ]
+    
+    list_select_related = ['provider']
+    inlines = [SeriesAppointmentInline]
+    # Sessions are expanded and booked once, from the booking page
+    readonly_fields = [
+        'provider', 'client_email', 'appointment_type', 'first_appointment_time', 'interval_weeks',
+        'occurrences', 'stripe_payment_intent_id', 'created_at', 'updated_at',
+    ]
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    """Admin interface for the waitlist and the holds offered from it."""
+    list_display = [
+        'client_email',
+        'provider',
+        'specialty',
+        'window_start',
+        'window_end',
+        'status',
+        'hold_expires_at',
+        'created_at',
+    ]
+    
+    list_filter = [
+        'status',
+        'specialty',
+        'clinic',
+    ]
+    
+    search_fields = [
+        '^client_email',
+    ]
+    
+    list_select_related = ['provider']
+    raw_id_fields = ['provider', 'offered_appointment']
+    readonly_fields = ['hold_expires_at', 'created_at', 'updated_at']
+    actions = ['withdraw_entries']
+    
+    def withdraw_entries(self, request, queryset):
+        """Take waiting patients off the waitlist."""
+        withdrawn = queryset.filter(status=WaitlistEntry.STATUS_WAITING).update(
+            status=WaitlistEntry.STATUS_WITHDRAWN, updated_at=timezone.now(),
+        )
+        self.message_user(request, f'{withdrawn} waitlist entry(s) withdrawn.')
+    withdraw_entries.short_description = 'Withdraw selected waiting entries'
+
+
+@admin.register(CalendarCredential)
+class CalendarCredentialAdmin(admin.ModelAdmin):
+    """Admin interface for stored calendar credentials (tokens are never displayed)."""
+    list_display = [
+        'client_email',
+        'expiry',
+        'updated_at',
+    ]
+    
+    search_fields = [
+        'client_email',
+    ]
+    
+    fields = ['client_email', 'google_account_id', 'token_uri', 'scopes', 'expiry', 'created_at', 'updated_at']
+    readonly_fields = ['client_email', 'google_account_id', 'token_uri', 'scopes', 'expiry', 'created_at', 'updated_at']
+    
+    def has_add_permission(self, request):
+        """Credentials are only created through the OAuth flow."""
+        return False
+
+
+
+@admin.register(AppointmentArchive)
+class AppointmentArchiveAdmin(admin.ModelAdmin):
+    """Read-only view of archived appointments for patient history lookups."""
+    list_display = [
+        'id',
+        'provider_name',
+        'client_email',
+        'appointment_time',
+        'appointment_type',
+        'is_paid',
+        'amount_paid',
+        'status',
+        'archived_at',
+    ]
+    
+    list_filter = [
+        'status',
+        'is_paid',
+        'appointment_type',
+        'archived_at',
+    ]
+    
+    # Exact/prefix lookups so support searches use the client_email index
+    search_fields = [
+        '=id',
+        '^client_email',
+        '=stripe_payment_intent_id',
+    ]
+    
+    list_select_related = ['provider']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
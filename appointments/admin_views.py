@@ -3,15 +3,25 @@ Custom admin dashboard for appointment analytics.
 Displays metrics, revenue tracking, and performance indicators.
 """
 
+import csv
+
 from django.shortcuts import render
 from django.contrib.admin.views.decorators import staff_member_required
 from django.db.models import Count, Sum, Avg, Q
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from datetime import timedelta
-from .models import Appointment
+from .instrumentation import metrics as request_metrics
+from .models import Appointment, AppointmentArchive, appointments_with_archive
+from .routers import replica_reads
+
+# Appointment columns shown in the dashboard's upcoming/recent lists
+DASHBOARD_LIST_FIELDS = ('provider_name', 'client_email', 'appointment_time', 'is_paid', 'created_at')
 
 
 @staff_member_required
+@replica_reads
 def admin_dashboard(request):
     """Display analytics dashboard with key metrics and insights."""
     
@@ -21,53 +31,57 @@ def admin_dashboard(request):
     week_start = today_start - timedelta(days=today_start.weekday())
     month_start = today_start.replace(day=1)
     
+    # Status breakdown in one grouped query on the status index
+    status_counts = dict(
+        Appointment.objects.order_by().values_list('status').annotate(count=Count('id'))
+    )
+    
+    # Every total and period statistic in one filtered aggregate over the table
+    paid = Q(is_paid=True)
+    stats = Appointment.objects.aggregate(
+        total_paid=Count('id', filter=paid),
+        total_revenue=Sum('amount_paid', filter=paid),
+        today_appointments=Count('id', filter=Q(created_at__gte=today_start)),
+        today_paid=Count('id', filter=Q(created_at__gte=today_start) & paid),
+        week_appointments=Count('id', filter=Q(created_at__gte=week_start)),
+        week_revenue=Sum('amount_paid', filter=Q(created_at__gte=week_start) & paid),
+        month_appointments=Count('id', filter=Q(created_at__gte=month_start)),
+        month_revenue=Sum('amount_paid', filter=Q(created_at__gte=month_start) & paid),
+        email_sent=Count('id', filter=Q(confirmation_sent=True)),
+        calendar_synced=Count('id', filter=Q(calendar_synced=True)),
+        reminders_sent=Count('id', filter=Q(reminder_sent=True)),
+    )
+    
     # Total statistics
-    total_appointments = Appointment.objects.count()
-    total_paid = Appointment.objects.filter(is_paid=True).count()
-    total_revenue = Appointment.objects.filter(is_paid=True).aggregate(
-        total=Sum('amount_paid')
-    )['total'] or 0
+    total_appointments = sum(status_counts.values())
+    total_paid = stats['total_paid']
+    total_revenue = stats['total_revenue'] or 0
     
     # Today's statistics
-    today_appointments = Appointment.objects.filter(
-        created_at__gte=today_start
-    ).count()
-    today_paid = Appointment.objects.filter(
-        created_at__gte=today_start,
-        is_paid=True
-    ).count()
+    today_appointments = stats['today_appointments']
+    today_paid = stats['today_paid']
     
     # This week's statistics
-    week_appointments = Appointment.objects.filter(
-        created_at__gte=week_start
-    ).count()
-    week_revenue = Appointment.objects.filter(
-        created_at__gte=week_start,
-        is_paid=True
-    ).aggregate(total=Sum('amount_paid'))['total'] or 0
+    week_appointments = stats['week_appointments']
+    week_revenue = stats['week_revenue'] or 0
     
     # This month's statistics
-    month_appointments = Appointment.objects.filter(
-        created_at__gte=month_start
-    ).count()
-    month_revenue = Appointment.objects.filter(
-        created_at__gte=month_start,
-        is_paid=True
-    ).aggregate(total=Sum('amount_paid'))['total'] or 0
+    month_appointments = stats['month_appointments']
+    month_revenue = stats['month_revenue'] or 0
     
     # Email & Calendar statistics
-    email_sent = Appointment.objects.filter(confirmation_sent=True).count()
-    calendar_synced = Appointment.objects.filter(calendar_synced=True).count()
-    reminders_sent = Appointment.objects.filter(reminder_sent=True).count()
+    email_sent = stats['email_sent']
+    calendar_synced = stats['calendar_synced']
+    reminders_sent = stats['reminders_sent']
     
     # Upcoming appointments
     upcoming_appointments = Appointment.objects.filter(
+        status=Appointment.STATUS_CONFIRMED,
         appointment_time__gte=now,
-        is_paid=True
-    ).order_by('appointment_time')[:5]
+    ).order_by('appointment_time').only(*DASHBOARD_LIST_FIELDS)[:5]
     
     # Recent appointments
-    recent_appointments = Appointment.objects.order_by('-created_at')[:5]
+    recent_appointments = Appointment.objects.order_by('-created_at').only(*DASHBOARD_LIST_FIELDS)[:5]
     
     # Appointment by type
     appointments_by_type = Appointment.objects.values(
@@ -80,7 +94,7 @@ def admin_dashboard(request):
     ).annotate(count=Count('id')).order_by('-count')[:5]
     
     # Payment statistics
-    pending_payments = Appointment.objects.filter(is_paid=False).count()
+    pending_payments = status_counts.get(Appointment.STATUS_PENDING_PAYMENT, 0)
     payment_success_rate = (total_paid / total_appointments * 100) if total_appointments > 0 else 0
     
     # Email & Calendar conversion rates
@@ -126,3 +140,50 @@ def admin_dashboard(request):
     
     return render(request, 'admin/appointments/dashboard.html', context)
 
+
+class _Echo:
+    """Pseudo-buffer so csv.writer rows can be streamed instead of buffered."""
+    
+    def write(self, value):
+        return value
+
+
+@staff_member_required
+@replica_reads
+def export_appointments(request):
+    """
+    Stream appointments as CSV.
+    
+    Query params: email (patient history), from/to (YYYY-MM-DD on appointment
+    date) and include_archive=1 to union in archived appointments.
+    """
+    filters = {}
+    if request.GET.get('email'):
+        filters['client_email'] = request.GET['email']
+    date_from = parse_date(request.GET.get('from', '') or '')
+    date_to = parse_date(request.GET.get('to', '') or '')
+    if date_from:
+        filters['appointment_time__date__gte'] = date_from
+    if date_to:
+        filters['appointment_time__date__lte'] = date_to
+    include_archive = request.GET.get('include_archive') == '1'
+    
+    fields = AppointmentArchive.copied_fields()
+    rows = appointments_with_archive(include_archive, **filters)
+    
+    writer = csv.writer(_Echo())
+    
+    def stream():
+        yield writer.writerow(fields)
+        for row in rows.iterator(chunk_size=2000):
+            yield writer.writerow([row[field] for field in fields])
+    
+    response = StreamingHttpResponse(stream(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="appointments.csv"'
+    return response
+
+
+@staff_member_required
+def metrics(request):
+    """Per-view latency histograms and dependency timings in Prometheus text format."""
+    return HttpResponse(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
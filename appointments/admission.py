@@ -0,0 +1,110 @@
+"""
+Admission control for the booking endpoints.
+Sliding-window rate limits are counted in a shared cache so every worker sees
+the same totals; concurrency limits count in-flight requests in this process.
+AdmissionControlMiddleware uses both to reject excess requests up front with
+a 429 (one client over its share) or 503 (the site over capacity).
+"""
+
+import math
+import threading
+import time
+from dataclasses import dataclass
+
+from django.core.cache import caches
+
+
+@dataclass(frozen=True)
+class Rejection:
+    """Why a request was shed and when the client should retry."""
+    status: int
+    reason: str
+    retry_after: int
+
+
+def _window_keys(key, window, now):
+    index = int(now // window)
+    elapsed = (now % window) / window
+    return f'admission:{key}:{index}', f'admission:{key}:{index - 1}', elapsed
+
+
+def _retry_after(previous, current, limit, window, elapsed):
+    """Seconds until the sliding-window estimate falls back within the limit."""
+    # Still in this window: the previous window's weight decays linearly
+    if current <= limit:
+        fraction = 1 - (limit - current) / previous
+        return max(1, math.ceil((fraction - elapsed) * window))
+    # Otherwise wait for this window's count to become the decaying previous one
+    fraction = 1 - limit / current
+    return max(1, math.ceil((1 - elapsed + fraction) * window))
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding-window-counter rate limit.
+
+    The estimate is this window's count plus the previous window's count
+    weighted by how much of it still overlaps the sliding window. Every
+    attempt is counted, so a client that keeps flooding stays limited.
+    """
+
+    def __init__(self, cache_alias, limit, window):
+        self.cache = caches[cache_alias]
+        self.limit = limit
+        self.window = window
+
+    def hit(self, key, now=None):
+        """Count one request; return seconds to wait if over the limit, else None."""
+        current_key, previous_key, elapsed = _window_keys(key, self.window, now or time.time())
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            # First request of the window (add loses the race to at most one other worker)
+            current = 1 if self.cache.add(current_key, 1, self.window * 2) else self.cache.incr(current_key)
+        previous = self.cache.get(previous_key, 0)
+        return self.evaluate(previous, current, elapsed)
+
+    async def ahit(self, key, now=None):
+        current_key, previous_key, elapsed = _window_keys(key, self.window, now or time.time())
+        try:
+            current = await self.cache.aincr(current_key)
+        except ValueError:
+            added = await self.cache.aadd(current_key, 1, self.window * 2)
+            current = 1 if added else await self.cache.aincr(current_key)
+        previous = await self.cache.aget(previous_key, 0)
+        return self.evaluate(previous, current, elapsed)
+
+    def evaluate(self, previous, current, elapsed):
+        if previous * (1 - elapsed) + current <= self.limit:
+            return None
+        return _retry_after(previous, current, self.limit, self.window, elapsed)
+
+
+class ConcurrencyLimiter:
+    """In-flight request counts for this process, overall and per client."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = 0
+        self.per_client = {}
+
+    def acquire(self, client, total_limit, client_limit, force=False):
+        """Take a slot; return 'client' or 'global' if a limit is full (unless forced), else None."""
+        with self.lock:
+            if not force:
+                if self.per_client.get(client, 0) >= client_limit:
+                    return 'client'
+                if self.total >= total_limit:
+                    return 'global'
+            self.total += 1
+            self.per_client[client] = self.per_client.get(client, 0) + 1
+        return None
+
+    def release(self, client):
+        with self.lock:
+            self.total -= 1
+            remaining = self.per_client.get(client, 1) - 1
+            if remaining:
+                self.per_client[client] = remaining
+            else:
+                self.per_client.pop(client, None)
@@ -1,6 +1,35 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate, pre_migrate
+
+
+def _drop_search_triggers(sender, using, **kwargs):
+    from .search import drop_search_triggers
+    drop_search_triggers(connections[using])
+
+
+def _install_search_triggers(sender, using, **kwargs):
+    from .search import install_search_triggers
+    install_search_triggers(connections[using])
 
 
 class AppointmentsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "appointments"
+
+    def ready(self):
+        # Registers the signal handlers that invalidate compiled pricing and directory pages
+        from . import directory, pricing  # noqa: F401
+        from .db import configure_sqlite_connection
+        from .instrumentation import install_query_timer
+        from .tenants import clear_clinic_cache
+
+        connection_created.connect(configure_sqlite_connection)
+        connection_created.connect(install_query_timer)
+
+        # Search index triggers must not be attached while SQLite rebuilds tables
+        pre_migrate.connect(_drop_search_triggers, sender=self)
+        post_migrate.connect(_install_search_triggers, sender=self)
+        # Migrations and flushes can add or remove clinics behind the cache
+        post_migrate.connect(clear_clinic_cache, sender=self)
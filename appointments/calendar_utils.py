@@ -4,23 +4,50 @@ Handles OAuth flow, event creation, and calendar file generation.
 """
 
 from django.conf import settings
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from django.utils import timezone
 import logging
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
 import json
 
+from .gateways import (
+    google_auth_requests, google_credentials, google_discovery, google_errors, google_flow, google_id_token,
+)
+from .instrumentation import timed
+from .models import Appointment, CalendarCredential
+from .routers import tenant_database
+from .tenants import clinic_databases
+
 logger = logging.getLogger(__name__)
 
-# Google Calendar API scopes
-SCOPES = ['https://www.googleapis.com/auth/calendar.events']
+# Google Calendar API scopes, plus the identity scopes that prove which account granted them
+SCOPES = ['openid', 'https://www.googleapis.com/auth/userinfo.email', 'https://www.googleapis.com/auth/calendar.events']
+
+# Session entry for an in-progress OAuth flow: {'state': ..., 'appointment_id': ...}
+CALENDAR_OAUTH_SESSION_KEY = 'calendar_oauth'
+
+# Session entry naming the Google account email this browser has proven it owns
+CALENDAR_ACCOUNT_SESSION_KEY = 'calendar_account'
+
+# Refresh access tokens this long before they actually expire
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+# Per-process cache of refreshed access tokens: credential id -> (token, expiry)
+_token_cache = {}
+_token_locks = {}
+_token_locks_guard = threading.Lock()
 
+# Bound the fallback full resync when Google invalidates a sync token
+FULL_RESYNC_WINDOW = timedelta(days=90)
+FULL_RESYNC_MAX_PAGES = 20
 
-def create_google_calendar_flow(request):
+# Keep IN (...) lookups under SQLite's bound-parameter limit
+SYNC_LOOKUP_CHUNK_SIZE = 500
+
+
+def create_google_calendar_flow(request, appointment_id):
     """Create OAuth flow for Google Calendar authorization."""
-    flow = Flow.from_client_config(
+    flow = google_flow.Flow.from_client_config(
         {
             "web": {
                 "client_id": settings.GOOGLE_CALENDAR_CLIENT_ID,
@@ -40,20 +67,41 @@ def create_google_calendar_flow(request):
         include_granted_scopes='true'
     )
     
-    # Store state in session for security
-    request.session['google_oauth_state'] = state
+    # One small session entry: the OAuth state and the appointment (and its clinic) to add
+    request.session[CALENDAR_OAUTH_SESSION_KEY] = {
+        'state': state,
+        'appointment_id': appointment_id,
+        'clinic': request.clinic.slug,
+    }
     
     return auth_url
 
 
-def handle_google_calendar_callback(request):
-    """Handle OAuth callback and store credentials in session."""
+class CalendarAccountError(Exception):
+    """The Google account that granted access can't be linked to the patient email."""
+
+
+def verified_google_account(credentials):
+    """Return (account id, email) from the verified id_token Google issued with the credentials."""
+    if not credentials.id_token:
+        raise CalendarAccountError("Google did not say which account granted access")
+    claims = google_id_token.verify_oauth2_token(
+        credentials.id_token, google_auth_requests.Request(), settings.GOOGLE_CALENDAR_CLIENT_ID
+    )
+    if not claims.get('email_verified'):
+        raise CalendarAccountError("The Google account's email address is not verified")
+    return claims['sub'], claims['email'].lower()
+
+
+@timed('calendar')
+def handle_google_calendar_callback(request, client_email):
+    """Handle OAuth callback and persist credentials for the patient."""
     try:
-        state = request.session.get('google_oauth_state')
+        state = request.session.get(CALENDAR_OAUTH_SESSION_KEY, {}).get('state')
         if not state:
             return False, "Invalid state parameter"
         
-        flow = Flow.from_client_config(
+        flow = google_flow.Flow.from_client_config(
             {
                 "web": {
                     "client_id": settings.GOOGLE_CALENDAR_CLIENT_ID,
@@ -71,16 +119,14 @@ def handle_google_calendar_callback(request):
         # Exchange authorization code for credentials
         flow.fetch_token(authorization_response=request.build_absolute_uri())
         
-        # Store credentials in session (in production, store in database)
-        credentials = flow.credentials
-        request.session['google_calendar_credentials'] = {
-            'token': credentials.token,
-            'refresh_token': credentials.refresh_token,
-            'token_uri': credentials.token_uri,
-            'client_id': credentials.client_id,
-            'client_secret': credentials.client_secret,
-            'scopes': credentials.scopes
-        }
+        # Only link the credentials to the appointment's email if Google vouches for it
+        account_id, account_email = verified_google_account(flow.credentials)
+        if account_email != client_email.lower():
+            return False, f"Sign in with the Google account for {client_email}"
+        
+        # Persist encrypted credentials so future appointments skip OAuth
+        save_calendar_credentials(client_email, flow.credentials, account_id)
+        request.session[CALENDAR_ACCOUNT_SESSION_KEY] = account_email
         
         return True, "Calendar access granted"
         
@@ -89,17 +135,187 @@ def handle_google_calendar_callback(request):
         return False, f"OAuth error: {str(e)}"
 
 
-def create_calendar_event(appointment, credentials_dict=None):
+def _to_utc_naive(value):
+    """Convert aware datetime to the naive UTC form google-auth expects."""
+    if value is None:
+        return None
+    return value.astimezone(dt_timezone.utc).replace(tzinfo=None)
+
+
+def _to_aware(value):
+    """Convert google-auth naive UTC expiry to an aware datetime."""
+    if value is None:
+        return None
+    return timezone.make_aware(value, dt_timezone.utc)
+
+
+def _get_token_lock(credential_id):
+    """Return the per-credential lock so concurrent refreshes collapse into one."""
+    with _token_locks_guard:
+        return _token_locks.setdefault(credential_id, threading.Lock())
+
+
+def _build_credentials(credential, token, expiry):
+    """Build google-auth Credentials from a stored CalendarCredential."""
+    return google_credentials.Credentials(
+        token=token,
+        refresh_token=credential.refresh_token,
+        token_uri=credential.token_uri,
+        client_id=settings.GOOGLE_CALENDAR_CLIENT_ID,
+        client_secret=settings.GOOGLE_CALENDAR_CLIENT_SECRET,
+        scopes=credential.scopes.split() or SCOPES,
+        expiry=_to_utc_naive(expiry),
+    )
+
+
+def save_calendar_credentials(client_email, credentials, google_account_id):
+    """Store (or update) encrypted OAuth credentials for a patient email."""
+    linked_account = CalendarCredential.objects.filter(
+        client_email=client_email
+    ).values_list('google_account_id', flat=True).first()
+    if linked_account and linked_account != google_account_id:
+        raise CalendarAccountError(f"A different Google account is already linked to {client_email}")
+    
+    defaults = {
+        'google_account_id': google_account_id,
+        'token': credentials.token,
+        'token_uri': credentials.token_uri,
+        'scopes': ' '.join(credentials.scopes or SCOPES),
+        'expiry': _to_aware(credentials.expiry),
+    }
+    # Google only returns a refresh token on first consent - keep the old one otherwise
+    if credentials.refresh_token:
+        defaults['refresh_token'] = credentials.refresh_token
+    
+    credential, _ = CalendarCredential.objects.update_or_create(
+        client_email=client_email,
+        defaults=defaults,
+    )
+    _token_cache[credential.id] = (credential.token, credential.expiry)
+    return credential
+
+
+def get_calendar_credentials(client_email):
+    """Load stored credentials for a patient, refreshing the access token if near expiry."""
+    credential = CalendarCredential.objects.filter(client_email=client_email).first()
+    if not credential:
+        return None
+    return get_credentials_for(credential)
+
+
+@timed('calendar')
+def get_credentials_for(credential):
+    """Return usable Credentials for a CalendarCredential, refreshing proactively."""
+    cached = _token_cache.get(credential.id)
+    if cached and cached[1] and cached[1] - TOKEN_REFRESH_MARGIN > timezone.now():
+        return _build_credentials(credential, *cached)
+    
+    with _get_token_lock(credential.id):
+        # Another thread may have refreshed while we waited
+        cached = _token_cache.get(credential.id)
+        if cached and cached[1] and cached[1] - TOKEN_REFRESH_MARGIN > timezone.now():
+            return _build_credentials(credential, *cached)
+        
+        # Another process may have refreshed and saved a newer token
+        credential.refresh_from_db()
+        if not credential.needs_refresh(TOKEN_REFRESH_MARGIN):
+            _token_cache[credential.id] = (credential.token, credential.expiry)
+            return _build_credentials(credential, credential.token, credential.expiry)
+        
+        if not credential.refresh_token:
+            logger.warning(f"No refresh token stored for {credential.client_email}")
+            return None
+        
+        credentials = _build_credentials(credential, credential.token, credential.expiry)
+        try:
+            credentials.refresh(google_auth_requests.Request())
+        except Exception as e:
+            logger.error(f"Google token refresh failed for {credential.client_email}: {str(e)}")
+            return None
+        
+        credential.token = credentials.token
+        credential.expiry = _to_aware(credentials.expiry)
+        credential.save(update_fields=['token', 'expiry', 'updated_at'])
+        _token_cache[credential.id] = (credential.token, credential.expiry)
+        logger.info(f"Refreshed Google access token for {credential.client_email}")
+        return credentials
+
+
+def get_credentials_by_email(client_emails):
+    """Load usable credentials for many patients with a single query."""
+    credentials_by_email = {}
+    for credential in CalendarCredential.objects.filter(client_email__in=list(client_emails)):
+        credentials = get_credentials_for(credential)
+        if credentials:
+            credentials_by_email[credential.client_email] = credentials
+    return credentials_by_email
+
+
+def resync_appointment_events(appointments):
+    """Push current details for many appointments to Google and record results in bulk."""
+    appointments = list(appointments)
+    credentials_by_email = get_credentials_by_email({a.client_email for a in appointments})
+    
+    synced_ids = []
+    created = []
+    for appointment in appointments:
+        credentials = credentials_by_email.get(appointment.client_email)
+        if not credentials:
+            continue
+        if appointment.google_calendar_event_id:
+            success, _ = update_calendar_event(appointment, appointment.google_calendar_event_id, credentials)
+        else:
+            success, event_id = create_calendar_event(appointment, credentials)
+            if success:
+                appointment.google_calendar_event_id = event_id
+                created.append(appointment)
+        if success:
+            synced_ids.append(appointment.id)
+    
+    if created:
+        Appointment.objects.bulk_update(created, ['google_calendar_event_id'], batch_size=SYNC_LOOKUP_CHUNK_SIZE)
+    Appointment.objects.filter(id__in=synced_ids).update(calendar_synced=True, updated_at=timezone.now())
+    return synced_ids
+
+
+def delete_appointment_events(appointments):
+    """Delete Google events for many appointments and clear their sync fields in bulk."""
+    appointments = [a for a in appointments if a.google_calendar_event_id]
+    credentials_by_email = get_credentials_by_email({a.client_email for a in appointments})
+    
+    deleted_ids = []
+    for appointment in appointments:
+        credentials = credentials_by_email.get(appointment.client_email)
+        if not credentials:
+            continue
+        success, _ = delete_calendar_event(appointment.google_calendar_event_id, credentials)
+        if success:
+            deleted_ids.append(appointment.id)
+    
+    Appointment.objects.filter(id__in=deleted_ids).update(
+        google_calendar_event_id=None,
+        calendar_synced=False,
+        updated_at=timezone.now(),
+    )
+    return deleted_ids
+
+
+def _as_credentials(credentials):
+    """Accept Credentials objects or legacy credential dicts."""
+    if isinstance(credentials, dict):
+        return google_credentials.Credentials.from_authorized_user_info(credentials, SCOPES)
+    return credentials
+
+
+@timed('calendar')
+def create_calendar_event(appointment, credentials=None):
     """Create Google Calendar event for appointment with reminders."""
     try:
-        if not credentials_dict:
+        if not credentials:
             return False, "No calendar credentials available"
         
-        # Initialize Google Calendar API client
-        credentials = Credentials.from_authorized_user_info(credentials_dict, SCOPES)
-        
         # Build calendar service
-        service = build('calendar', 'v3', credentials=credentials)
+        service = google_discovery.build('calendar', 'v3', credentials=_as_credentials(credentials))
         
         # Prepare event details
         event = {
@@ -147,7 +363,7 @@ def create_calendar_event(appointment, credentials_dict=None):
         logger.info(f"Calendar event created: {created_event['id']}")
         return True, created_event['id']
         
-    except HttpError as e:
+    except google_errors.HttpError as e:
         logger.error(f"Google Calendar API error: {str(e)}")
         return False, f"Calendar API error: {str(e)}"
     except Exception as e:
@@ -155,14 +371,14 @@ def create_calendar_event(appointment, credentials_dict=None):
         return False, f"Error creating calendar event: {str(e)}"
 
 
-def update_calendar_event(appointment, event_id, credentials_dict=None):
+@timed('calendar')
+def update_calendar_event(appointment, event_id, credentials=None):
     """Update existing Google Calendar event with new appointment details."""
     try:
-        if not credentials_dict:
+        if not credentials:
             return False, "No calendar credentials available"
         
-        credentials = Credentials.from_authorized_user_info(credentials_dict, SCOPES)
-        service = build('calendar', 'v3', credentials=credentials)
+        service = google_discovery.build('calendar', 'v3', credentials=_as_credentials(credentials))
         
         # Get existing event
         event = service.events().get(calendarId='primary', eventId=event_id).execute()
@@ -195,14 +411,14 @@ def update_calendar_event(appointment, event_id, credentials_dict=None):
         return False, f"Error updating calendar event: {str(e)}"
 
 
-def delete_calendar_event(event_id, credentials_dict=None):
+@timed('calendar')
+def delete_calendar_event(event_id, credentials=None):
     """Delete Google Calendar event by ID."""
     try:
-        if not credentials_dict:
+        if not credentials:
             return False, "No calendar credentials available"
         
-        credentials = Credentials.from_authorized_user_info(credentials_dict, SCOPES)
-        service = build('calendar', 'v3', credentials=credentials)
+        service = google_discovery.build('calendar', 'v3', credentials=_as_credentials(credentials))
         
         service.events().delete(
             calendarId='primary',
@@ -218,6 +434,123 @@ def delete_calendar_event(event_id, credentials_dict=None):
         return False, f"Error deleting calendar event: {str(e)}"
 
 
+def _list_changed_events(service, sync_token=None):
+    """Fetch changed events since sync_token, or a bounded full listing without one."""
+    params = {'calendarId': 'primary', 'showDeleted': True, 'maxResults': 250}
+    if sync_token:
+        params['syncToken'] = sync_token
+    else:
+        params['timeMin'] = (timezone.now() - FULL_RESYNC_WINDOW).isoformat()
+    
+    events = []
+    pages = 0
+    while True:
+        response = service.events().list(**params).execute()
+        events.extend(response.get('items', []))
+        pages += 1
+        
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return events, response.get('nextSyncToken', '')
+        if not sync_token and pages >= FULL_RESYNC_MAX_PAGES:
+            # Truncated full resync - no sync token, so the next run starts over
+            logger.warning(f"Full calendar resync stopped after {pages} pages")
+            return events, ''
+        params['pageToken'] = page_token
+
+
+def apply_calendar_changes(credential, events):
+    """
+    Map one credential's changed Google events back to its patient's appointments and apply them in bulk.
+    
+    Credentials live on the default database but a patient can book at any
+    clinic, so every clinic database is checked.
+    """
+    events_by_id = {event['id']: event for event in events if event.get('id')}
+    changes = {'moved': 0, 'deleted': 0}
+    for using in clinic_databases():
+        with tenant_database(using):
+            moved, deleted = _apply_calendar_changes_here(credential, events_by_id)
+        changes['moved'] += moved
+        changes['deleted'] += deleted
+    return changes
+
+
+def _apply_calendar_changes_here(credential, events_by_id):
+    """apply_calendar_changes for the current clinic database; returns (moved, deleted) counts."""
+    event_ids = list(events_by_id)
+    
+    moved = []
+    deleted_ids = []
+    for start in range(0, len(event_ids), SYNC_LOOKUP_CHUNK_SIZE):
+        chunk = event_ids[start:start + SYNC_LOOKUP_CHUNK_SIZE]
+        # Event ids are only unique within one calendar, so stay on this patient's appointments
+        appointments = Appointment.objects.filter(
+            client_email=credential.client_email,
+            google_calendar_event_id__in=chunk,
+        ).only('id', 'appointment_time', 'google_calendar_event_id')
+        
+        for appointment in appointments:
+            event = events_by_id[appointment.google_calendar_event_id]
+            if event.get('status') == 'cancelled':
+                deleted_ids.append(appointment.id)
+                continue
+            
+            start_value = event.get('start', {}).get('dateTime')
+            if not start_value:
+                continue  # All-day events can't map to an appointment slot
+            new_time = datetime.fromisoformat(start_value)
+            if new_time != appointment.appointment_time:
+                appointment.appointment_time = new_time
+                appointment.updated_at = timezone.now()
+                moved.append(appointment)
+    
+    if moved:
+        Appointment.objects.bulk_update(
+            moved, ['appointment_time', 'updated_at'], batch_size=SYNC_LOOKUP_CHUNK_SIZE
+        )
+    if deleted_ids:
+        Appointment.objects.filter(id__in=deleted_ids).update(
+            google_calendar_event_id=None,
+            calendar_synced=False,
+            updated_at=timezone.now(),
+        )
+    
+    return len(moved), len(deleted_ids)
+
+
+@timed('calendar')
+def sync_calendar_changes(credential):
+    """Pull changed events for one credential using its stored sync token."""
+    credentials = get_credentials_for(credential)
+    if not credentials:
+        return False, "No usable calendar credentials"
+    
+    try:
+        service = google_discovery.build('calendar', 'v3', credentials=credentials)
+        try:
+            events, next_sync_token = _list_changed_events(service, credential.sync_token)
+        except google_errors.HttpError as e:
+            if e.resp.status != 410:
+                raise
+            # Sync token expired or invalidated - fall back to a bounded full resync
+            logger.warning(f"Sync token invalidated for {credential.client_email}, running full resync")
+            events, next_sync_token = _list_changed_events(service)
+        
+        changes = apply_calendar_changes(credential, events)
+        
+        credential.sync_token = next_sync_token
+        credential.last_synced_at = timezone.now()
+        credential.save(update_fields=['sync_token', 'last_synced_at', 'updated_at'])
+        
+        logger.info(f"Calendar sync for {credential.client_email}: {changes}")
+        return True, changes
+        
+    except Exception as e:
+        logger.error(f"Calendar sync error for {credential.client_email}: {str(e)}")
+        return False, f"Error syncing calendar: {str(e)}"
+
+
 def generate_ics_file(appointment):
     """Generate ICS calendar file for universal calendar import."""
     ics_content = f"""BEGIN:VCALENDAR
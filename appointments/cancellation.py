@@ -0,0 +1,44 @@
+"""
+Bulk appointment cancellation.
+Cancels any number of appointments with one set-based UPDATE and hands the
+side effects (patient emails, Google Calendar deletions, Stripe refunds and
+waitlist offers) to background tasks in fixed-size batches.
+"""
+
+from django.utils import timezone
+
+from .db import write_transaction
+from .models import Appointment
+from .tasks import (
+    delete_calendar_events,
+    enqueue_in_batches,
+    offer_waitlist_slots,
+    refund_payments,
+    send_cancellation_emails,
+)
+
+
+def provider_schedule(provider_ids, start, end):
+    """The providers' appointments from start up to (not including) end."""
+    return Appointment.objects.filter(
+        provider_id__in=provider_ids,
+        appointment_time__gte=start,
+        appointment_time__lt=end,
+    )
+
+
+def cancel_appointments(queryset, reason=None):
+    """Cancel every cancellable appointment in the queryset and queue the follow-up work; returns the count."""
+    cancellable = queryset.can_transition_to(Appointment.STATUS_CANCELLED)
+    # Read the affected rows and flip them under one write lock, so both see the same set
+    with write_transaction():
+        rows = list(cancellable.values_list('pk', 'calendar_synced', 'is_paid'))
+        cancelled = cancellable.transition(Appointment.STATUS_CANCELLED, cancelled_at=timezone.now())
+
+    appointment_ids = [pk for pk, _, _ in rows]
+    enqueue_in_batches(send_cancellation_emails, appointment_ids, reason=reason)
+    enqueue_in_batches(delete_calendar_events, [pk for pk, synced, _ in rows if synced])
+    enqueue_in_batches(refund_payments, [pk for pk, _, paid in rows if paid])
+    # Freed slots go to patients on the waitlist
+    enqueue_in_batches(offer_waitlist_slots, appointment_ids)
+    return cancelled
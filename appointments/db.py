@@ -0,0 +1,68 @@
+"""
+SQLite connection tuning.
+Applies journaling, busy-timeout and cache pragmas to each new connection and
+provides write_transaction() for booking paths that must not hit lock errors.
+"""
+
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+
+JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+SYNCHRONOUS_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """connection_created handler: apply the SQLITE_* pragmas from settings."""
+    if connection.vendor != 'sqlite' or not settings.SQLITE_TUNING:
+        return
+
+    journal_mode = settings.SQLITE_JOURNAL_MODE.upper()
+    synchronous = settings.SQLITE_SYNCHRONOUS.upper()
+    if journal_mode not in JOURNAL_MODES:
+        raise ImproperlyConfigured(f"Unsupported SQLITE_JOURNAL_MODE: {settings.SQLITE_JOURNAL_MODE}")
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ImproperlyConfigured(f"Unsupported SQLITE_SYNCHRONOUS: {settings.SQLITE_SYNCHRONOUS}")
+
+    with connection.cursor() as cursor:
+        # In-memory databases (tests) can't use WAL
+        if not connection.is_in_memory_db():
+            cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+        cursor.execute(f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA synchronous = {synchronous}")
+        # Negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size = -{int(settings.SQLITE_CACHE_SIZE_KB)}")
+        cursor.execute(f"PRAGMA mmap_size = {int(settings.SQLITE_MMAP_SIZE)}")
+
+
+@contextmanager
+def write_transaction(using=None):
+    """
+    transaction.atomic() that takes SQLite's write lock up front.
+
+    A deferred transaction that reads and then writes can't wait for the lock
+    and fails with "database is locked"; BEGIN IMMEDIATE waits for it under the
+    busy timeout instead. Nested blocks and other databases use plain atomic().
+    Defaults to the current clinic's database.
+    """
+    from .routers import current_tenant_database
+    using = using or current_tenant_database()
+    connection = connections[using]
+    immediate = (
+        connection.vendor == 'sqlite'
+        and settings.SQLITE_IMMEDIATE_TRANSACTIONS
+        and not connection.in_atomic_block
+    )
+    if immediate:
+        # Django 5.0 always issues a plain BEGIN, so swap it for this block only
+        connection._start_transaction_under_autocommit = (
+            lambda: connection.cursor().execute("BEGIN IMMEDIATE")
+        )
+    try:
+        with transaction.atomic(using=using):
+            connection.__dict__.pop('_start_transaction_under_autocommit', None)
+            yield
+    finally:
+        connection.__dict__.pop('_start_transaction_under_autocommit', None)
@@ -0,0 +1,173 @@
+"""
+Provider directory for the booking page.
+Typeahead search over a clinic's active providers with specialty and price
+filters and keyset pagination. Pages are cached in a shared cache under a
+per-database version that every provider save or delete moves on.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Provider
+from .routers import current_tenant_database
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+SPECIALTY_LABELS = dict(Provider.SPECIALTY_CHOICES)
+
+
+class DirectoryQueryError(ValueError):
+    """A provider directory request parameter is invalid."""
+
+
+def _cache():
+    return caches[settings.PROVIDER_DIRECTORY_CACHE_ALIAS]
+
+
+def _version_key(using):
+    return f'provider_directory:version:{using}'
+
+
+def _fresh_version():
+    # Time-based, so a version lost from the cache never reuses an old number
+    return time.time_ns() // 1000
+
+
+def directory_version(using):
+    """Current cache version for the directory pages of one database."""
+    cache = _cache()
+    version = cache.get(_version_key(using))
+    if version is None:
+        cache.add(_version_key(using), _fresh_version(), None)
+        version = cache.get(_version_key(using))
+    return version
+
+
+@receiver([post_save, post_delete], sender=Provider)
+def provider_changed(sender, using, **kwargs):
+    """Retire every cached directory page for the provider's database."""
+    cache = _cache()
+    try:
+        cache.incr(_version_key(using))
+    except ValueError:
+        cache.set(_version_key(using), _fresh_version(), None)
+
+
+def encode_cursor(name, pk):
+    return base64.urlsafe_b64encode(json.dumps([name, pk]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """Parse an opaque (name, pk) keyset cursor."""
+    try:
+        name, pk = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+        return str(name), int(pk)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise DirectoryQueryError('Invalid cursor')
+
+
+def _parse_price(params, name):
+    raw = params.get(name)
+    if not raw:
+        return None
+    try:
+        price = Decimal(raw)
+    except InvalidOperation:
+        raise DirectoryQueryError(f'Invalid {name}: {raw}')
+    if not price.is_finite() or price < 0:
+        raise DirectoryQueryError(f'Invalid {name}: {raw}')
+    return price
+
+
+def parse_query(params):
+    """Validate and normalize directory request parameters (a QueryDict or dict)."""
+    specialty = params.get('specialty', '')
+    if specialty and specialty not in SPECIALTY_LABELS:
+        raise DirectoryQueryError(f'Unknown specialty: {specialty}')
+    appointment_type = params.get('type', 'consultation')
+    if appointment_type not in Provider.PRICE_FIELDS:
+        raise DirectoryQueryError('Unknown appointment type')
+    try:
+        limit = int(params.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise DirectoryQueryError('Invalid limit')
+    after = params.get('after', '')
+    return {
+        'q': ' '.join(params.get('q', '').split()).lower(),
+        'specialty': specialty,
+        'type': appointment_type,
+        'min_price': _parse_price(params, 'min_price'),
+        'max_price': _parse_price(params, 'max_price'),
+        'after': decode_cursor(after) if after else None,
+        'limit': min(max(limit, 1), MAX_PAGE_SIZE),
+    }
+
+
+def cache_key(clinic, query):
+    """Cache key (and ETag) for one directory page; changes with the directory version."""
+    using = current_tenant_database()
+    digest = hashlib.sha256(json.dumps(query, sort_keys=True, default=str).encode()).hexdigest()[:32]
+    return f'provider_directory:{using}:{directory_version(using)}:{clinic.pk}:{digest}'
+
+
+def search_providers(clinic, query):
+    """Run one directory query; returns the page payload."""
+    providers = Provider.objects.filter(clinic=clinic, is_active=True)
+    if query['q']:
+        # Prefix match on the name or any word in it ("smi" finds "Dr. Jane Smith")
+        providers = providers.filter(Q(name__istartswith=query['q']) | Q(name__icontains=f" {query['q']}"))
+    if query['specialty']:
+        providers = providers.filter(specialty=query['specialty'])
+    price_field = Provider.PRICE_FIELDS[query['type']]
+    if query['min_price'] is not None:
+        providers = providers.filter(**{f'{price_field}__gte': query['min_price']})
+    if query['max_price'] is not None:
+        providers = providers.filter(**{f'{price_field}__lte': query['max_price']})
+    if query['after']:
+        name, pk = query['after']
+        providers = providers.filter(Q(name__gt=name) | Q(name=name, pk__gt=pk))
+
+    limit = query['limit']
+    # One extra row tells whether there is a next page
+    rows = list(
+        providers.order_by('name', 'pk')
+        .values('id', 'name', 'specialty', 'consultation_price', 'follow_up_price')[:limit + 1]
+    )
+    last = rows[limit - 1] if len(rows) > limit else None
+    return {
+        'results': [
+            {
+                'id': row['id'],
+                'name': row['name'],
+                'specialty': row['specialty'],
+                'specialty_display': SPECIALTY_LABELS.get(row['specialty'], row['specialty']),
+                'consultation': float(row['consultation_price']),
+                'follow_up': float(row['follow_up_price']),
+            }
+            for row in rows[:limit]
+        ],
+        'next': encode_cursor(last['name'], last['id']) if last else None,
+    }
+
+
+def directory_page(clinic, params):
+    """Return a directory page for the request parameters, from the cache when possible."""
+    query = parse_query(params)
+    key = cache_key(clinic, query)
+    cache = _cache()
+    page = cache.get(key)
+    if page is None:
+        page = search_providers(clinic, query)
+        cache.set(key, page, settings.PROVIDER_DIRECTORY_CACHE_SECONDS)
+    return page
@@ -3,20 +3,29 @@ Email utilities for appointment notifications.
 Handles confirmation, reminder, and provider notification emails.
 """
 
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 import logging
 
+from .instrumentation import timed
+
 logger = logging.getLogger(__name__)
 
 
+def provider_display_name(appointment):
+    """The provider's name, falling back to the legacy free-text name on old bookings."""
+    if appointment.provider_id:
+        return appointment.provider.name
+    return appointment.provider_name
+
+
 def send_appointment_confirmation(appointment):
     """Send confirmation email to patient after successful booking."""
     try:
-        subject = f"Appointment Confirmed - {appointment.provider_name}"
+        subject = f"Appointment Confirmed - {provider_display_name(appointment)}"
         
         context = {
             'appointment': appointment,
@@ -34,14 +43,15 @@ def send_appointment_confirmation(appointment):
             context
         )
         
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[appointment.client_email],
-            html_message=html_message,
-            fail_silently=False,
-        )
+        with timed('smtp'):
+            send_mail(
+                subject=subject,
+                message=plain_message,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipient_list=[appointment.client_email],
+                html_message=html_message,
+                fail_silently=False,
+            )
         
         logger.info(f"Confirmation email sent to {appointment.client_email}")
         return True
@@ -54,7 +64,7 @@ def send_appointment_confirmation(appointment):
 def send_appointment_reminder(appointment):
     """Send reminder email 24 hours before appointment."""
     try:
-        subject = f"Appointment Reminder - {appointment.provider_name} Tomorrow"
+        subject = f"Appointment Reminder - {provider_display_name(appointment)} Tomorrow"
         
         context = {
             'appointment': appointment,
@@ -72,14 +82,15 @@ def send_appointment_reminder(appointment):
             context
         )
         
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[appointment.client_email],
-            html_message=html_message,
-            fail_silently=False,
-        )
+        with timed('smtp'):
+            send_mail(
+                subject=subject,
+                message=plain_message,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipient_list=[appointment.client_email],
+                html_message=html_message,
+                fail_silently=False,
+            )
         
         logger.info(f"Reminder email sent to {appointment.client_email}")
         return True
@@ -113,14 +124,15 @@ def send_provider_notification(appointment):
             context
         )
         
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[provider_email],
-            html_message=html_message,
-            fail_silently=False,
-        )
+        with timed('smtp'):
+            send_mail(
+                subject=subject,
+                message=plain_message,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipient_list=[provider_email],
+                html_message=html_message,
+                fail_silently=False,
+            )
         
         logger.info(f"Provider notification sent to {provider_email}")
         return True
@@ -141,7 +153,7 @@ def schedule_appointment_reminder(appointment):
 def send_appointment_cancellation(appointment, reason=None):
     """Send cancellation notification with optional reason."""
     try:
-        subject = f"Appointment Cancelled - {appointment.provider_name}"
+        subject = f"Appointment Cancelled - {provider_display_name(appointment)}"
         
         context = {
             'appointment': appointment,
@@ -160,14 +172,15 @@ def send_appointment_cancellation(appointment, reason=None):
             context
         )
         
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[appointment.client_email],
-            html_message=html_message,
-            fail_silently=False,
-        )
+        with timed('smtp'):
+            send_mail(
+                subject=subject,
+                message=plain_message,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipient_list=[appointment.client_email],
+                html_message=html_message,
+                fail_silently=False,
+            )
         
         logger.info(f"Cancellation email sent to {appointment.client_email}")
         return True
@@ -175,3 +188,52 @@ def send_appointment_cancellation(appointment, reason=None):
     except Exception as e:
         logger.error(f"Failed to send cancellation email: {str(e)}")
         return False
+
+
+def build_patient_email(appointment, subject, template_name, **extra_context):
+    """Render a patient email (HTML + plain text) without sending it."""
+    context = {
+        'appointment': appointment,
+        'site_url': 'http://127.0.0.1:8000',
+        'contact_email': 'support@sofiahealth.com',
+        **extra_context,
+    }
+    
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body=render_to_string(f'appointments/emails/{template_name}.txt', context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[appointment.client_email],
+    )
+    message.attach_alternative(
+        render_to_string(f'appointments/emails/{template_name}.html', context),
+        'text/html'
+    )
+    return message
+
+
+def send_bulk_patient_emails(appointments, subject_prefix, template_name, context_for=None, **extra_context):
+    """
+    Send one email per appointment over a single SMTP connection; return ids sent.
+    
+    context_for(appointment), if given, returns context specific to each email.
+    """
+    sent_ids = []
+    with get_connection() as connection:
+        for appointment in appointments:
+            try:
+                message = build_patient_email(
+                    appointment,
+                    f"{subject_prefix} - {provider_display_name(appointment)}",
+                    template_name,
+                    **extra_context,
+                    **(context_for(appointment) if context_for else {}),
+                )
+                with timed('smtp'):
+                    connection.send_messages([message])
+                sent_ids.append(appointment.id)
+            except Exception as e:
+                logger.error(f"Failed to send {template_name} email for appointment {appointment.id}: {str(e)}")
+    
+    logger.info(f"Sent {len(sent_ids)} {template_name} email(s)")
+    return sent_ids
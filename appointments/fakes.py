@@ -0,0 +1,91 @@
+"""
+Offline fakes for external services.
+Local stand-ins for Stripe, Google Calendar and SMTP used by the benchmark
+and load-test commands, so they run without network access or real keys.
+"""
+
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import stripe
+from django.test import override_settings
+
+from .instrumentation import timed
+
+
+def make_stub_handler(latency):
+    """Stripe API stub: answers every request with a PaymentIntent after latency seconds."""
+
+    class StripeStubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def respond(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            time.sleep(latency)
+            intent_id = self.path.rstrip('/').rsplit('/', 1)[-1]
+            body = json.dumps({
+                'id': intent_id if intent_id.startswith('pi_') else 'pi_stub',
+                'object': 'payment_intent',
+                'amount': 5000,
+                'currency': 'usd',
+                # Creating an intent starts it; retrieving it at confirmation finds it paid
+                'status': 'succeeded' if self.command == 'GET' else 'requires_payment_method',
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = respond
+        do_POST = respond
+
+        def log_message(self, *args):
+            pass
+
+    return StripeStubHandler
+
+
+@contextmanager
+def fake_stripe(latency=0):
+    """Point the Stripe SDK at a local stub server for the duration of the block."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_stub_handler(latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    original_api_base, original_api_key = stripe.api_base, stripe.api_key
+    stripe.api_base = f'http://127.0.0.1:{server.server_port}'
+    stripe.api_key = 'sk_test_fake'
+    try:
+        yield server
+    finally:
+        stripe.api_base, stripe.api_key = original_api_base, original_api_key
+        server.shutdown()
+        server.server_close()
+
+
+@contextmanager
+def fake_google_calendar(latency=0):
+    """Give every patient stored credentials and answer Calendar API calls in process."""
+    event_ids = itertools.count(1)
+
+    @timed('calendar')
+    def create_event(appointment, credentials=None):
+        time.sleep(latency)
+        return True, f'fake-event-{next(event_ids)}'
+
+    with mock.patch('appointments.views.get_calendar_credentials', return_value={'token': 'fake'}), \
+            mock.patch('appointments.views.create_calendar_event', side_effect=create_event):
+        yield
+
+
+@contextmanager
+def fake_smtp():
+    """Deliver email to Django's in-memory outbox instead of an SMTP server."""
+    with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+        yield
@@ -0,0 +1,40 @@
+"""
+Custom model fields for appointments.
+Provides transparent at-rest encryption for sensitive integration secrets.
+"""
+
+import base64
+import hashlib
+
+from cryptography.fernet import Fernet, InvalidToken
+from django.conf import settings
+from django.db import models
+
+
+def get_fernet():
+    """Build Fernet cipher from CREDENTIAL_ENCRYPTION_KEY (or derived from SECRET_KEY)."""
+    key = getattr(settings, 'CREDENTIAL_ENCRYPTION_KEY', '')
+    if not key:
+        # Derive a stable 32-byte key so development works without extra config
+        digest = hashlib.sha256(settings.SECRET_KEY.encode()).digest()
+        key = base64.urlsafe_b64encode(digest)
+    return Fernet(key)
+
+
+class EncryptedTextField(models.TextField):
+    """TextField that encrypts values before writing and decrypts on load."""
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or value == '':
+            return value
+        try:
+            return get_fernet().decrypt(value.encode()).decode()
+        except InvalidToken:
+            # Key rotated or value written before encryption - treat as unusable
+            return None
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None or value == '':
+            return value
+        return get_fernet().encrypt(value.encode()).decode()
@@ -6,7 +6,32 @@ Handles provider selection, time validation, and form rendering.
 from django import forms
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from .models import Appointment, Provider
+from .models import Appointment, AppointmentSeries, Provider, WaitlistEntry
+
+
+class ProviderLookupSelect(forms.Select):
+    """
+    Provider select that renders only the chosen provider.
+    
+    The booking page fills in the rest from the provider directory API as the
+    patient searches, so the page no longer grows with the provider count.
+    """
+    
+    def optgroups(self, name, value, attrs=None):
+        options = [self.create_option(name, '', self.choices.field.empty_label or '', not any(value), 0)]
+        selected = [v for v in value if str(v).isdigit()]
+        providers = self.choices.queryset.filter(pk__in=selected) if selected else []
+        for index, provider in enumerate(providers, start=1):
+            option = self.create_option(name, provider.pk, str(provider), True, index)
+            # Lets the page show the provider's prices without another request
+            option['attrs'].update({
+                'data-name': provider.name,
+                'data-specialty': provider.get_specialty_display(),
+                'data-consultation': provider.consultation_price,
+                'data-follow-up': provider.follow_up_price,
+            })
+            options.append(option)
+        return [(None, [option], index) for index, option in enumerate(options)]
 
 
 class AppointmentForm(forms.ModelForm):
@@ -16,7 +41,7 @@ class AppointmentForm(forms.ModelForm):
         model = Appointment
         fields = ['provider', 'appointment_time', 'client_email', 'appointment_type', 'notes']
         widgets = {
-            'provider': forms.Select(attrs={
+            'provider': ProviderLookupSelect(attrs={
                 'class': 'form-control',
                 'id': 'id_provider',
             }),
@@ -46,10 +71,13 @@ class AppointmentForm(forms.ModelForm):
             'notes': 'Notes (Optional)',
         }
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, clinic=None, **kwargs):
         super().__init__(*args, **kwargs)
-        # Only show active providers
-        self.fields['provider'].queryset = Provider.objects.filter(is_active=True)
+        # Only show active providers, from the booking clinic when given
+        providers = Provider.objects.filter(is_active=True)
+        if clinic is not None:
+            providers = providers.filter(clinic=clinic)
+        self.fields['provider'].queryset = providers
         
         # Add help text
         self.fields['provider'].help_text = 'Select your healthcare provider'
@@ -81,3 +109,165 @@ class AppointmentForm(forms.ModelForm):
             )
         
         return cleaned_data
+
+
+class SeriesForm(forms.ModelForm):
+    """Form for booking a weekly or fortnightly series of appointments."""
+    
+    class Meta:
+        model = AppointmentSeries
+        fields = ['provider', 'first_appointment_time', 'interval_weeks', 'occurrences',
+                  'client_email', 'appointment_type', 'notes']
+        widgets = {
+            'provider': ProviderLookupSelect(attrs={
+                'class': 'form-control',
+                'id': 'id_provider',
+            }),
+            'first_appointment_time': forms.DateTimeInput(attrs={
+                'class': 'form-control',
+                'type': 'datetime-local',
+            }),
+            'interval_weeks': forms.Select(attrs={'class': 'form-control'}),
+            'occurrences': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'min': 2,
+                'max': AppointmentSeries.MAX_OCCURRENCES,
+            }),
+            'client_email': forms.EmailInput(attrs={
+                'class': 'form-control',
+                'placeholder': 'patient@example.com',
+            }),
+            'appointment_type': forms.Select(attrs={'class': 'form-control'}),
+            'notes': forms.Textarea(attrs={
+                'class': 'form-control',
+                'rows': 3,
+                'placeholder': 'Reason for visit or any notes...',
+            }),
+        }
+        labels = {
+            'provider': 'Select Healthcare Provider',
+            'first_appointment_time': 'First Session Date & Time',
+            'interval_weeks': 'Repeat',
+            'occurrences': 'Number of Sessions',
+            'client_email': 'Your Email Address',
+            'appointment_type': 'Appointment Type',
+            'notes': 'Notes (Optional)',
+        }
+    
+    def __init__(self, *args, clinic=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        providers = Provider.objects.filter(is_active=True)
+        if clinic is not None:
+            providers = providers.filter(clinic=clinic)
+        self.fields['provider'].queryset = providers
+        self.instance.clinic = clinic
+    
+    def clean_first_appointment_time(self):
+        """
+        Validate that the series starts in the future.
+        """
+        first_appointment_time = self.cleaned_data.get('first_appointment_time')
+        
+        if first_appointment_time and first_appointment_time <= timezone.now():
+            raise ValidationError(
+                "The first session must be in the future. Please select a valid date and time."
+            )
+        
+        return first_appointment_time
+
+
+class WaitlistForm(forms.ModelForm):
+    """Form for joining the waitlist for a provider or specialty."""
+    
+    class Meta:
+        model = WaitlistEntry
+        fields = ['provider', 'specialty', 'appointment_type', 'client_email', 'window_start', 'window_end']
+        widgets = {
+            'provider': ProviderLookupSelect(attrs={
+                'class': 'form-control',
+                'id': 'id_provider',
+            }),
+            'specialty': forms.Select(attrs={'class': 'form-control'}),
+            'appointment_type': forms.Select(attrs={'class': 'form-control'}),
+            'client_email': forms.EmailInput(attrs={
+                'class': 'form-control',
+                'placeholder': 'patient@example.com',
+            }),
+            'window_start': forms.DateTimeInput(attrs={
+                'class': 'form-control',
+                'type': 'datetime-local',
+            }),
+            'window_end': forms.DateTimeInput(attrs={
+                'class': 'form-control',
+                'type': 'datetime-local',
+            }),
+        }
+        labels = {
+            'provider': 'Healthcare Provider (Optional)',
+            'specialty': 'Or Any Provider Of',
+            'appointment_type': 'Appointment Type',
+            'client_email': 'Your Email Address',
+            'window_start': 'Earliest Date & Time',
+            'window_end': 'Latest Date & Time',
+        }
+    
+    def __init__(self, *args, clinic=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        providers = Provider.objects.filter(is_active=True)
+        if clinic is not None:
+            providers = providers.filter(clinic=clinic)
+        self.fields['provider'].queryset = providers
+        self.instance.clinic = clinic
+    
+    def clean_window_end(self):
+        """
+        Validate that the window has not already passed.
+        """
+        window_end = self.cleaned_data.get('window_end')
+        
+        if window_end and window_end <= timezone.now():
+            raise ValidationError("The latest time must be in the future.")
+        
+        return window_end
+
+
+class ProviderAdminForm(forms.ModelForm):
+    """Admin form for providers with an opt-in repricing step."""
+    
+    reprice_pending = forms.BooleanField(
+        required=False,
+        label='Reprice pending appointments',
+        help_text='Apply changed prices to future unpaid appointments and cancel their outdated payment intents',
+    )
+    
+    class Meta:
+        model = Provider
+        fields = '__all__'
+
+
+class CancelScheduleForm(forms.Form):
+    """Admin form for the time range of a provider's schedule to cancel."""
+    
+    start = forms.DateTimeField(
+        widget=forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+        help_text='First appointment time to cancel',
+    )
+    end = forms.DateTimeField(
+        widget=forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+        help_text='Appointments from this time on are kept',
+    )
+    reason = forms.CharField(
+        required=False,
+        max_length=200,
+        help_text='Shown to patients in the cancellation email',
+    )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        start = cleaned_data.get('start')
+        end = cleaned_data.get('end')
+        
+        if start and end and start >= end:
+            raise ValidationError("The end must be after the start.")
+        
+        return cleaned_data
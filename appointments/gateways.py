@@ -0,0 +1,63 @@
+"""
+Lazy gateways to the third-party integration SDKs.
+Stripe and the Google client libraries add a large share of worker and
+management command startup time. Modules import them through these proxies,
+so each SDK loads on its first real use rather than at import time.
+"""
+
+import importlib
+import sys
+import threading
+
+from django.conf import settings
+
+
+class LazyModule:
+    """Stand-in for a module that imports it, and runs an optional setup hook, on first attribute access."""
+
+    def __init__(self, name, setup=None):
+        self._name = name
+        self._setup = setup
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    module = importlib.import_module(self._name)
+                    if self._setup:
+                        self._setup(module)
+                    self._module = module
+        return self._module
+
+    @property
+    def loaded(self):
+        """Whether the SDK has been imported in this process (through any route)."""
+        return self._module is not None or self._name in sys.modules
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f'<LazyModule {self._name!r} ({state})>'
+
+
+def _configure_stripe(module):
+    # Keep a key already set by tests or local stubs
+    if not module.api_key:
+        module.api_key = settings.STRIPE_SECRET_KEY
+
+
+stripe = LazyModule('stripe', setup=_configure_stripe)
+
+google_auth_requests = LazyModule('google.auth.transport.requests')
+google_credentials = LazyModule('google.oauth2.credentials')
+google_id_token = LazyModule('google.oauth2.id_token')
+google_flow = LazyModule('google_auth_oauthlib.flow')
+google_discovery = LazyModule('googleapiclient.discovery')
+google_errors = LazyModule('googleapiclient.errors')
+
+# Modules the gateways keep out of startup, checked by the startup benchmark
+LAZY_SDK_MODULES = ('stripe', 'google.oauth2', 'google_auth_oauthlib', 'googleapiclient')
@@ -0,0 +1,187 @@
+"""
+Per-request performance instrumentation.
+Accumulates time spent in the database, templates and external services
+(Stripe, Google Calendar, SMTP) for the current request, and aggregates
+per-view latency histograms (and admission-control shed counts) for the
+Prometheus metrics endpoint.
+
+Metrics live in process memory, so each worker process reports its own.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+
+# Request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Server-Timing metric names, in header order
+CATEGORIES = ('db', 'template', 'stripe', 'calendar', 'smtp')
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Time and call counts per category for one request."""
+
+    def __init__(self):
+        self.durations = dict.fromkeys(CATEGORIES, 0.0)
+        self.counts = dict.fromkeys(CATEGORIES, 0)
+        self.active = set()
+
+    def add(self, category, duration):
+        self.durations[category] += duration
+        self.counts[category] += 1
+
+    def server_timing(self, total):
+        """Format the Server-Timing header value (durations in milliseconds)."""
+        parts = [
+            f'{category};dur={self.durations[category] * 1000:.1f};desc="{self.counts[category]} call(s)"'
+            for category in CATEGORIES
+            if self.counts[category]
+        ]
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+
+@contextmanager
+def request_timings():
+    """Collect timings for the code inside the block (one request)."""
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(category):
+    """Add the block's wall time to the current request; usable as a decorator on sync functions."""
+    timings = _current.get()
+    # Outside a request, or nested inside the same category: nothing to add
+    if timings is None or category in timings.active:
+        yield
+        return
+    timings.active.add(category)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.active.discard(category)
+        timings.add(category, time.perf_counter() - started)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper timing every query against the current request."""
+    with timed('db'):
+        return execute(sql, params, many, context)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created handler: time queries on every new connection."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return super().render(context, request)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Django template backend that times each top-level template render."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class MetricsRegistry:
+    """Per-view request latency histograms and per-dependency totals."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # (view, method) -> ([count per bucket..., +Inf count], sum of seconds)
+        self.histograms = {}
+        # (view, category) -> (seconds, calls)
+        self.dependencies = {}
+        # (view, reason) -> requests rejected by admission control
+        self.shed_requests = {}
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.dependencies.clear()
+            self.shed_requests.clear()
+
+    def shed(self, view, reason):
+        with self.lock:
+            self.shed_requests[(view, reason)] = self.shed_requests.get((view, reason), 0) + 1
+
+    def observe(self, view, method, duration, timings):
+        with self.lock:
+            counts, total = self.histograms.get((view, method), ([0] * (len(self.buckets) + 1), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self.histograms[(view, method)] = (counts, total + duration)
+            for category in CATEGORIES:
+                if timings.counts[category]:
+                    seconds, calls = self.dependencies.get((view, category), (0.0, 0))
+                    self.dependencies[(view, category)] = (
+                        seconds + timings.durations[category],
+                        calls + timings.counts[category],
+                    )
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = [
+            '# HELP sofia_request_duration_seconds Request latency by view.',
+            '# TYPE sofia_request_duration_seconds histogram',
+        ]
+        with self.lock:
+            for (view, method), (counts, total) in sorted(self.histograms.items()):
+                labels = f'view="{_escape(view)}",method="{method}"'
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f'sofia_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'sofia_request_duration_seconds_bucket{{{labels},le="+Inf"}} {counts[-1]}')
+                lines.append(f'sofia_request_duration_seconds_sum{{{labels}}} {total:.6f}')
+                lines.append(f'sofia_request_duration_seconds_count{{{labels}}} {counts[-1]}')
+
+            lines.append('# HELP sofia_dependency_seconds_total Time spent in each dependency by view.')
+            lines.append('# TYPE sofia_dependency_seconds_total counter')
+            for (view, category), (seconds, _) in sorted(self.dependencies.items()):
+                lines.append(
+                    f'sofia_dependency_seconds_total{{view="{_escape(view)}",dependency="{category}"}} {seconds:.6f}'
+                )
+            lines.append('# HELP sofia_dependency_calls_total Calls (or queries) to each dependency by view.')
+            lines.append('# TYPE sofia_dependency_calls_total counter')
+            for (view, category), (_, calls) in sorted(self.dependencies.items()):
+                lines.append(
+                    f'sofia_dependency_calls_total{{view="{_escape(view)}",dependency="{category}"}} {calls}'
+                )
+            lines.append('# HELP sofia_requests_shed_total Requests rejected by admission control.')
+            lines.append('# TYPE sofia_requests_shed_total counter')
+            for (view, reason), count in sorted(self.shed_requests.items()):
+                lines.append(f'sofia_requests_shed_total{{view="{_escape(view)}",reason="{reason}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = MetricsRegistry()
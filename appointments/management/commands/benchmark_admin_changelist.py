@@ -0,0 +1,113 @@
+"""
+Appointment changelist benchmark.
+Seeds a large appointment table and times the admin changelist with the
+legacy configuration (exact counts, no select_related) and the current one.
+"""
+
+import time
+from datetime import timedelta
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from appointments.admin import AppointmentAdmin
+from appointments.models import Appointment, Provider
+from appointments.pagination import CURSOR_VAR
+from appointments.tenants import default_clinic
+
+BENCHMARK_PROVIDER_PREFIX = 'Benchmark Provider'
+
+
+class LegacyAppointmentAdmin(AppointmentAdmin):
+    """Changelist configuration before the large-table optimizations."""
+    list_select_related = False
+    paginator = Paginator
+    show_full_result_count = True
+    date_hierarchy = 'appointment_time'
+
+    def get_changelist(self, request, **kwargs):
+        return admin.ModelAdmin.get_changelist(self, request, **kwargs)
+
+    def get_search_results(self, request, queryset, search_term):
+        return admin.ModelAdmin.get_search_results(self, request, queryset, search_term)
+
+
+class Command(BaseCommand):
+    help = "Seed appointments and benchmark the admin changelist (legacy vs optimized)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2_000_000, help="Appointments to seed")
+        parser.add_argument('--providers', type=int, default=200, help="Providers to spread rows over")
+        parser.add_argument('--batch-size', type=int, default=5_000, help="bulk_create batch size")
+        parser.add_argument('--keep', action='store_true', help="Keep seeded rows afterwards")
+
+    def handle(self, *args, **options):
+        providers = self.seed(options['rows'], options['providers'], options['batch_size'])
+        try:
+            request_user = get_user_model()(username='benchmark', is_staff=True, is_superuser=True, is_active=True)
+            deep_page = max(options['rows'] // AppointmentAdmin.list_per_page - 1, 1)
+
+            for label, admin_class in [('legacy', LegacyAppointmentAdmin), ('optimized', AppointmentAdmin)]:
+                model_admin = admin_class(Appointment, admin.site)
+                self.stdout.write(self.style.MIGRATE_HEADING(f"{label} changelist"))
+                self.run_case(model_admin, request_user, 'first page', {})
+                self.run_case(model_admin, request_user, 'filtered (paid)', {'is_paid__exact': '1'})
+                self.run_case(model_admin, request_user, 'search (email)', {'q': 'patient4242@'})
+                self.run_case(model_admin, request_user, f'deep page (p={deep_page})', {'p': str(deep_page)})
+
+            # Keyset seek to the same depth as the deep OFFSET page
+            model_admin = AppointmentAdmin(Appointment, admin.site)
+            boundary = Appointment.objects.order_by('-appointment_time', '-id').values_list(
+                'appointment_time', 'id'
+            )[deep_page * AppointmentAdmin.list_per_page - 1]
+            cursor = f'{boundary[0].isoformat()}_{boundary[1]}'
+            self.run_case(model_admin, request_user, 'deep page (keyset cursor)', {CURSOR_VAR: cursor})
+        finally:
+            if not options['keep']:
+                self.cleanup(providers)
+
+    def seed(self, rows, provider_count, batch_size):
+        """Bulk insert benchmark providers and appointments."""
+        self.stdout.write(f"Seeding {rows:,} appointments across {provider_count} providers...")
+        started = time.perf_counter()
+        clinic = default_clinic()
+        providers = Provider.objects.bulk_create([
+            Provider(clinic=clinic, name=f'{BENCHMARK_PROVIDER_PREFIX} {i}') for i in range(provider_count)
+        ])
+        now = timezone.now()
+        for start in range(0, rows, batch_size):
+            with transaction.atomic():
+                Appointment.objects.bulk_create([
+                    Appointment(
+                        clinic=clinic,
+                        provider=providers[i % provider_count],
+                        appointment_time=now + timedelta(minutes=(i * 37) % (720 * 24 * 60) - 360 * 24 * 60),
+                        client_email=f'patient{i}@benchmark.invalid',
+                        is_paid=i % 3 != 0,
+                    )
+                    for i in range(start, min(start + batch_size, rows))
+                ])
+        self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+        return providers
+
+    def run_case(self, model_admin, user, label, params):
+        """Render one changelist request and report timing and query count."""
+        request = RequestFactory().get('/admin/appointments/appointment/', params)
+        request.user = user
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = model_admin.changelist_view(request)
+            response.render()
+            elapsed = time.perf_counter() - started
+        self.stdout.write(f"  {label:<32} {elapsed * 1000:9.1f} ms  {len(context.captured_queries):3d} queries")
+
+    def cleanup(self, providers):
+        """Remove the seeded rows."""
+        Appointment.objects.filter(provider__in=providers).delete()
+        Provider.objects.filter(pk__in=[p.pk for p in providers]).delete()
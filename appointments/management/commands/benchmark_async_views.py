@@ -0,0 +1,114 @@
+"""
+Payment page concurrency benchmark.
+Serves the payment page against a local Stripe stub with artificial latency,
+once through a fixed pool of WSGI worker threads and once through a single
+ASGI event loop, and reports throughput and latency for each.
+"""
+
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.urls import reverse
+from django.utils import timezone
+
+from appointments.fakes import fake_stripe
+from appointments.models import Appointment, Provider
+
+BENCHMARK_PROVIDER_NAME = 'Benchmark Stripe Provider'
+
+
+class Command(BaseCommand):
+    help = "Benchmark payment page concurrency under WSGI worker threads vs one ASGI event loop"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Payment page requests per deployment")
+        parser.add_argument('--wsgi-workers', type=int, default=8, help="WSGI worker threads")
+        parser.add_argument('--concurrency', type=int, default=200, help="In-flight ASGI requests")
+        parser.add_argument('--latency-ms', type=int, default=200, help="Stripe stub response delay")
+
+    def handle(self, *args, **options):
+        # The test clients send Host: testserver, as under the test runner
+        original_allowed_hosts = settings.ALLOWED_HOSTS
+        settings.ALLOWED_HOSTS = [*original_allowed_hosts, 'testserver']
+        # All requests come from one client IP; measure the views, not the limiter
+        original_admission = settings.ADMISSION_CONTROL_ENABLED
+        settings.ADMISSION_CONTROL_ENABLED = False
+
+        provider = Provider.objects.create(name=BENCHMARK_PROVIDER_NAME)
+        try:
+            Appointment.objects.bulk_create([
+                Appointment(
+                    clinic_id=provider.clinic_id,
+                    provider=provider,
+                    appointment_time=timezone.now() + timedelta(days=1, minutes=i),
+                    client_email=f'async{i}@benchmark.invalid',
+                    stripe_payment_intent_id=f'pi_bench{i}',
+                )
+                for i in range(options['requests'])
+            ])
+            urls = [
+                reverse('appointment_payment', args=[pk])
+                for pk in Appointment.objects.filter(provider=provider).values_list('pk', flat=True)
+            ]
+            self.stdout.write(
+                f"{len(urls)} payment page requests, Stripe stub latency {options['latency_ms']} ms"
+            )
+            with fake_stripe(options['latency_ms'] / 1000):
+                self.report(
+                    f"wsgi ({options['wsgi_workers']} threads)", *self.run_wsgi(urls, options['wsgi_workers'])
+                )
+                self.report(f"asgi (1 loop, {options['concurrency']} in flight)", *asyncio.run(
+                    self.run_asgi(urls, options['concurrency'])
+                ))
+        finally:
+            Appointment.objects.filter(provider=provider).delete()
+            provider.delete()
+            settings.ALLOWED_HOSTS = original_allowed_hosts
+            settings.ADMISSION_CONTROL_ENABLED = original_admission
+
+    def run_wsgi(self, urls, workers):
+        """Each thread serves one request at a time, like a sync worker."""
+        def fetch(url):
+            started = time.perf_counter()
+            response = Client().get(url)
+            return self.succeeded(response), time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(workers) as pool:
+            results = list(pool.map(fetch, urls))
+        return results, time.perf_counter() - started
+
+    async def run_asgi(self, urls, concurrency):
+        """All requests share one event loop, bounded by a semaphore."""
+        semaphore = asyncio.Semaphore(concurrency)
+        client = AsyncClient()
+
+        async def fetch(url):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(url)
+                return self.succeeded(response), time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(fetch(url) for url in urls))
+        return results, time.perf_counter() - started
+
+    def succeeded(self, response):
+        # Stripe failures still render the page, with the error shown
+        return response.status_code == 200 and b'<strong>Error:</strong>' not in response.content
+
+    def report(self, label, results, elapsed):
+        latencies = sorted(latency for _, latency in results)
+        errors = sum(1 for ok, _ in results if not ok)
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+        self.stdout.write(
+            f"  {label:<30} {len(results) / elapsed:8.1f} req/s  "
+            f"p50 {statistics.median(latencies) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  "
+            f"{errors} errors"
+        )
@@ -0,0 +1,92 @@
+"""
+Booking flow session query benchmark.
+Walks the booking flow (create, pay, confirm, success, calendar connect and
+callback, repeat visits) with the plain database session engine and with
+cached_db, and reports per-request query counts, separating session-table
+queries.
+"""
+
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from appointments.fakes import fake_smtp, fake_stripe
+from appointments.models import Appointment, Provider
+
+ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+}
+
+REPEAT_VISITS = 3
+
+
+class Command(BaseCommand):
+    help = "Count per-request DB queries for the booking flow with db vs cached_db sessions"
+
+    def handle(self, *args, **options):
+        provider = Provider.objects.create(name='Benchmark Session Provider')
+        try:
+            with fake_stripe(), fake_smtp(), override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                GOOGLE_CALENDAR_CLIENT_ID=settings.GOOGLE_CALENDAR_CLIENT_ID or 'benchmark-client-id',
+            ):
+                results = {label: self.run_flow(engine, provider) for label, engine in ENGINES.items()}
+        finally:
+            Appointment.objects.filter(provider=provider).delete()
+            provider.delete()
+
+        self.stdout.write(f"{'step':<28}" + ''.join(f"{label:>22}" for label in ENGINES))
+        for step in results['db']:
+            cells = ''.join(
+                f"{results[label][step][0]:>12} ({results[label][step][1]} sess)"
+                for label in ENGINES
+            )
+            self.stdout.write(f"{step:<28}{cells}")
+        for label in ENGINES:
+            total = sum(queries for queries, _ in results[label].values())
+            session = sum(session for _, session in results[label].values())
+            self.stdout.write(f"{label}: {total} queries in total, {session} on the session table")
+
+    def run_flow(self, engine, provider):
+        """Run the booking flow with one session engine; return {step: (queries, session queries)}."""
+        counts = {}
+        with override_settings(SESSION_ENGINE=engine):
+            client = Client()
+
+            def request(step, method, url, data=None):
+                with CaptureQueriesContext(connection) as context:
+                    response = getattr(client, method)(url, data or {})
+                queries = context.captured_queries
+                counts[step] = (len(queries), sum('django_session' in q['sql'] for q in queries))
+                return response
+
+            request('create (GET)', 'get', reverse('create_appointment'))
+            response = request('create (POST)', 'post', reverse('create_appointment'), {
+                'provider': provider.pk,
+                'appointment_time': (timezone.localtime() + timedelta(days=3)).strftime('%Y-%m-%dT%H:%M'),
+                'client_email': 'session-benchmark@benchmark.invalid',
+                'appointment_type': 'consultation',
+            })
+            appointment_id = int(response.url.rstrip('/').split('/')[-2])
+            request('payment', 'get', reverse('appointment_payment', args=[appointment_id]))
+            request('confirm payment', 'post', reverse('confirm_payment', args=[appointment_id]))
+            request('success', 'get', reverse('appointment_success', args=[appointment_id]))
+            request('calendar connect', 'get', reverse('calendar_connect', args=[appointment_id]))
+            request('calendar connect (retry)', 'get', reverse('calendar_connect', args=[appointment_id]))
+            # Stand in for Google's token endpoint; the session handling is what's measured
+            with mock.patch(
+                'appointments.views.handle_google_calendar_callback',
+                return_value=(False, 'stubbed token exchange'),
+            ):
+                request('calendar callback', 'get', reverse('calendar_callback'), {'state': 'benchmark'})
+            for visit in range(1, REPEAT_VISITS + 1):
+                request(f'success (revisit {visit})', 'get', reverse('appointment_success', args=[appointment_id]))
+        return counts
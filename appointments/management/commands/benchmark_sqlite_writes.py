@@ -0,0 +1,108 @@
+"""
+Concurrent booking write benchmark.
+Runs several worker processes booking appointments against a scratch SQLite
+file, first with Django's stock SQLite settings and then with the tuned
+pragmas and immediate transactions, and reports bookings/sec and lock errors.
+"""
+
+import multiprocessing
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+from django.utils import timezone
+
+from appointments.db import write_transaction
+from appointments.models import Appointment, PriceRule, Provider
+
+# Settings for each run; 'stock' matches Django's defaults before tuning
+MODES = {
+    'stock': {'SQLITE_TUNING': False, 'SQLITE_IMMEDIATE_TRANSACTIONS': False},
+    'tuned': {'SQLITE_TUNING': True, 'SQLITE_IMMEDIATE_TRANSACTIONS': True},
+}
+
+
+def book(worker, bookings, provider_id, use_write_transaction):
+    """Worker process: check a slot and book it, like the booking view does."""
+    atomic = write_transaction if use_write_transaction else transaction.atomic
+    provider = Provider.objects.get(pk=provider_id)
+    start = timezone.now() + timedelta(days=1)
+    booked = errors = 0
+    for i in range(bookings):
+        slot = start + timedelta(minutes=worker * bookings + i)
+        try:
+            with atomic():
+                if not Appointment.objects.filter(provider=provider, appointment_time=slot).exists():
+                    Appointment.objects.create(
+                        provider=provider,
+                        appointment_time=slot,
+                        client_email=f'bench{worker}-{i}@benchmark.invalid',
+                    )
+            booked += 1
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            errors += 1
+    connection.close()
+    return booked, errors
+
+
+def _run_worker(args):
+    return book(*args)
+
+
+class Command(BaseCommand):
+    help = "Benchmark concurrent booking writes on SQLite with stock and tuned settings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8, help="Concurrent writer processes")
+        parser.add_argument('--bookings', type=int, default=200, help="Bookings per process")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stderr.write("This benchmark only applies to SQLite databases")
+            return
+
+        original_name = connection.settings_dict['NAME']
+        original_settings = {name: getattr(settings, name) for name in MODES['tuned']}
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            try:
+                for mode, overrides in MODES.items():
+                    path = os.path.join(scratch_dir, f'{mode}.sqlite3')
+                    self.run_mode(mode, overrides, path, options['processes'], options['bookings'])
+            finally:
+                connections.close_all()
+                connection.settings_dict['NAME'] = original_name
+                for name, value in original_settings.items():
+                    setattr(settings, name, value)
+
+    def run_mode(self, mode, overrides, path, processes, bookings):
+        """Create a scratch database, run the workers against it and report."""
+        connections.close_all()
+        connection.settings_dict['NAME'] = path
+        for name, value in overrides.items():
+            setattr(settings, name, value)
+
+        with connection.schema_editor() as editor:
+            for model in (Provider, Appointment, PriceRule):
+                editor.create_model(model)
+        provider = Provider.objects.create(name='Benchmark Provider')
+        # Workers are forked and must not share the parent's connection
+        connections.close_all()
+
+        jobs = [(worker, bookings, provider.pk, overrides['SQLITE_IMMEDIATE_TRANSACTIONS']) for worker in range(processes)]
+        started = time.perf_counter()
+        with multiprocessing.get_context('fork').Pool(processes) as pool:
+            results = pool.map(_run_worker, jobs)
+        elapsed = time.perf_counter() - started
+
+        booked = sum(result[0] for result in results)
+        errors = sum(result[1] for result in results)
+        self.stdout.write(
+            f"{mode:<6} {booked:6d} bookings in {elapsed:6.2f}s  "
+            f"{booked / elapsed:8.1f} bookings/sec  {errors:5d} lock errors"
+        )
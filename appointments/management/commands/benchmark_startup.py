@@ -0,0 +1,111 @@
+"""
+Startup import-time benchmark.
+Boots a WSGI worker (settings, app registry, URLconf) and runs a manage.py
+command in fresh interpreters under `python -X importtime`, and reports wall
+time, total import time, the slowest top-level packages and whether any of
+the lazily loaded integration SDKs were imported.
+"""
+
+import json
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.gateways import LAZY_SDK_MODULES
+
+# What a worker process does before serving its first request
+WORKER_BOOT = (
+    "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sofia_health.settings'); "
+    "from sofia_health.wsgi import application; "
+    "from django.urls import get_resolver; get_resolver().url_patterns"
+)
+
+# "import time: self [us] | cumulative | imported package"
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def parse_importtime(stderr):
+    """Return (total import seconds, {top-level package: seconds}, set of imported modules)."""
+    packages = defaultdict(int)
+    modules = set()
+    total = 0
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        modules.add(name)
+        packages[name.split('.')[0]] += int(self_us)
+        # Each outermost import's cumulative time covers everything nested in it
+        if len(indent) == 1:
+            total += int(cumulative_us)
+    return total / 1e6, {name: us / 1e6 for name, us in packages.items()}, modules
+
+
+class Command(BaseCommand):
+    help = "Measure worker cold-start and manage.py command startup with python -X importtime"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters per scenario")
+        parser.add_argument('--command', default='check', help="manage.py command to time")
+        parser.add_argument('--top', type=int, default=10, help="Slowest packages to list")
+        parser.add_argument('--output', help="Write results as JSON to this file")
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError("--runs must be positive")
+        scenarios = {
+            'worker boot': [sys.executable, '-X', 'importtime', '-c', WORKER_BOOT],
+            f"manage.py {options['command']}": [
+                sys.executable, '-X', 'importtime', 'manage.py', *options['command'].split(),
+            ],
+        }
+        results = {name: self.measure(argv, options['runs']) for name, argv in scenarios.items()}
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name}: {result['wall_s'] * 1000:.0f} ms wall, "
+                f"{result['import_s'] * 1000:.0f} ms importing (median of {options['runs']})"
+            )
+            sdks = ', '.join(result['sdk_modules']) or 'none'
+            self.stdout.write(f"  integration SDKs imported: {sdks}")
+            for package, seconds in list(result['packages'].items())[:options['top']]:
+                self.stdout.write(f"  {package:<30}{seconds * 1000:8.1f} ms")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def measure(self, argv, runs):
+        walls, imports, packages = [], [], defaultdict(list)
+        modules = set()
+        for _ in range(runs):
+            started = time.perf_counter()
+            process = subprocess.run(argv, capture_output=True, text=True, cwd=settings.BASE_DIR)
+            walls.append(time.perf_counter() - started)
+            if process.returncode:
+                raise CommandError(f"{' '.join(argv[3:])} failed:\n{process.stderr[-2000:]}")
+            total, by_package, modules = parse_importtime(process.stderr)
+            imports.append(total)
+            for package, seconds in by_package.items():
+                packages[package].append(seconds)
+        medians = {package: statistics.median(values) for package, values in packages.items()}
+        return {
+            'wall_s': round(statistics.median(walls), 4),
+            'import_s': round(statistics.median(imports), 4),
+            'sdk_modules': sorted(
+                sdk for sdk in LAZY_SDK_MODULES
+                if any(module == sdk or module.startswith(f'{sdk}.') for module in modules)
+            ),
+            'packages': {
+                package: round(seconds, 4)
+                for package, seconds in sorted(medians.items(), key=lambda item: item[1], reverse=True)
+            },
+        }
@@ -0,0 +1,73 @@
+"""
+Cancel a provider's schedule.
+Cancels every pending or confirmed appointment a provider has in a time range
+(e.g. a sick day) with one UPDATE and queues the patient emails, calendar
+deletions, refunds and waitlist offers in batches.
+"""
+
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from appointments.cancellation import cancel_appointments, provider_schedule
+from appointments.models import Appointment, Provider
+from appointments.routers import tenant_database
+from appointments.tenants import get_directory
+
+
+def _parse_moment(value):
+    """A date (its midnight) or a datetime, in the current time zone."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Not a date or datetime: {value}")
+        moment = datetime.combine(day, time.min)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+class Command(BaseCommand):
+    help = "Cancel all of a provider's appointments in a time range and notify and refund the patients"
+
+    def add_arguments(self, parser):
+        parser.add_argument('provider_id', type=int, help="Provider whose schedule to cancel")
+        parser.add_argument('--start', required=True, help="First day (YYYY-MM-DD) or time to cancel")
+        parser.add_argument('--end', help="Keep appointments from this day or time on (default: one day after --start)")
+        parser.add_argument('--reason', help="Shown to patients in the cancellation email")
+        parser.add_argument('--clinic', help="Slug of the clinic the provider belongs to, for clinics on their own database")
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many appointments would be cancelled")
+
+    def handle(self, *args, **options):
+        start = _parse_moment(options['start'])
+        end = _parse_moment(options['end']) if options['end'] else start + timedelta(days=1)
+        if start >= end:
+            raise CommandError("--end must be after --start")
+
+        using = DEFAULT_DB_ALIAS
+        if options['clinic']:
+            clinic = get_directory().by_slug.get(options['clinic'])
+            if clinic is None:
+                raise CommandError(f"Unknown clinic: {options['clinic']}")
+            using = clinic.database
+
+        with tenant_database(using):
+            try:
+                provider = Provider.objects.get(pk=options['provider_id'])
+            except Provider.DoesNotExist:
+                raise CommandError(f"Provider {options['provider_id']} does not exist")
+
+            schedule = provider_schedule([provider.pk], start, end)
+            if options['dry_run']:
+                count = schedule.can_transition_to(Appointment.STATUS_CANCELLED).count()
+                self.stdout.write(f"{count} appointment(s) with {provider.name} would be cancelled")
+                return
+
+            cancelled = cancel_appointments(schedule, reason=options['reason'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Cancelled {cancelled} appointment(s) with {provider.name} "
+            f"between {start:%Y-%m-%d %H:%M} and {end:%Y-%m-%d %H:%M}"
+        ))
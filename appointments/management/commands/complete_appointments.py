@@ -0,0 +1,16 @@
+"""
+Complete past appointments.
+Cron-friendly wrapper around the periodic confirmed -> completed sweep.
+"""
+
+from django.core.management.base import BaseCommand
+
+from appointments.tasks import complete_past_appointments
+
+
+class Command(BaseCommand):
+    help = "Mark confirmed appointments that have ended as completed"
+
+    def handle(self, *args, **options):
+        completed = complete_past_appointments()
+        self.stdout.write(self.style.SUCCESS(f"Marked {completed} appointment(s) as completed"))
@@ -0,0 +1,213 @@
+"""
+Booking funnel load test.
+Runs many simulated patients concurrently through the real booking URLs
+(create, payment, confirm, success, calendar, ICS download) against offline
+fakes for Stripe, Google Calendar and SMTP, and reports throughput and
+p50/p95/p99 latency per step. Results can be written as JSON and compared
+with an earlier run.
+"""
+
+import json
+import subprocess
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from appointments.calendar_utils import CALENDAR_ACCOUNT_SESSION_KEY
+from appointments.fakes import fake_google_calendar, fake_smtp, fake_stripe
+from appointments.models import Appointment, Provider
+
+LOADTEST_PROVIDER_NAME = 'Load Test Provider'
+
+# Funnel steps, in the order each patient runs them
+STEPS = ('create_form', 'create', 'payment', 'confirm', 'success', 'calendar', 'ics')
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Load test the booking funnel with concurrent simulated patients and offline fakes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=100, help="Simulated patients to run")
+        parser.add_argument('--concurrency', type=int, default=10, help="Patients in flight at once")
+        parser.add_argument('--stripe-latency-ms', type=int, default=50, help="Fake Stripe response delay")
+        parser.add_argument('--calendar-latency-ms', type=int, default=50, help="Fake Google Calendar delay")
+        parser.add_argument('--output', help="Write results as JSON to this file")
+        parser.add_argument('--compare', help="JSON results of an earlier run to compare against")
+
+    def handle(self, *args, **options):
+        if options['patients'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--patients and --concurrency must be positive")
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        provider = Provider.objects.create(name=LOADTEST_PROVIDER_NAME)
+        emails = [f'loadtest{i}@loadtest.invalid' for i in range(options['patients'])]
+        try:
+            with fake_stripe(options['stripe_latency_ms'] / 1000), \
+                    fake_google_calendar(options['calendar_latency_ms'] / 1000), \
+                    fake_smtp(), \
+                    override_settings(
+                        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                        # Every simulated patient shares one client IP
+                        ADMISSION_CONTROL_ENABLED=False,
+                    ):
+                started = time.perf_counter()
+                with ThreadPoolExecutor(options['concurrency']) as pool:
+                    runs = list(pool.map(lambda email: self.run_patient(provider, email), emails))
+                elapsed = time.perf_counter() - started
+        finally:
+            Appointment.objects.filter(provider=provider).delete()
+            provider.delete()
+
+        results = self.summarize(runs, elapsed, options)
+        self.report(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def run_patient(self, provider, email):
+        """Walk one patient through the funnel; return [(step, ok, seconds)], stopping at the first failure."""
+        client = Client()
+        timings = []
+
+        # A returning patient already signed in to their Google account in this browser
+        session = client.session
+        session[CALENDAR_ACCOUNT_SESSION_KEY] = email
+        session.save()
+
+        def step(name, method, url, expect, data=None):
+            started = time.perf_counter()
+            try:
+                response = getattr(client, method)(url, data or {})
+                ok = expect(response)
+            except Exception:
+                response, ok = None, False
+            timings.append((name, ok, time.perf_counter() - started))
+            return response if ok else None
+
+        def redirects_to(name):
+            return lambda response: response.status_code == 302 and f'/{name}/' in response.url
+
+        try:
+            if not step('create_form', 'get', reverse('create_appointment'), lambda r: r.status_code == 200):
+                return timings
+            response = step('create', 'post', reverse('create_appointment'), redirects_to('payment'), {
+                'provider': provider.pk,
+                'appointment_time': (timezone.localtime() + timedelta(days=7)).strftime('%Y-%m-%dT%H:%M'),
+                'client_email': email,
+                'appointment_type': 'consultation',
+            })
+            if not response:
+                return timings
+            appointment_id = int(response.url.rstrip('/').split('/')[-2])
+            for name, method, url_name, expect in (
+                # Stripe failures still render the payment page, with the error shown
+                ('payment', 'get', 'appointment_payment',
+                 lambda r: r.status_code == 200 and b'<strong>Error:</strong>' not in r.content),
+                ('confirm', 'post', 'confirm_payment', redirects_to('success')),
+                ('success', 'get', 'appointment_success', lambda r: r.status_code == 200),
+                ('calendar', 'get', 'calendar_connect', redirects_to('success')),
+                ('ics', 'get', 'download_calendar_file',
+                 lambda r: r.status_code == 200 and r['Content-Type'].startswith('text/calendar')),
+            ):
+                if not step(name, method, reverse(url_name, args=[appointment_id]), expect):
+                    break
+            return timings
+        finally:
+            connections.close_all()
+
+    def summarize(self, runs, elapsed, options):
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        for timings in runs:
+            for name, ok, seconds in timings:
+                if ok:
+                    latencies[name].append(seconds)
+                else:
+                    errors[name] += 1
+
+        steps = {}
+        for name in STEPS:
+            values = sorted(latencies[name])
+            steps[name] = {
+                'requests': len(values) + errors[name],
+                'errors': errors[name],
+                'throughput_rps': round(len(values) / elapsed, 2),
+                'mean_ms': round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p95_ms': round(percentile(values, 95) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+            }
+        completed = sum(1 for timings in runs if len(timings) == len(STEPS) and all(ok for _, ok, _ in timings))
+        return {
+            'commit': current_commit(),
+            'timestamp': timezone.now().isoformat(),
+            'config': {
+                key: options[key]
+                for key in ('patients', 'concurrency', 'stripe_latency_ms', 'calendar_latency_ms')
+            },
+            'database': settings.DATABASES['default']['ENGINE'],
+            'elapsed_s': round(elapsed, 3),
+            'completed_patients': completed,
+            'patients_per_second': round(completed / elapsed, 2),
+            'steps': steps,
+        }
+
+    def report(self, results, baseline):
+        config = results['config']
+        self.stdout.write(
+            f"{config['patients']} patients, {config['concurrency']} concurrent, "
+            f"Stripe {config['stripe_latency_ms']} ms, Calendar {config['calendar_latency_ms']} ms"
+        )
+        self.stdout.write(
+            f"{'step':<12}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+            + (f"{'p95 vs base':>14}" if baseline else '')
+        )
+        for name, stats in results['steps'].items():
+            line = (
+                f"{name:<12}{stats['throughput_rps']:>9.1f}{stats['p50_ms']:>10.1f}"
+                f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['errors']:>8}"
+            )
+            base = baseline['steps'].get(name) if baseline else None
+            if base and base['p95_ms']:
+                line += f"{(stats['p95_ms'] - base['p95_ms']) / base['p95_ms'] * 100:>+13.1f}%"
+            self.stdout.write(line)
+        summary = (
+            f"{results['completed_patients']}/{config['patients']} patients completed in "
+            f"{results['elapsed_s']:.1f} s ({results['patients_per_second']:.1f} patients/s)"
+        )
+        if baseline:
+            summary += (
+                f"; baseline {baseline['patients_per_second']:.1f} patients/s"
+                f" at {baseline.get('commit') or 'unknown commit'}"
+            )
+        self.stdout.write(summary)
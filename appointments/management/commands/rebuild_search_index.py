@@ -0,0 +1,26 @@
+"""
+Rebuild the appointment full-text search index.
+Useful after restoring a backup or bulk-loading rows with triggers disabled.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from appointments.search import get_tokenizer, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Repopulate the appointment search index from the appointment table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help="Database alias to rebuild")
+        parser.add_argument('--chunk-size', type=int, default=50_000, help="Rows indexed per statement")
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if not get_tokenizer(alias):
+            raise CommandError(f"No search index on database '{alias}' (SQLite with FTS5 only)")
+
+        with transaction.atomic(using=alias):
+            max_id = rebuild_search_index(connections[alias], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt up to appointment #{max_id}"))
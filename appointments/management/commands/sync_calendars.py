@@ -0,0 +1,47 @@
+"""
+Incremental Google Calendar sync.
+Pulls patient-side event moves/deletions back into appointments on every
+clinic database.
+"""
+
+from django.core.management.base import BaseCommand
+
+from appointments.calendar_utils import sync_calendar_changes
+from appointments.models import Appointment, CalendarCredential
+from appointments.tenants import clinic_databases
+
+
+class Command(BaseCommand):
+    help = "Pull changed Google Calendar events for stored credentials and apply them to appointments"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--email',
+            help="Only sync the credential for this patient email",
+        )
+
+    def handle(self, *args, **options):
+        credentials = CalendarCredential.objects.all()
+        if options['email']:
+            credentials = credentials.filter(client_email=options['email'])
+        else:
+            # Only patients with at least one synced event, at any clinic, have anything to pull
+            synced_emails = set()
+            for using in clinic_databases():
+                synced_emails.update(
+                    Appointment.objects.using(using).filter(calendar_synced=True)
+                    .values_list('client_email', flat=True).distinct()
+                )
+            credentials = credentials.filter(client_email__in=synced_emails)
+
+        synced = failed = 0
+        for credential in credentials.iterator():
+            success, result = sync_calendar_changes(credential)
+            if success:
+                synced += 1
+                self.stdout.write(f"{credential.client_email}: {result['moved']} moved, {result['deleted']} deleted")
+            else:
+                failed += 1
+                self.stderr.write(f"{credential.client_email}: {result}")
+
+        self.stdout.write(self.style.SUCCESS(f"Synced {synced} calendar(s), {failed} failed"))
@@ -0,0 +1,343 @@
+"""
+Request middleware for the appointments app.
+Times each request for Server-Timing and the metrics endpoint, compresses
+responses, resolves the request's clinic and its database, sheds excess
+booking traffic, keeps replica routing state per request and pins a session
+to the primary database for a short while after it writes.
+"""
+
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.http.request import split_domain_port
+from django.middleware.gzip import GZipMiddleware
+from django.urls import Resolver404, get_script_prefix, resolve, set_script_prefix
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+from .admission import ConcurrencyLimiter, Rejection, SlidingWindowLimiter
+from .instrumentation import metrics, request_timings
+from .routers import replica_configured, routing_state, tenant_database
+from .tenants import directory_loaded, get_directory, resolve_clinic
+
+# Session key holding the time of the session's last database write
+LAST_WRITE_SESSION_KEY = '_db_last_write'
+
+# Brotli level for on-the-fly compression: near level 11 ratios at a fraction of the CPU
+BROTLI_QUALITY = 5
+
+# Read-only pages that carry no CSRF token or reflected input, so Brotli can't
+# leak secrets through compressed length (BREACH). Everything else takes the
+# gzip path, whose random padding (max_random_bytes) masks the length.
+BROTLI_URL_NAMES = frozenset({'appointment_success', 'download_calendar_file', 'stripe_status'})
+
+re_accepts_brotli = re.compile(r'\bbr\b')
+
+
+class InstrumentationMiddleware:
+    """Add a Server-Timing header and record per-view latency for Prometheus."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with request_timings() as timings:
+            response = self.get_response(request)
+        return self.finish(request, response, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with request_timings() as timings:
+            response = await self.get_response(request)
+        return self.finish(request, response, timings, time.perf_counter() - started)
+
+    def finish(self, request, response, timings, duration):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        metrics.observe(view, request.method, duration, timings)
+        response['Server-Timing'] = timings.server_timing(duration)
+        return response
+
+
+def _iterate_for_tenant(iterator, alias):
+    # Streaming runs after the middleware has finished, so re-enter the clinic's database
+    with tenant_database(alias):
+        yield from iterator
+
+
+async def _aiterate_for_tenant(iterator, alias):
+    with tenant_database(alias):
+        async for chunk in iterator:
+            yield chunk
+
+
+class TenantMiddleware:
+    """
+    Set request.clinic from a /c/<slug>/ URL prefix or the hostname and route
+    the request's clinic-scoped queries to the clinic's database.
+
+    A matched prefix moves from path_info to SCRIPT_NAME, so URL resolution is
+    unchanged and reverse() keeps generating links under the prefix.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        script_prefix = self.resolve(request)
+        try:
+            with tenant_database(request.clinic.database):
+                response = self.get_response(request)
+        finally:
+            set_script_prefix(script_prefix)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        # Only the first request in a process (or after a clinic change) queries
+        if not directory_loaded():
+            await sync_to_async(get_directory)()
+        script_prefix = self.resolve(request)
+        try:
+            with tenant_database(request.clinic.database):
+                response = await self.get_response(request)
+        finally:
+            set_script_prefix(script_prefix)
+        return self.finish(request, response)
+
+    def resolve(self, request):
+        """Set request.clinic; return the script prefix to restore afterwards."""
+        script_prefix = get_script_prefix()
+        host, _ = split_domain_port(request.get_host())
+        request.clinic, prefix = resolve_clinic(host, request.path_info)
+        if prefix:
+            request.path_info = request.path_info[len(prefix):]
+            script_name = request.META.get('SCRIPT_NAME', '').rstrip('/') + prefix
+            request.META['SCRIPT_NAME'] = script_name
+            set_script_prefix(script_name)
+        return script_prefix
+
+    def finish(self, request, response):
+        if response.streaming:
+            alias = request.clinic.database
+            if response.is_async:
+                response.streaming_content = _aiterate_for_tenant(response.streaming_content, alias)
+            else:
+                response.streaming_content = _iterate_for_tenant(response.streaming_content, alias)
+        return response
+
+
+class AdmissionControlMiddleware:
+    """
+    Shed excess traffic to ADMISSION_SHED_VIEWS with fast 429/503 responses.
+
+    Per-client limits answer 429 and global limits 503, both with Retry-After.
+    ADMISSION_PRIORITY_VIEWS (payment confirmation) are always admitted but
+    still occupy a concurrency slot, so booking traffic is shed first.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.ADMISSION_CONTROL_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.concurrency = ConcurrencyLimiter()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        lane = self.lane(request)
+        if lane is None:
+            return self.get_response(request)
+        client = self.client_ip(request)
+        rejection = self.acquire(client, lane)
+        if rejection is None and lane == 'shed':
+            client_limiter, global_limiter = self.rate_limiters()
+            client_wait = client_limiter.hit(f'client:{client}')
+            # A client already over its own rate doesn't use up the global budget
+            global_wait = global_limiter.hit('global') if client_wait is None else None
+            rejection = self.rate_rejection(client_wait, global_wait)
+            if rejection:
+                self.concurrency.release(client)
+        if rejection:
+            return self.reject(request, rejection)
+        try:
+            return self.get_response(request)
+        finally:
+            self.concurrency.release(client)
+
+    async def __acall__(self, request):
+        lane = self.lane(request)
+        if lane is None:
+            return await self.get_response(request)
+        client = self.client_ip(request)
+        rejection = self.acquire(client, lane)
+        if rejection is None and lane == 'shed':
+            client_limiter, global_limiter = self.rate_limiters()
+            client_wait = await client_limiter.ahit(f'client:{client}')
+            global_wait = await global_limiter.ahit('global') if client_wait is None else None
+            rejection = self.rate_rejection(client_wait, global_wait)
+            if rejection:
+                self.concurrency.release(client)
+        if rejection:
+            return self.reject(request, rejection)
+        try:
+            return await self.get_response(request)
+        finally:
+            self.concurrency.release(client)
+
+    def lane(self, request):
+        """'shed', 'priority' or None (not admission controlled) for the requested view."""
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        # Lets the instrumentation attribute shed responses to their view
+        request.resolver_match = match
+        if match.view_name in settings.ADMISSION_PRIORITY_VIEWS:
+            return 'priority'
+        if match.view_name in settings.ADMISSION_SHED_VIEWS:
+            return 'shed'
+        return None
+
+    def client_ip(self, request):
+        return request.META.get(settings.ADMISSION_CLIENT_IP_HEADER, '') or request.META.get('REMOTE_ADDR', '')
+
+    def acquire(self, client, lane):
+        full = self.concurrency.acquire(
+            client,
+            settings.ADMISSION_GLOBAL_CONCURRENCY,
+            settings.ADMISSION_CLIENT_CONCURRENCY,
+            force=lane == 'priority',
+        )
+        if full == 'client':
+            return Rejection(429, 'client_concurrency', settings.ADMISSION_RETRY_AFTER)
+        if full == 'global':
+            return Rejection(503, 'global_concurrency', settings.ADMISSION_RETRY_AFTER)
+        return None
+
+    def rate_limiters(self):
+        window = settings.ADMISSION_WINDOW_SECONDS
+        return (
+            SlidingWindowLimiter(settings.ADMISSION_CACHE_ALIAS, settings.ADMISSION_CLIENT_RATE, window),
+            SlidingWindowLimiter(settings.ADMISSION_CACHE_ALIAS, settings.ADMISSION_GLOBAL_RATE, window),
+        )
+
+    def rate_rejection(self, client_wait, global_wait):
+        if client_wait is not None:
+            return Rejection(429, 'client_rate', client_wait)
+        if global_wait is not None:
+            return Rejection(503, 'global_rate', global_wait)
+        return None
+
+    def reject(self, request, rejection):
+        metrics.shed(request.resolver_match.view_name, rejection.reason)
+        message = 'Too many requests' if rejection.status == 429 else 'Service busy'
+        response = HttpResponse(
+            f'{message}, please retry in {rejection.retry_after} seconds.\n',
+            status=rejection.status,
+            content_type='text/plain; charset=utf-8',
+        )
+        response['Retry-After'] = str(rejection.retry_after)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """GZipMiddleware that prefers Brotli for buffered read-only pages when the client accepts it."""
+
+    def process_response(self, request, response):
+        resolver_match = getattr(request, 'resolver_match', None)
+        if (
+            brotli is None
+            or resolver_match is None
+            or resolver_match.url_name not in BROTLI_URL_NAMES
+            or response.streaming
+            or response.has_header('Content-Encoding')
+            or len(response.content) < 200
+            or not re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed_content = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response.headers['Content-Length'] = str(len(compressed_content))
+        # Same weak-ETag rule as gzip: the bytes changed, the representation didn't
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+
+class ReplicaStickinessMiddleware:
+    """Route a session's reads to the primary for REPLICA_STICKY_SECONDS after it writes."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        session = self.get_session(request)
+        pinned = self.is_pinned(session)
+
+        with routing_state(pinned=pinned) as state:
+            response = self.get_response(request)
+
+        self.record_write(session, state.wrote)
+        return response
+
+    async def __acall__(self, request):
+        session = self.get_session(request)
+        # Loading the session hits the database, so only leave the event loop when needed
+        pinned = await sync_to_async(self.is_pinned)(session) if session is not None else False
+
+        with routing_state(pinned=pinned) as state:
+            response = await self.get_response(request)
+
+        self.record_write(session, state.wrote)
+        return response
+
+    def get_session(self, request):
+        # Without a replica everything reads the primary; skip the session lookups
+        return getattr(request, 'session', None) if replica_configured() else None
+
+    def is_pinned(self, session):
+        if session is None:
+            return False
+        return time.time() - session.get(LAST_WRITE_SESSION_KEY, 0) < settings.REPLICA_STICKY_SECONDS
+
+    def record_write(self, session, wrote):
+        if wrote and session is not None:
+            session[LAST_WRITE_SESSION_KEY] = time.time()
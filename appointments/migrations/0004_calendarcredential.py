@@ -0,0 +1,76 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:03
+
+import appointments.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0003_provider_alter_appointment_provider_name_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CalendarCredential",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "client_email",
+                    models.EmailField(
+                        help_text="Patient email these credentials belong to",
+                        max_length=254,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "token",
+                    appointments.fields.EncryptedTextField(
+                        blank=True, help_text="Encrypted OAuth access token", null=True
+                    ),
+                ),
+                (
+                    "refresh_token",
+                    appointments.fields.EncryptedTextField(
+                        blank=True, help_text="Encrypted OAuth refresh token", null=True
+                    ),
+                ),
+                (
+                    "token_uri",
+                    models.CharField(
+                        default="https://oauth2.googleapis.com/token",
+                        help_text="OAuth token endpoint",
+                        max_length=255,
+                    ),
+                ),
+                (
+                    "scopes",
+                    models.TextField(
+                        blank=True, help_text="Space-separated granted OAuth scopes"
+                    ),
+                ),
+                (
+                    "expiry",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="When the current access token expires",
+                        null=True,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Calendar Credential",
+                "verbose_name_plural": "Calendar Credentials",
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0004_calendarcredential"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="calendarcredential",
+            name="last_synced_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="When calendar changes were last pulled from Google",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="calendarcredential",
+            name="sync_token",
+            field=models.CharField(
+                blank=True,
+                help_text="Google nextSyncToken for incremental event sync",
+                max_length=255,
+            ),
+        ),
+    ]
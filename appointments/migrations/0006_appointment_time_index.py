@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0005_calendarcredential_sync_token"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["-appointment_time", "-id"], name="appt_time_id_desc_idx"
+            ),
+        ),
+    ]
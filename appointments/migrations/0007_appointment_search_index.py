@@ -0,0 +1,62 @@
+# Full-text search index for admin/support lookups (SQLite only)
+#
+# The DDL is frozen here rather than imported from appointments.search, so
+# later changes to the live search module can't change what this migration
+# does. The sync triggers are installed after every migrate (see apps.py).
+
+from django.db import migrations
+
+SEARCH_TABLE = 'appointments_search'
+
+# Trigram tokenizer gives substring matches; needs SQLite 3.34+
+TRIGRAM_MIN_SQLITE_VERSION = (3, 34, 0)
+
+POPULATE_SQL = f"""
+    INSERT INTO {SEARCH_TABLE}(rowid, client_email, provider_name, payment_intent_id, notes)
+    SELECT a.id, a.client_email, COALESCE(p.name, a.provider_name, ''),
+           COALESCE(a.stripe_payment_intent_id, ''), a.notes
+    FROM appointments_appointment a
+    LEFT JOIN appointments_provider p ON p.id = a.provider_id
+"""
+
+TRIGGER_NAMES = ['ai', 'au', 'ad', 'provider_au']
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_version()")
+        version = tuple(int(part) for part in cursor.fetchone()[0].split('.'))
+        if version >= TRIGRAM_MIN_SQLITE_VERSION:
+            tokenize = "tokenize='trigram'"
+        else:
+            tokenize = "tokenize='unicode61', prefix='2 3 4'"
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            f"client_email, provider_name, payment_intent_id, notes, {tokenize})"
+        )
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(POPULATE_SQL)
+
+
+def drop_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGER_NAMES:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_{name}")
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0006_appointment_time_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
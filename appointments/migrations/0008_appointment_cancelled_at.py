@@ -0,0 +1,20 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0007_appointment_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="appointment",
+            name="cancelled_at",
+            field=models.DateTimeField(
+                blank=True, help_text="When the appointment was cancelled", null=True
+            ),
+        ),
+    ]
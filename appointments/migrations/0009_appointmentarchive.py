@@ -0,0 +1,69 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0008_appointment_cancelled_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AppointmentArchive",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                (
+                    "provider_name",
+                    models.CharField(blank=True, max_length=200, null=True),
+                ),
+                ("appointment_time", models.DateTimeField()),
+                ("client_email", models.EmailField(db_index=True, max_length=254)),
+                ("is_paid", models.BooleanField(default=False)),
+                ("amount_paid", models.DecimalField(decimal_places=2, max_digits=10)),
+                (
+                    "stripe_payment_intent_id",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                (
+                    "google_calendar_event_id",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("calendar_synced", models.BooleanField(default=False)),
+                ("confirmation_sent", models.BooleanField(default=False)),
+                ("reminder_sent", models.BooleanField(default=False)),
+                ("cancelled_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "appointment_type",
+                    models.CharField(
+                        choices=[
+                            ("consultation", "Consultation"),
+                            ("follow_up", "Follow-up"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("notes", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField()),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "provider",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="archived_appointments",
+                        to="appointments.provider",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Archived Appointment",
+                "verbose_name_plural": "Archived Appointments",
+                "ordering": ["-appointment_time"],
+            },
+        ),
+    ]
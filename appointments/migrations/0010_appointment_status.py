@@ -0,0 +1,72 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:17
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# Rows backfilled per UPDATE so large tables aren't locked in one statement
+BATCH_SIZE = 10_000
+
+
+def populate_status(apps, schema_editor):
+    """Derive status from is_paid/cancelled_at/appointment_time in pk-range batches."""
+    now = timezone.now()
+    for model_name in ["Appointment", "AppointmentArchive"]:
+        model = apps.get_model("appointments", model_name)
+        max_pk = model.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+        for start in range(0, max_pk, BATCH_SIZE):
+            batch = model.objects.filter(pk__gt=start, pk__lte=start + BATCH_SIZE)
+            batch.filter(cancelled_at__isnull=False).update(status="cancelled")
+            paid = batch.filter(cancelled_at__isnull=True, is_paid=True)
+            paid.filter(appointment_time__lt=now).update(status="completed")
+            paid.filter(appointment_time__gte=now).update(status="confirmed")
+            batch.filter(cancelled_at__isnull=True, is_paid=False).update(
+                status="pending_payment"
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0009_appointmentarchive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="appointment",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending_payment", "Pending Payment"),
+                    ("confirmed", "Confirmed"),
+                    ("completed", "Completed"),
+                    ("cancelled", "Cancelled"),
+                    ("no_show", "No-show"),
+                ],
+                default="pending_payment",
+                help_text="Current appointment status",
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="appointmentarchive",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending_payment", "Pending Payment"),
+                    ("confirmed", "Confirmed"),
+                    ("completed", "Completed"),
+                    ("cancelled", "Cancelled"),
+                    ("no_show", "No-show"),
+                ],
+                default="completed",
+                max_length=20,
+            ),
+        ),
+        migrations.RunPython(populate_status, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["status", "appointment_time"], name="appt_status_time_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0010_appointment_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PriceRule",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "appointment_type",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("consultation", "Consultation"),
+                            ("follow_up", "Follow-up"),
+                        ],
+                        help_text="Leave blank to apply to all appointment types",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "start_time",
+                    models.TimeField(
+                        blank=True,
+                        help_text="Time of day the rule starts applying (inclusive)",
+                        null=True,
+                    ),
+                ),
+                (
+                    "end_time",
+                    models.TimeField(
+                        blank=True,
+                        help_text="Time of day the rule stops applying (exclusive)",
+                        null=True,
+                    ),
+                ),
+                (
+                    "valid_from",
+                    models.DateField(
+                        blank=True, help_text="First date the rule applies", null=True
+                    ),
+                ),
+                (
+                    "valid_until",
+                    models.DateField(
+                        blank=True, help_text="Last date the rule applies", null=True
+                    ),
+                ),
+                (
+                    "price",
+                    models.DecimalField(
+                        decimal_places=2,
+                        help_text="Price charged when this rule matches",
+                        max_digits=10,
+                    ),
+                ),
+                (
+                    "priority",
+                    models.IntegerField(
+                        default=0,
+                        help_text="Higher priority rules win when several match",
+                    ),
+                ),
+                ("is_active", models.BooleanField(default=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "provider",
+                    models.ForeignKey(
+                        help_text="Provider this rule applies to",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="price_rules",
+                        to="appointments.provider",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Price Rule",
+                "verbose_name_plural": "Price Rules",
+                "ordering": ["provider", "-priority"],
+            },
+        ),
+    ]
@@ -0,0 +1,118 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:51
+
+import django.db.models.deletion
+from django.db import DEFAULT_DB_ALIAS, migrations, models
+
+
+def assign_default_clinic(apps, schema_editor):
+    """Put every existing provider and appointment in a 'default' clinic."""
+    # Clinics live on the default database; tenant databases start out empty
+    if schema_editor.connection.alias != DEFAULT_DB_ALIAS:
+        return
+    Clinic = apps.get_model("appointments", "Clinic")
+    clinic, _ = Clinic.objects.get_or_create(
+        slug="default", defaults={"name": "Default clinic"}
+    )
+    for model_name in ["Provider", "Appointment", "AppointmentArchive"]:
+        model = apps.get_model("appointments", model_name)
+        model.objects.filter(clinic__isnull=True).update(clinic=clinic)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0011_pricerule"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Clinic",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(help_text="Clinic name", max_length=200)),
+                (
+                    "slug",
+                    models.SlugField(help_text="Used in /c/<slug>/ URLs", unique=True),
+                ),
+                (
+                    "domain",
+                    models.CharField(
+                        blank=True,
+                        help_text="Hostname serving this clinic, e.g. booking.example-clinic.com",
+                        max_length=255,
+                        null=True,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "database",
+                    models.CharField(
+                        default="default",
+                        help_text="Database alias holding this clinic's providers and appointments",
+                        max_length=100,
+                    ),
+                ),
+                ("is_active", models.BooleanField(default=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Clinic",
+                "verbose_name_plural": "Clinics",
+                "ordering": ["name"],
+            },
+        ),
+        migrations.AddField(
+            model_name="appointment",
+            name="clinic",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                help_text="Clinic the appointment was booked at",
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="appointments",
+                to="appointments.clinic",
+            ),
+        ),
+        migrations.AddField(
+            model_name="appointmentarchive",
+            name="clinic",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="archived_appointments",
+                to="appointments.clinic",
+            ),
+        ),
+        migrations.AddField(
+            model_name="provider",
+            name="clinic",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                help_text="Clinic this provider works at (defaults to the default clinic)",
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="providers",
+                to="appointments.clinic",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["clinic", "appointment_time"], name="appt_clinic_time_idx"
+            ),
+        ),
+        migrations.RunPython(assign_default_clinic, migrations.RunPython.noop),
+    ]
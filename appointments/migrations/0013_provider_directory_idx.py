@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0012_clinic"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="provider",
+            index=models.Index(
+                fields=["clinic", "name", "id"], name="provider_directory_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,150 @@
+# Generated by Django 5.0.14 on 2026-10-19 01:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0013_provider_directory_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WaitlistEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "specialty",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("general", "General Practitioner"),
+                            ("cardiology", "Cardiology"),
+                            ("dermatology", "Dermatology"),
+                            ("pediatrics", "Pediatrics"),
+                            ("psychiatry", "Psychiatry"),
+                            ("orthopedics", "Orthopedics"),
+                            ("neurology", "Neurology"),
+                            ("other", "Other"),
+                        ],
+                        help_text="Specialty wanted when no provider is chosen",
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "appointment_type",
+                    models.CharField(
+                        choices=[
+                            ("consultation", "Consultation"),
+                            ("follow_up", "Follow-up"),
+                        ],
+                        default="consultation",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "client_email",
+                    models.EmailField(
+                        help_text="Patient to offer freed slots to", max_length=254
+                    ),
+                ),
+                (
+                    "window_start",
+                    models.DateTimeField(
+                        help_text="Earliest acceptable appointment time"
+                    ),
+                ),
+                (
+                    "window_end",
+                    models.DateTimeField(
+                        help_text="Latest acceptable appointment time"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("waiting", "Waiting"),
+                            ("offered", "Offered"),
+                            ("booked", "Booked"),
+                            ("expired", "Offer expired"),
+                            ("withdrawn", "Withdrawn"),
+                        ],
+                        default="waiting",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "hold_expires_at",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="When the held booking is released if still unpaid",
+                        null=True,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "clinic",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="waitlist_entries",
+                        to="appointments.clinic",
+                    ),
+                ),
+                (
+                    "offered_appointment",
+                    models.OneToOneField(
+                        blank=True,
+                        help_text="Held booking offered to the patient",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="waitlist_entry",
+                        to="appointments.appointment",
+                    ),
+                ),
+                (
+                    "provider",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Leave blank to accept any provider of the specialty",
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="waitlist_entries",
+                        to="appointments.provider",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Waitlist Entry",
+                "verbose_name_plural": "Waitlist Entries",
+                "ordering": ["created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "provider", "window_start"],
+                        name="waitlist_provider_idx",
+                    ),
+                    models.Index(
+                        fields=["status", "specialty", "window_start"],
+                        name="waitlist_specialty_idx",
+                    ),
+                    models.Index(
+                        fields=["status", "hold_expires_at"], name="waitlist_hold_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 5.0.14 on 2026-10-19 01:04
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0014_waitlistentry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AppointmentSeries",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "client_email",
+                    models.EmailField(
+                        help_text="Patient's email address", max_length=254
+                    ),
+                ),
+                (
+                    "appointment_type",
+                    models.CharField(
+                        choices=[
+                            ("consultation", "Consultation"),
+                            ("follow_up", "Follow-up"),
+                        ],
+                        default="follow_up",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "first_appointment_time",
+                    models.DateTimeField(
+                        help_text="Date and time of the first session"
+                    ),
+                ),
+                (
+                    "interval_weeks",
+                    models.PositiveSmallIntegerField(
+                        choices=[(1, "Every week"), (2, "Every two weeks")],
+                        default=1,
+                        help_text="Weeks between sessions",
+                    ),
+                ),
+                (
+                    "occurrences",
+                    models.PositiveSmallIntegerField(
+                        help_text="Number of sessions in the series",
+                        validators=[
+                            django.core.validators.MinValueValidator(2),
+                            django.core.validators.MaxValueValidator(52),
+                        ],
+                    ),
+                ),
+                (
+                    "notes",
+                    models.TextField(
+                        blank=True, help_text="Patient notes or reason for visit"
+                    ),
+                ),
+                (
+                    "stripe_payment_intent_id",
+                    models.CharField(
+                        blank=True,
+                        help_text="Stripe PaymentIntent covering every session in the series",
+                        max_length=255,
+                        null=True,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "clinic",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="appointment_series",
+                        to="appointments.clinic",
+                    ),
+                ),
+                (
+                    "provider",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="appointment_series",
+                        to="appointments.provider",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Appointment Series",
+                "verbose_name_plural": "Appointment Series",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="appointment",
+            name="series",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Recurring series this appointment was booked in",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="appointments",
+                to="appointments.appointmentseries",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.14 on 2026-10-19 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0015_appointmentseries"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="calendarcredential",
+            name="google_account_id",
+            field=models.CharField(
+                blank=True,
+                help_text="Google account (id_token subject) that granted these credentials",
+                max_length=255,
+            ),
+        ),
+    ]
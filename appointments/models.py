@@ -1,11 +1,64 @@
 """
 Healthcare provider and appointment models.
-Handles provider management, appointment bookings, and pricing.
+Handles clinics (tenants), provider management, appointment bookings, and pricing.
 """
 
-from django.db import models
-from django.core.validators import EmailValidator
+from django.db import DEFAULT_DB_ALIAS, connections, models
+from django.core.exceptions import ValidationError
+from django.core.validators import EmailValidator, MaxValueValidator, MinValueValidator
 from django.utils import timezone
+from datetime import timedelta
+
+from .fields import EncryptedTextField
+
+
+class Clinic(models.Model):
+    """
+    A clinic (tenant) hosted on this deployment.
+    
+    Providers and appointments belong to one clinic. Clinics themselves always
+    live on the default database; a clinic's own rows live on its database
+    alias, so a large clinic can be given a database of its own.
+    """
+    
+    name = models.CharField(
+        max_length=200,
+        help_text="Clinic name"
+    )
+    slug = models.SlugField(
+        unique=True,
+        help_text="Used in /c/<slug>/ URLs"
+    )
+    domain = models.CharField(
+        max_length=255,
+        unique=True,
+        blank=True,
+        null=True,
+        help_text="Hostname serving this clinic, e.g. booking.example-clinic.com"
+    )
+    database = models.CharField(
+        max_length=100,
+        default=DEFAULT_DB_ALIAS,
+        help_text="Database alias holding this clinic's providers and appointments"
+    )
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['name']
+        verbose_name = 'Clinic'
+        verbose_name_plural = 'Clinics'
+    
+    def __str__(self):
+        return self.name
+    
+    def clean(self):
+        from .routers import REPLICA_ALIAS
+        if self.database not in connections.settings or self.database == REPLICA_ALIAS:
+            raise ValidationError({'database': f"Unknown database alias '{self.database}'."})
+        if self.domain:
+            self.domain = self.domain.lower()
 
 
 class Provider(models.Model):
@@ -23,6 +76,16 @@ class Provider(models.Model):
         ('other', 'Other'),
     ]
     
+    # Cross-database when the clinic has its own database, so no FK constraint
+    clinic = models.ForeignKey(
+        Clinic,
+        on_delete=models.PROTECT,
+        related_name='providers',
+        null=True,  # Filled in on save
+        blank=True,
+        db_constraint=False,
+        help_text="Clinic this provider works at (defaults to the default clinic)"
+    )
     name = models.CharField(
         max_length=200,
         help_text="Healthcare provider's full name"
@@ -66,14 +129,34 @@ class Provider(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Price field used for each appointment type
+    PRICE_FIELDS = {
+        'consultation': 'consultation_price',
+        'follow_up': 'follow_up_price',
+    }
+    
+    # Rows per repricing UPDATE, keeping IN (...) lists under SQLite's parameter limit
+    REPRICE_BATCH_SIZE = 500
+    
     class Meta:
         ordering = ['name']
         verbose_name = 'Healthcare Provider'
         verbose_name_plural = 'Healthcare Providers'
+        indexes = [
+            # Provider directory: a clinic's providers in (name, id) keyset order
+            models.Index(fields=['clinic', 'name', 'id'], name='provider_directory_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.get_specialty_display()})"
     
+    def save(self, *args, **kwargs):
+        """Place providers created without a clinic in the default clinic."""
+        if self.clinic_id is None:
+            from .tenants import default_clinic
+            self.clinic = default_clinic()
+        super().save(*args, **kwargs)
+    
     def get_price_for_appointment_type(self, appointment_type):
         """Get price based on appointment type."""
         if appointment_type == 'consultation':
@@ -81,6 +164,96 @@ class Provider(models.Model):
         elif appointment_type == 'follow_up':
             return self.follow_up_price
         return self.consultation_price  # Default fallback
+    
+    def reprice_pending_appointments(self, appointment_types):
+        """
+        Apply current prices to future unpaid appointments of the given types.
+        
+        Runs one set-based UPDATE per type (per distinct price when price rules
+        apply) and clears PaymentIntent IDs so the payment page creates a new
+        intent at the new price. Reads and updates share one write transaction,
+        and each UPDATE only matches rows whose PaymentIntent is still the one
+        read, so a payment started in between is left alone. Returns a dict of
+        repriced counts per type and the list of now-stale PaymentIntent IDs.
+        """
+        from .db import write_transaction
+        from .pricing import get_compiled_pricing
+        compiled = get_compiled_pricing(self)
+        now = timezone.now()
+        repriced = {}
+        stale_intent_ids = []
+        with write_transaction(using=self._state.db):
+            for appointment_type in appointment_types:
+                pending = self.appointments.filter(
+                    appointment_type=appointment_type,
+                    status=Appointment.STATUS_PENDING_PAYMENT,
+                    appointment_time__gt=now,
+                )
+                if not compiled.has_rules(appointment_type):
+                    intent_ids = list(
+                        pending.exclude(stripe_payment_intent_id__isnull=True)
+                        .exclude(stripe_payment_intent_id='')
+                        .values_list('stripe_payment_intent_id', flat=True)
+                    )
+                    repriced[appointment_type] = self._reprice(
+                        pending, self.get_price_for_appointment_type(appointment_type), intent_ids, now
+                    )
+                    stale_intent_ids.extend(intent_ids)
+                    continue
+                # Rules can price each slot differently: one UPDATE per distinct price
+                rows = list(pending.values_list('pk', 'appointment_time', 'stripe_payment_intent_id'))
+                prices = compiled.quote(appointment_type, [time for _, time, _ in rows])
+                rows_by_price = {}
+                for row, price in zip(rows, prices):
+                    rows_by_price.setdefault(price, []).append(row)
+                repriced[appointment_type] = sum(
+                    self._reprice(
+                        pending.filter(pk__in=[pk for pk, _, _ in price_rows]),
+                        price,
+                        [intent_id for _, _, intent_id in price_rows if intent_id],
+                        now,
+                    )
+                    for price, price_rows in rows_by_price.items()
+                )
+                stale_intent_ids.extend(intent_id for _, _, intent_id in rows if intent_id)
+        return repriced, stale_intent_ids
+    
+    def _reprice(self, pending, price, intent_ids, now):
+        """
+        Set price on pending rows without a PaymentIntent or with one of intent_ids.
+        
+        Rows whose PaymentIntent isn't in intent_ids got it after they were read,
+        so that payment is in flight and the row is left alone. Intents beyond
+        the first batch get their own UPDATEs to stay under SQLite's parameter limit.
+        """
+        updates = {'amount_paid': price, 'stripe_payment_intent_id': None, 'updated_at': now}
+        batch_size = self.REPRICE_BATCH_SIZE
+        updated = pending.filter(
+            models.Q(stripe_payment_intent_id__isnull=True)
+            | models.Q(stripe_payment_intent_id='')
+            | models.Q(stripe_payment_intent_id__in=intent_ids[:batch_size])
+        ).update(**updates)
+        for start in range(batch_size, len(intent_ids), batch_size):
+            updated += pending.filter(
+                stripe_payment_intent_id__in=intent_ids[start:start + batch_size]
+            ).update(**updates)
+        return updated
+
+
+class AppointmentQuerySet(models.QuerySet):
+    """Appointment queries with set-based status transitions."""
+    
+    def can_transition_to(self, status):
+        """Rows whose current status allows moving to the given status."""
+        return self.filter(status__in=Appointment.statuses_allowing(status))
+    
+    def transition(self, status, **extra_fields):
+        """Move every eligible row to status in one UPDATE; returns rows changed."""
+        return self.can_transition_to(status).update(
+            status=status,
+            updated_at=timezone.now(),
+            **extra_fields
+        )
 
 
 class Appointment(models.Model):
@@ -92,7 +265,51 @@ class Appointment(models.Model):
         ('follow_up', 'Follow-up'),
     ]
     
+    # Lifecycle states
+    STATUS_PENDING_PAYMENT = 'pending_payment'
+    STATUS_CONFIRMED = 'confirmed'
+    STATUS_COMPLETED = 'completed'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_NO_SHOW = 'no_show'
+    STATUS_CHOICES = [
+        (STATUS_PENDING_PAYMENT, 'Pending Payment'),
+        (STATUS_CONFIRMED, 'Confirmed'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_CANCELLED, 'Cancelled'),
+        (STATUS_NO_SHOW, 'No-show'),
+    ]
+    
+    # Allowed moves between states; final states have no outgoing transitions
+    STATUS_TRANSITIONS = {
+        STATUS_PENDING_PAYMENT: {STATUS_CONFIRMED, STATUS_CANCELLED},
+        STATUS_CONFIRMED: {STATUS_COMPLETED, STATUS_CANCELLED, STATUS_NO_SHOW},
+        STATUS_COMPLETED: set(),
+        STATUS_CANCELLED: set(),
+        STATUS_NO_SHOW: set(),
+    }
+    
+    # Statuses that need no further action (eligible for archiving)
+    FINAL_STATUSES = [STATUS_COMPLETED, STATUS_CANCELLED, STATUS_NO_SHOW]
+    
+    # Statuses that keep the slot booked
+    ACTIVE_STATUSES = [STATUS_PENDING_PAYMENT, STATUS_CONFIRMED]
+    
+    # Scheduled length, used to decide when a confirmed appointment is over
+    DURATION = timedelta(minutes=60)
+    
+    # True only on read-only copies rebuilt from AppointmentArchive
+    is_archived = False
+    
     # Core required fields
+    clinic = models.ForeignKey(
+        Clinic,
+        on_delete=models.PROTECT,
+        related_name='appointments',
+        null=True,  # Filled in on save
+        blank=True,
+        db_constraint=False,
+        help_text="Clinic the appointment was booked at"
+    )
     provider = models.ForeignKey(
         Provider,
         on_delete=models.PROTECT,
@@ -107,6 +324,14 @@ class Appointment(models.Model):
         null=True,
         help_text="Legacy provider name field - will be deprecated"
     )
+    series = models.ForeignKey(
+        'AppointmentSeries',
+        on_delete=models.SET_NULL,
+        related_name='appointments',
+        null=True,
+        blank=True,
+        help_text="Recurring series this appointment was booked in"
+    )
     appointment_time = models.DateTimeField(
         help_text="Scheduled date and time for the appointment"
     )
@@ -155,6 +380,19 @@ class Appointment(models.Model):
         help_text="Whether reminder email has been sent"
     )
     
+    # Lifecycle
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING_PAYMENT,
+        help_text="Current appointment status"
+    )
+    cancelled_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="When the appointment was cancelled"
+    )
+    
     # Healthcare context
     appointment_type = models.CharField(
         max_length=20,
@@ -171,10 +409,20 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = AppointmentQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-appointment_time']
         verbose_name = 'Appointment'
         verbose_name_plural = 'Appointments'
+        indexes = [
+            # Default changelist ordering and keyset pagination
+            models.Index(fields=['-appointment_time', '-id'], name='appt_time_id_desc_idx'),
+            # Status filters/counts and the confirmed -> completed sweep
+            models.Index(fields=['status', 'appointment_time'], name='appt_status_time_idx'),
+            # Clinic-scoped listings on a shared database
+            models.Index(fields=['clinic', 'appointment_time'], name='appt_clinic_time_idx'),
+        ]
     
     def __str__(self):
         provider_display = self.provider.name if self.provider else (self.provider_name or "Unknown Provider")
@@ -186,19 +434,444 @@ class Appointment(models.Model):
     
     def get_status(self):
         """Get human-readable status."""
-        if self.is_paid:
-            return "Confirmed" if self.is_upcoming() else "Completed"
-        return "Pending Payment"
+        return self.get_status_display()
+    
+    @classmethod
+    def statuses_allowing(cls, status):
+        """Statuses from which a transition to the given status is allowed."""
+        return [source for source, targets in cls.STATUS_TRANSITIONS.items() if status in targets]
+    
+    def can_transition_to(self, status):
+        """Check whether the state machine allows moving to status."""
+        return status in self.STATUS_TRANSITIONS[self.status]
+    
+    def transition_to(self, status):
+        """Move to a new status, raising ValidationError for disallowed transitions."""
+        if not self.can_transition_to(status):
+            raise ValidationError(
+                f"Cannot change appointment status from {self.get_status_display()} "
+                f"to {dict(self.STATUS_CHOICES)[status]}."
+            )
+        self.status = status
+        if status == self.STATUS_CONFIRMED:
+            self.is_paid = True
+        elif status == self.STATUS_CANCELLED:
+            self.cancelled_at = timezone.now()
     
     def calculate_price(self):
-        """Calculate price based on provider and appointment type."""
-        if self.provider:
-            return self.provider.get_price_for_appointment_type(self.appointment_type)
-        # Fallback to default price
-        return 50.00 if self.appointment_type == 'consultation' else 30.00
+        """Calculate price from the provider's pricing rules for this slot."""
+        from .pricing import quote
+        return quote(self.provider, self.appointment_type, [self.appointment_time])[0]
     
     def save(self, *args, **kwargs):
         """Override save to automatically set price based on provider and type."""
         if not self.pk and self.provider:  # Only on creation and if provider exists
             self.amount_paid = self.calculate_price()
+        if self.clinic_id is None:
+            if self.provider:
+                self.clinic_id = self.provider.clinic_id
+            else:
+                from .tenants import default_clinic
+                self.clinic = default_clinic()
+        # Keep status in step with payment flag edits (e.g. from the admin form)
+        if self.is_paid and self.status == self.STATUS_PENDING_PAYMENT:
+            self.status = self.STATUS_CONFIRMED
+        super().save(*args, **kwargs)
+
+
+class PriceRule(models.Model):
+    """
+    Price override for a provider, optionally limited by appointment type,
+    time of day and date range. The pricing engine picks the highest-priority
+    matching rule and falls back to the provider's base prices.
+    """
+    
+    provider = models.ForeignKey(
+        Provider,
+        on_delete=models.CASCADE,
+        related_name='price_rules',
+        help_text="Provider this rule applies to"
+    )
+    appointment_type = models.CharField(
+        max_length=20,
+        choices=Appointment.APPOINTMENT_TYPE_CHOICES,
+        blank=True,
+        help_text="Leave blank to apply to all appointment types"
+    )
+    start_time = models.TimeField(
+        blank=True,
+        null=True,
+        help_text="Time of day the rule starts applying (inclusive)"
+    )
+    end_time = models.TimeField(
+        blank=True,
+        null=True,
+        help_text="Time of day the rule stops applying (exclusive)"
+    )
+    valid_from = models.DateField(
+        blank=True,
+        null=True,
+        help_text="First date the rule applies"
+    )
+    valid_until = models.DateField(
+        blank=True,
+        null=True,
+        help_text="Last date the rule applies"
+    )
+    price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        help_text="Price charged when this rule matches"
+    )
+    priority = models.IntegerField(
+        default=0,
+        help_text="Higher priority rules win when several match"
+    )
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['provider', '-priority']
+        verbose_name = 'Price Rule'
+        verbose_name_plural = 'Price Rules'
+    
+    def __str__(self):
+        scope = self.get_appointment_type_display() or 'All types'
+        return f"{scope}: ${self.price} (priority {self.priority})"
+    
+    def clean(self):
+        if (self.start_time is None) != (self.end_time is None):
+            raise ValidationError("Set both start and end time, or neither.")
+        if self.valid_from and self.valid_until and self.valid_from > self.valid_until:
+            raise ValidationError("'Valid from' must be on or before 'valid until'.")
+
+
+class AppointmentSeries(models.Model):
+    """
+    A recurring booking: the same provider, type and time of day every week
+    or every other week. Its appointments are booked, priced and paid for
+    together.
+    """
+    
+    INTERVAL_CHOICES = [
+        (1, 'Every week'),
+        (2, 'Every two weeks'),
+    ]
+    
+    # Longest series bookable in one go (a year of weekly sessions)
+    MAX_OCCURRENCES = 52
+    
+    clinic = models.ForeignKey(
+        Clinic,
+        on_delete=models.PROTECT,
+        related_name='appointment_series',
+        null=True,
+        blank=True,
+        db_constraint=False,
+    )
+    provider = models.ForeignKey(
+        Provider,
+        on_delete=models.PROTECT,
+        related_name='appointment_series',
+    )
+    client_email = models.EmailField(
+        help_text="Patient's email address"
+    )
+    appointment_type = models.CharField(
+        max_length=20,
+        choices=Appointment.APPOINTMENT_TYPE_CHOICES,
+        default='follow_up',
+    )
+    first_appointment_time = models.DateTimeField(
+        help_text="Date and time of the first session"
+    )
+    interval_weeks = models.PositiveSmallIntegerField(
+        choices=INTERVAL_CHOICES,
+        default=1,
+        help_text="Weeks between sessions"
+    )
+    occurrences = models.PositiveSmallIntegerField(
+        validators=[MinValueValidator(2), MaxValueValidator(MAX_OCCURRENCES)],
+        help_text="Number of sessions in the series"
+    )
+    notes = models.TextField(
+        blank=True,
+        help_text="Patient notes or reason for visit"
+    )
+    stripe_payment_intent_id = models.CharField(
+        max_length=255,
+        blank=True,
+        null=True,
+        help_text="Stripe PaymentIntent covering every session in the series"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Appointment Series'
+        verbose_name_plural = 'Appointment Series'
+    
+    def __str__(self):
+        return f"{self.provider.name} - {self.client_email} x{self.occurrences} ({self.get_interval_weeks_display().lower()})"
+    
+    def save(self, *args, **kwargs):
+        """Inherit the clinic from the provider."""
+        if self.clinic_id is None:
+            self.clinic_id = self.provider.clinic_id
+        super().save(*args, **kwargs)
+
+
+class WaitlistEntry(models.Model):
+    """
+    A patient waiting for a slot with a provider (or any provider of a
+    specialty) inside a time window. When a matching slot frees up the
+    patient is offered it as a held booking that expires unless paid.
+    """
+    
+    STATUS_WAITING = 'waiting'
+    STATUS_OFFERED = 'offered'
+    STATUS_BOOKED = 'booked'
+    STATUS_EXPIRED = 'expired'
+    STATUS_WITHDRAWN = 'withdrawn'
+    STATUS_CHOICES = [
+        (STATUS_WAITING, 'Waiting'),
+        (STATUS_OFFERED, 'Offered'),
+        (STATUS_BOOKED, 'Booked'),
+        (STATUS_EXPIRED, 'Offer expired'),
+        (STATUS_WITHDRAWN, 'Withdrawn'),
+    ]
+    
+    clinic = models.ForeignKey(
+        Clinic,
+        on_delete=models.PROTECT,
+        related_name='waitlist_entries',
+        null=True,
+        blank=True,
+        db_constraint=False,
+    )
+    provider = models.ForeignKey(
+        Provider,
+        on_delete=models.CASCADE,
+        related_name='waitlist_entries',
+        null=True,
+        blank=True,
+        help_text="Leave blank to accept any provider of the specialty"
+    )
+    specialty = models.CharField(
+        max_length=50,
+        choices=Provider.SPECIALTY_CHOICES,
+        blank=True,
+        help_text="Specialty wanted when no provider is chosen"
+    )
+    appointment_type = models.CharField(
+        max_length=20,
+        choices=Appointment.APPOINTMENT_TYPE_CHOICES,
+        default='consultation',
+    )
+    client_email = models.EmailField(
+        help_text="Patient to offer freed slots to"
+    )
+    window_start = models.DateTimeField(
+        help_text="Earliest acceptable appointment time"
+    )
+    window_end = models.DateTimeField(
+        help_text="Latest acceptable appointment time"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_WAITING,
+    )
+    offered_appointment = models.OneToOneField(
+        Appointment,
+        on_delete=models.SET_NULL,
+        related_name='waitlist_entry',
+        null=True,
+        blank=True,
+        help_text="Held booking offered to the patient"
+    )
+    hold_expires_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="When the held booking is released if still unpaid"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = 'Waitlist Entry'
+        verbose_name_plural = 'Waitlist Entries'
+        indexes = [
+            # Slot matching: waiting entries for a provider, or a specialty, whose window has opened
+            models.Index(fields=['status', 'provider', 'window_start'], name='waitlist_provider_idx'),
+            models.Index(fields=['status', 'specialty', 'window_start'], name='waitlist_specialty_idx'),
+            # Hold expiry sweep
+            models.Index(fields=['status', 'hold_expires_at'], name='waitlist_hold_idx'),
+        ]
+    
+    def __str__(self):
+        wanted = self.provider.name if self.provider else (self.get_specialty_display() or 'Any provider')
+        return f"{self.client_email} waiting for {wanted}"
+    
+    def clean(self):
+        if not self.provider_id and not self.specialty:
+            raise ValidationError("Choose a provider or a specialty.")
+        if self.window_start and self.window_end and self.window_start >= self.window_end:
+            raise ValidationError("The window must end after it starts.")
+    
+    def save(self, *args, **kwargs):
+        """Inherit the clinic, and the specialty, from the provider."""
+        if self.provider_id:
+            if self.clinic_id is None:
+                self.clinic_id = self.provider.clinic_id
+            self.specialty = self.specialty or self.provider.specialty
+        elif self.clinic_id is None:
+            from .tenants import default_clinic
+            self.clinic = default_clinic()
         super().save(*args, **kwargs)
+
+
+class CalendarCredential(models.Model):
+    """Stored Google Calendar OAuth credentials, reused across a patient's appointments."""
+    
+    client_email = models.EmailField(
+        unique=True,
+        help_text="Patient email these credentials belong to"
+    )
+    google_account_id = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="Google account (id_token subject) that granted these credentials"
+    )
+    token = EncryptedTextField(
+        blank=True,
+        null=True,
+        help_text="Encrypted OAuth access token"
+    )
+    refresh_token = EncryptedTextField(
+        blank=True,
+        null=True,
+        help_text="Encrypted OAuth refresh token"
+    )
+    token_uri = models.CharField(
+        max_length=255,
+        default='https://oauth2.googleapis.com/token',
+        help_text="OAuth token endpoint"
+    )
+    scopes = models.TextField(
+        blank=True,
+        help_text="Space-separated granted OAuth scopes"
+    )
+    expiry = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="When the current access token expires"
+    )
+    sync_token = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="Google nextSyncToken for incremental event sync"
+    )
+    last_synced_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="When calendar changes were last pulled from Google"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Calendar Credential'
+        verbose_name_plural = 'Calendar Credentials'
+    
+    def __str__(self):
+        return f"Calendar credentials for {self.client_email}"
+    
+    def needs_refresh(self, margin):
+        """Check if the access token is missing or expires within the given timedelta."""
+        if not self.token or not self.expiry:
+            return True
+        return self.expiry - margin <= timezone.now()
+
+
+class AppointmentArchive(models.Model):
+    """
+    Completed appointments moved out of the hot Appointment table.
+    
+    Rows keep their original Appointment id so links, Stripe metadata and
+    calendar events still resolve. Populated by `manage.py archive_appointments`.
+    """
+    
+    id = models.BigIntegerField(primary_key=True)
+    clinic = models.ForeignKey(
+        Clinic,
+        on_delete=models.PROTECT,
+        related_name='archived_appointments',
+        null=True,
+        blank=True,
+        db_constraint=False,
+    )
+    provider = models.ForeignKey(
+        Provider,
+        on_delete=models.PROTECT,
+        related_name='archived_appointments',
+        null=True,
+        blank=True,
+    )
+    provider_name = models.CharField(max_length=200, blank=True, null=True)
+    appointment_time = models.DateTimeField()
+    client_email = models.EmailField(db_index=True)
+    is_paid = models.BooleanField(default=False)
+    amount_paid = models.DecimalField(max_digits=10, decimal_places=2)
+    stripe_payment_intent_id = models.CharField(max_length=255, blank=True, null=True)
+    google_calendar_event_id = models.CharField(max_length=255, blank=True, null=True)
+    calendar_synced = models.BooleanField(default=False)
+    confirmation_sent = models.BooleanField(default=False)
+    reminder_sent = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES, default=Appointment.STATUS_COMPLETED)
+    cancelled_at = models.DateTimeField(blank=True, null=True)
+    appointment_type = models.CharField(
+        max_length=20,
+        choices=Appointment.APPOINTMENT_TYPE_CHOICES,
+    )
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-appointment_time']
+        verbose_name = 'Archived Appointment'
+        verbose_name_plural = 'Archived Appointments'
+    
+    def __str__(self):
+        return f"{self.provider_name or 'Unknown Provider'} - {self.client_email} on {self.appointment_time.strftime('%Y-%m-%d %H:%M')} (archived)"
+    
+    @classmethod
+    def copied_fields(cls):
+        """Column names shared with Appointment, in a stable order."""
+        return [f.attname for f in cls._meta.concrete_fields if f.name != 'archived_at']
+    
+    def as_appointment(self):
+        """Unsaved, read-only Appointment with this row's data, for pages that outlive the hot table."""
+        appointment = Appointment(**{field: getattr(self, field) for field in self.copied_fields()})
+        appointment.is_archived = True
+        return appointment
+
+
+def appointments_with_archive(include_archive=True, **filters):
+    """
+    Rows from the hot table, optionally UNION ALL'd with the archive.
+    
+    Returns a values() queryset with the shared columns so callers can
+    stream or export both tables through one query.
+    """
+    fields = AppointmentArchive.copied_fields()
+    hot = Appointment.objects.filter(**filters).values(*fields).order_by()
+    if not include_archive:
+        return hot.order_by('-appointment_time')
+    archived = AppointmentArchive.objects.filter(**filters).values(*fields).order_by()
+    return hot.union(archived, all=True).order_by('-appointment_time')
@@ -0,0 +1,137 @@
+"""
+Rule-based pricing engine.
+Compiles each provider's price rules into an in-memory lookup, cached per
+process and invalidated when rules or base prices change, and prices whole
+batches of candidate slots in one call.
+"""
+
+import threading
+from decimal import Decimal
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import PriceRule, Provider
+
+# Prices used when an appointment has no provider
+DEFAULT_PRICES = {
+    'consultation': Decimal('50.00'),
+    'follow_up': Decimal('30.00'),
+}
+
+# Compiled pricing per (database alias, provider id), reused until the provider's
+# updated_at changes; ids repeat across clinics that have their own database
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def _specificity(rule):
+    """Count the constraints on a rule so narrower rules win priority ties."""
+    return sum([
+        bool(rule.appointment_type),
+        rule.start_time is not None,
+        rule.valid_from is not None or rule.valid_until is not None,
+    ])
+
+
+def _matches_time_of_day(start, end, time_of_day):
+    if start is None:
+        return True
+    if start <= end:
+        return start <= time_of_day < end
+    # Window wraps past midnight (e.g. 22:00-06:00)
+    return time_of_day >= start or time_of_day < end
+
+
+class CompiledPricing:
+    """Flattened, pre-sorted price rules for one provider."""
+
+    def __init__(self, provider, rules):
+        self.version = provider.updated_at
+        self.base_prices = {
+            appointment_type: provider.get_price_for_appointment_type(appointment_type)
+            for appointment_type in Provider.PRICE_FIELDS
+        }
+        ordered = sorted(rules, key=lambda r: (r.priority, _specificity(r), r.id), reverse=True)
+        # Per type: (valid_from, valid_until, start_time, end_time, price), best first
+        self.rules_by_type = {
+            appointment_type: [
+                (r.valid_from, r.valid_until, r.start_time, r.end_time, r.price)
+                for r in ordered
+                if r.appointment_type in ('', appointment_type)
+            ]
+            for appointment_type in Provider.PRICE_FIELDS
+        }
+
+    def has_rules(self, appointment_type):
+        return bool(self.rules_by_type.get(appointment_type))
+
+    def quote(self, appointment_type, times):
+        """Price every slot in times; one pass with rules pre-filtered to the batch's dates."""
+        base_price = self.base_prices.get(appointment_type, self.base_prices['consultation'])
+        rules = self.rules_by_type.get(appointment_type, [])
+        if not rules:
+            return [base_price] * len(times)
+
+        local_times = [timezone.localtime(t) if t and timezone.is_aware(t) else t for t in times]
+        dates = [t.date() for t in local_times if t]
+        if dates:
+            first, last = min(dates), max(dates)
+            rules = [
+                rule for rule in rules
+                if (rule[0] is None or rule[0] <= last) and (rule[1] is None or rule[1] >= first)
+            ]
+
+        prices = []
+        for local_time in local_times:
+            price = base_price
+            if local_time is not None:
+                day = local_time.date()
+                time_of_day = local_time.time()
+                for valid_from, valid_until, start, end, rule_price in rules:
+                    if valid_from and day < valid_from:
+                        continue
+                    if valid_until and day > valid_until:
+                        continue
+                    if not _matches_time_of_day(start, end, time_of_day):
+                        continue
+                    price = rule_price
+                    break
+            prices.append(price)
+        return prices
+
+
+def get_compiled_pricing(provider):
+    """Return the provider's compiled pricing, rebuilding it if the provider changed."""
+    key = (provider._state.db, provider.pk)
+    compiled = _compiled.get(key)
+    if compiled and compiled.version == provider.updated_at:
+        return compiled
+    with _compiled_lock:
+        compiled = _compiled.get(key)
+        if compiled and compiled.version == provider.updated_at:
+            return compiled
+        compiled = CompiledPricing(provider, list(provider.price_rules.filter(is_active=True)))
+        _compiled[key] = compiled
+        return compiled
+
+
+def quote(provider, appointment_type, times):
+    """Price a batch of candidate slots for a provider and appointment type."""
+    if provider is None:
+        return [DEFAULT_PRICES.get(appointment_type, DEFAULT_PRICES['consultation'])] * len(times)
+    return get_compiled_pricing(provider).quote(appointment_type, times)
+
+
+def invalidate_pricing(provider_id, using=DEFAULT_DB_ALIAS):
+    """Drop a provider's compiled pricing in this process."""
+    _compiled.pop((using, provider_id), None)
+
+
+@receiver([post_save, post_delete], sender=PriceRule)
+def price_rule_changed(sender, instance, using, **kwargs):
+    """Invalidate compiled pricing here and, via updated_at, in other processes."""
+    invalidate_pricing(instance.provider_id, using)
+    Provider.objects.using(using).filter(pk=instance.provider_id).update(updated_at=timezone.now())
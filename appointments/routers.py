@@ -0,0 +1,172 @@
+"""
+Tenant and read-replica database routing.
+Clinic-scoped models go to the current clinic's database alias when it has
+one of its own. Otherwise, appointment reads from analytics views (dashboard,
+exports, admin lists) go to the optional 'replica' alias; everything else,
+and every write, stays on the primary. A write pins the rest of the request
+and, through the session, the next few seconds of requests to the primary
+(read-your-writes).
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.template.response import SimpleTemplateResponse
+
+REPLICA_ALIAS = 'replica'
+
+# Apps whose reads may be served by the replica; auth and sessions stay on the primary
+REPLICA_APPS = {'appointments'}
+
+# Models stored per clinic; clinics, credentials, auth and sessions stay on the default database
+TENANT_MODELS = {
+    'provider', 'appointment', 'appointmentseries', 'pricerule', 'appointmentarchive', 'waitlistentry',
+}
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_routing_state = ContextVar('routing_state', default=None)
+# Alias of the current clinic's own database (None: the clinic uses the default database)
+_tenant_database = ContextVar('tenant_database', default=None)
+
+
+class RoutingState:
+    """Per-request routing flags."""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+def get_routing_state():
+    state = _routing_state.get()
+    if state is None:
+        state = RoutingState()
+        _routing_state.set(state)
+    return state
+
+
+@contextmanager
+def routing_state(pinned=False):
+    """Give a request its own routing state (used by ReplicaStickinessMiddleware)."""
+    state = RoutingState(pinned=pinned)
+    token = _routing_state.set(state)
+    try:
+        yield state
+    finally:
+        _routing_state.reset(token)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in connections.settings
+
+
+@contextmanager
+def read_from_replica():
+    """Route eligible reads inside this block to the replica, unless pinned to the primary."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def _iterate_from_replica(iterator):
+    # Streaming runs after the middleware has finished, so bring a fresh state
+    with routing_state(), read_from_replica():
+        yield from iterator
+
+
+def replica_reads(view_func):
+    """View decorator: serve the view's appointment reads from the replica."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        with read_from_replica():
+            response = view_func(request, *args, **kwargs)
+            # Lazy responses would otherwise query after the block has exited
+            if isinstance(response, SimpleTemplateResponse):
+                response.render()
+        if response.streaming and not get_routing_state().pinned:
+            response.streaming_content = _iterate_from_replica(response.streaming_content)
+        return response
+    return wrapper
+
+
+@contextmanager
+def tenant_database(alias):
+    """Route clinic-scoped models inside this block to the given database alias."""
+    token = _tenant_database.set(None if alias in (DEFAULT_DB_ALIAS, None) else alias)
+    try:
+        yield
+    finally:
+        _tenant_database.reset(token)
+
+
+def current_tenant_database():
+    return _tenant_database.get() or DEFAULT_DB_ALIAS
+
+
+def _is_tenant_alias(alias):
+    return alias not in (None, DEFAULT_DB_ALIAS, REPLICA_ALIAS)
+
+
+class TenantRouter:
+    """Clinic-scoped models on the current clinic's database; clinics on the default database."""
+
+    def _route(self, model, hints):
+        if model._meta.app_label != 'appointments':
+            return None
+        instance = hints.get('instance')
+        instance_db = instance._state.db if instance is not None else None
+        if model._meta.model_name not in TENANT_MODELS:
+            # e.g. appointment.clinic, followed from a row on a tenant database
+            if model._meta.model_name == 'clinic' and _is_tenant_alias(instance_db):
+                return DEFAULT_DB_ALIAS
+            return None
+        # e.g. Provider(clinic=clinic): the row belongs on that clinic's database
+        if instance is not None and instance._meta.model_name == 'clinic':
+            return instance.database if _is_tenant_alias(instance.database) else None
+        # Related lookups stay with the row they start from
+        if _is_tenant_alias(instance_db):
+            return instance_db
+        return _tenant_database.get()
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Clinic rows are shared; tenant rows only relate within one database
+        if 'clinic' in (obj1._meta.model_name, obj2._meta.model_name):
+            return True
+        if _is_tenant_alias(obj1._state.db) or _is_tenant_alias(obj2._state.db):
+            return obj1._state.db == obj2._state.db
+        return None
+
+
+class ReplicaRouter:
+    """Primary for writes and by default; replica for reads inside read_from_replica()."""
+
+    def db_for_read(self, model, **hints):
+        if (
+            _replica_reads.get()
+            and model._meta.app_label in REPLICA_APPS
+            and not get_routing_state().pinned
+            and replica_configured()
+        ):
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Read-your-writes: later reads in this request go to the primary
+        state = get_routing_state()
+        state.pinned = True
+        state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
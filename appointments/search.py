@@ -0,0 +1,152 @@
+"""
+Full-text search index for appointment lookups.
+Maintains an SQLite FTS5 table (kept in sync by triggers) over patient email,
+provider name, Stripe PaymentIntent ID and notes. Migration 0007 creates the
+table itself.
+
+SQLite rebuilds tables for most schema changes, which drops (or breaks) the
+sync triggers, so they are removed before migrations run and reinstalled
+afterwards. Row ids survive table rebuilds, so the index itself stays valid.
+"""
+
+import logging
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'appointments_search'
+
+# Trigram matching needs at least this many characters per term
+TRIGRAM_MIN_TERM_LENGTH = 3
+
+# Shared SELECT feeding the index from appointments joined to providers
+INDEX_SOURCE_SQL = """
+    SELECT a.id, a.client_email, COALESCE(p.name, a.provider_name, ''),
+           COALESCE(a.stripe_payment_intent_id, ''), a.notes
+    FROM appointments_appointment a
+    LEFT JOIN appointments_provider p ON p.id = a.provider_id
+"""
+
+INSERT_SQL = f"""
+    INSERT INTO {SEARCH_TABLE}(rowid, client_email, provider_name, payment_intent_id, notes)
+"""
+
+TRIGGERS_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ai AFTER INSERT ON appointments_appointment BEGIN
+        {INSERT_SQL} {INDEX_SOURCE_SQL} WHERE a.id = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_au
+    AFTER UPDATE OF client_email, provider_id, provider_name, stripe_payment_intent_id, notes
+    ON appointments_appointment BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+        {INSERT_SQL} {INDEX_SOURCE_SQL} WHERE a.id = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ad AFTER DELETE ON appointments_appointment BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_provider_au AFTER UPDATE OF name ON appointments_provider BEGIN
+        UPDATE {SEARCH_TABLE} SET provider_name = new.name
+        WHERE rowid IN (SELECT id FROM appointments_appointment WHERE provider_id = new.id);
+    END
+    """,
+]
+
+TRIGGER_NAMES = ['ai', 'au', 'ad', 'provider_au']
+
+# Cached tokenizer per connection alias ('trigram', 'unicode61' or None if no index)
+_tokenizers = {}
+
+
+def install_search_triggers(connection):
+    """Create the sync triggers if the search index exists on this database."""
+    _tokenizers.pop(connection.alias, None)
+    if not get_tokenizer(connection.alias):
+        return
+    with connection.cursor() as cursor:
+        for sql in TRIGGERS_SQL:
+            cursor.execute(sql)
+
+
+def drop_search_triggers(connection):
+    """Drop the sync triggers so schema changes can rebuild the appointment table."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGER_NAMES:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_{name}")
+
+
+def rebuild_search_index(connection, chunk_size=50_000):
+    """Repopulate the index from the appointment table in id-range chunks."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM appointments_appointment")
+        max_id = cursor.fetchone()[0]
+        for start in range(0, max_id, chunk_size):
+            cursor.execute(
+                f"{INSERT_SQL} {INDEX_SOURCE_SQL} WHERE a.id > %s AND a.id <= %s",
+                [start, start + chunk_size]
+            )
+    return max_id
+
+
+def get_tokenizer(using='default'):
+    """Return the index tokenizer for a database alias, or None if there is no index."""
+    if using not in _tokenizers:
+        connection = connections[using]
+        tokenizer = None
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s",
+                    [SEARCH_TABLE]
+                )
+                row = cursor.fetchone()
+            if row:
+                tokenizer = 'trigram' if 'trigram' in row[0] else 'unicode61'
+        _tokenizers[using] = tokenizer
+    return _tokenizers[using]
+
+
+def build_match_expression(search_term, tokenizer):
+    """Turn a user search term into an FTS5 MATCH expression (None if unsupported)."""
+    terms = search_term.split()
+    if not terms:
+        return None
+    if tokenizer == 'trigram':
+        if any(len(term) < TRIGRAM_MIN_TERM_LENGTH for term in terms):
+            return None
+        return ' AND '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+    # unicode61 splits on punctuation, so match each word as a prefix
+    words = ''.join(ch if ch.isalnum() else ' ' for ch in search_term).split()
+    if not words:
+        return None
+    return ' AND '.join(f'"{word}"*' for word in words)
+
+
+def search_appointments(queryset, search_term):
+    """
+    Filter an appointment queryset through the search index.
+
+    Returns None when the index can't answer (no index on this database or
+    terms too short for trigrams), so callers can fall back to LIKE search.
+    """
+    tokenizer = get_tokenizer(queryset.db)
+    if not tokenizer:
+        return None
+    expression = build_match_expression(search_term, tokenizer)
+    if not expression:
+        return None
+    return queryset.filter(pk__in=RawSQL(
+        f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s",
+        [expression]
+    ))
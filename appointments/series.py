@@ -0,0 +1,73 @@
+"""
+Recurring appointment series.
+Expands a weekly or fortnightly rule into its sessions, checks every session
+for provider conflicts in one query, prices them in one pass and inserts
+them with one bulk_create, all inside a single transaction.
+"""
+
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils import timezone
+
+from .db import write_transaction
+from .models import Appointment
+from .pricing import quote
+
+
+def expand(series):
+    """Session times for the series, keeping the local time of day across DST changes."""
+    first = timezone.localtime(series.first_appointment_time)
+    wall_clock = first.replace(tzinfo=None)
+    step = timedelta(weeks=series.interval_weeks)
+    return [
+        timezone.make_aware(wall_clock + step * index, first.tzinfo)
+        for index in range(series.occurrences)
+    ]
+
+
+def conflicting_times(provider, times):
+    """Booked times of the provider's active appointments that overlap any of the given slots (one query)."""
+    overlaps = reduce(or_, (
+        Q(appointment_time__gt=time - Appointment.DURATION, appointment_time__lt=time + Appointment.DURATION)
+        for time in times
+    ))
+    return list(
+        Appointment.objects.filter(overlaps, provider=provider, status__in=Appointment.ACTIVE_STATUSES)
+        .order_by('appointment_time')
+        .values_list('appointment_time', flat=True)
+    )
+
+
+def book_series(series):
+    """
+    Save the series and book all of its sessions atomically; returns the appointments.
+
+    Raises ValidationError, booking nothing, if any session clashes with an
+    existing booking for the provider.
+    """
+    times = expand(series)
+    with write_transaction():
+        conflicts = conflicting_times(series.provider, times)
+        if conflicts:
+            clashes = ', '.join(timezone.localtime(time).strftime('%b %d %H:%M') for time in conflicts)
+            raise ValidationError(f"{series.provider.name} is already booked at {clashes}.")
+
+        series.save()
+        prices = quote(series.provider, series.appointment_type, times)
+        return Appointment.objects.bulk_create([
+            Appointment(
+                clinic_id=series.clinic_id,
+                provider=series.provider,
+                series=series,
+                appointment_time=time,
+                client_email=series.client_email,
+                appointment_type=series.appointment_type,
+                notes=series.notes,
+                amount_paid=price,
+            )
+            for time, price in zip(times, prices)
+        ])
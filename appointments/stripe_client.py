@@ -0,0 +1,46 @@
+"""
+Pooled Stripe client for async views.
+Keeps one StripeClient (backed by an HTTPX connection pool) per event loop so
+async views can await PaymentIntent calls without tying up a worker thread.
+The pool is closed when its loop shuts down, which matters under WSGI: there
+every async view runs on a fresh asyncio.run() loop.
+"""
+
+import asyncio
+import weakref
+
+from django.conf import settings
+
+from .gateways import stripe
+
+# HTTPX async pools are bound to the loop that created them:
+# loop -> (StripeClient, the async generator that closes its pool)
+_clients = weakref.WeakKeyDictionary()
+
+
+async def _close_with_loop(http_client):
+    """Wait for the loop to finalize its async generators, then close the pool."""
+    try:
+        yield
+    finally:
+        await http_client.close_async()
+
+
+def get_stripe_client():
+    """Return the StripeClient for the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(loop)
+    if entry is None:
+        http_client = stripe.HTTPXClient(timeout=settings.STRIPE_TIMEOUT)
+        client = stripe.StripeClient(
+            stripe.api_key or settings.STRIPE_SECRET_KEY,
+            http_client=http_client,
+            # Honour global key/api_base overrides (stripe-mock, local stubs)
+            base_addresses={'api': stripe.api_base},
+        )
+        # asyncio.run() (and so async_to_sync) shuts down the loop's async
+        # generators before closing it; starting this one parks it until then
+        closer = _close_with_loop(http_client)
+        loop.create_task(closer.__anext__())
+        entry = _clients[loop] = (client, closer)
+    return entry[0]
@@ -0,0 +1,242 @@
+"""
+Background tasks for appointment side effects.
+Tasks take batches of appointment IDs so bulk operations enqueue a handful
+of messages instead of one per row. Each batch carries the clinic database it
+was enqueued from, and periodic sweeps visit every clinic database.
+"""
+
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from celery import shared_task
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import reverse
+from django.utils import timezone
+
+from .calendar_utils import delete_appointment_events, resync_appointment_events
+from .email_utils import send_bulk_patient_emails
+from .gateways import stripe
+from .instrumentation import timed
+from .models import Appointment
+from .routers import current_tenant_database, tenant_database
+from .tenants import clinic_databases, clinic_url, default_clinic, get_directory
+from .waitlist import expire_holds, offer_freed_slots
+
+logger = logging.getLogger(__name__)
+
+# IDs per enqueued task
+TASK_BATCH_SIZE = 500
+
+# Rows flipped per UPDATE by the completion sweep
+COMPLETION_BATCH_SIZE = 5_000
+
+
+def enqueue_in_batches(task, ids, **kwargs):
+    """Split IDs into fixed-size batches and enqueue one task per batch for the current clinic database."""
+    ids = list(ids)
+    kwargs.setdefault('using', current_tenant_database())
+    for start in range(0, len(ids), TASK_BATCH_SIZE):
+        task.delay(ids[start:start + TASK_BATCH_SIZE], **kwargs)
+    return len(ids)
+
+
+def tenant_task(func):
+    """
+    shared_task whose body runs routed to a clinic database.
+    
+    The worker has no request to resolve a clinic from, so the alias travels
+    with the message as `using` (enqueue_in_batches fills it in).
+    """
+    @functools.wraps(func)
+    def run(*args, using=DEFAULT_DB_ALIAS, **kwargs):
+        with tenant_database(using):
+            return func(*args, **kwargs)
+    return shared_task(run)
+
+
+@tenant_task
+def send_confirmation_emails(appointment_ids):
+    """Send confirmation emails for a batch and flag the ones delivered."""
+    appointments = Appointment.objects.filter(id__in=appointment_ids).select_related('provider')
+    sent_ids = send_bulk_patient_emails(appointments, "Appointment Confirmed", 'confirmation')
+    Appointment.objects.filter(id__in=sent_ids).update(confirmation_sent=True, updated_at=timezone.now())
+    return len(sent_ids)
+
+
+@tenant_task
+def send_cancellation_emails(appointment_ids, reason=None):
+    """Send cancellation emails for a batch."""
+    appointments = Appointment.objects.filter(id__in=appointment_ids).select_related('provider')
+    return len(send_bulk_patient_emails(appointments, "Appointment Cancelled", 'cancellation', reason=reason))
+
+
+@tenant_task
+def resync_calendar_events(appointment_ids):
+    """Push a batch of appointments to their patients' Google Calendars."""
+    appointments = Appointment.objects.filter(id__in=appointment_ids).select_related('provider')
+    return len(resync_appointment_events(appointments))
+
+
+@tenant_task
+def delete_calendar_events(appointment_ids):
+    """Remove a batch of appointments from their patients' Google Calendars."""
+    appointments = Appointment.objects.filter(id__in=appointment_ids)
+    return len(delete_appointment_events(appointments))
+
+
+def _refund_if_succeeded(payment_intent_id):
+    """Refund a stale PaymentIntent that succeeded before it could be cancelled."""
+    try:
+        with timed('stripe'):
+            payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id, api_key=settings.STRIPE_SECRET_KEY)
+            if payment_intent.status != 'succeeded':
+                return False
+            # Its appointment was repriced and no longer points at it, so nothing
+            # would ever record this payment
+            stripe.Refund.create(
+                payment_intent=payment_intent_id,
+                idempotency_key=f'{payment_intent_id}-stale-refund',
+                api_key=settings.STRIPE_SECRET_KEY,
+            )
+    except stripe.error.StripeError as e:
+        logger.error(f"Could not refund stale PaymentIntent {payment_intent_id}: {str(e)}")
+        return False
+    logger.warning(f"Refunded stale PaymentIntent {payment_intent_id}: it succeeded after its appointment was repriced")
+    return True
+
+
+@tenant_task
+def cancel_payment_intents(payment_intent_ids):
+    """Cancel a batch of stale Stripe PaymentIntents (e.g. after repricing), refunding any that already succeeded."""
+    cancelled = 0
+    refunded = 0
+    for payment_intent_id in payment_intent_ids:
+        try:
+            with timed('stripe'):
+                stripe.PaymentIntent.cancel(payment_intent_id, api_key=settings.STRIPE_SECRET_KEY)
+            cancelled += 1
+        except stripe.error.StripeError as e:
+            # Already cancelled intents need nothing more; succeeded ones are refunded
+            logger.warning(f"Could not cancel PaymentIntent {payment_intent_id}: {str(e)}")
+            refunded += _refund_if_succeeded(payment_intent_id)
+    logger.info(
+        f"Cancelled {cancelled} and refunded {refunded} of {len(payment_intent_ids)} PaymentIntent(s)"
+    )
+    return cancelled
+
+
+def _refund(refund):
+    appointment_id, payment_intent_id, amount = refund
+    try:
+        # Series sessions share one intent, so refund just this session's amount;
+        # the idempotency key makes a retried batch safe
+        with timed('stripe'):
+            stripe.Refund.create(
+                payment_intent=payment_intent_id,
+                amount=int(amount * 100),
+                idempotency_key=f'appointment-{appointment_id}-refund',
+                api_key=settings.STRIPE_SECRET_KEY,
+            )
+        return True
+    except stripe.error.StripeError as e:
+        logger.warning(f"Could not refund appointment {appointment_id} ({payment_intent_id}): {str(e)}")
+        return False
+
+
+@tenant_task
+def refund_payments(appointment_ids):
+    """Refund a batch of cancelled, paid appointments with a bounded pool of concurrent Stripe calls."""
+    refunds = list(
+        Appointment.objects.filter(
+            pk__in=appointment_ids,
+            status=Appointment.STATUS_CANCELLED,
+            is_paid=True,
+        ).exclude(stripe_payment_intent_id__isnull=True)
+        .exclude(stripe_payment_intent_id='')
+        .values_list('pk', 'stripe_payment_intent_id', 'amount_paid')
+    )
+    if not refunds:
+        return 0
+    # Pool threads don't see the request's timings, so the batch is timed as one Stripe wait here
+    with timed('stripe'), ThreadPoolExecutor(max_workers=min(settings.STRIPE_REFUND_WORKERS, len(refunds))) as pool:
+        refunded = sum(pool.map(_refund, refunds))
+    logger.info(f"Refunded {refunded} of {len(refunds)} cancelled appointment(s)")
+    return refunded
+
+
+@tenant_task
+def offer_waitlist_slots(appointment_ids):
+    """Offer a batch of freed (cancelled) slots to waiting patients and email the offers."""
+    held_ids = offer_freed_slots(appointment_ids)
+    enqueue_in_batches(send_waitlist_offers, held_ids)
+    logger.info(f"Offered {len(held_ids)} of {len(appointment_ids)} freed slot(s) from the waitlist")
+    return len(held_ids)
+
+
+@tenant_task
+def send_waitlist_offers(appointment_ids):
+    """Email patients the held bookings offered to them from the waitlist."""
+    appointments = Appointment.objects.filter(id__in=appointment_ids).select_related('provider')
+    # Clinics come from the in-process directory rather than a query per email
+    clinics = {clinic.pk: clinic for clinic in get_directory().by_slug.values()}
+
+    def payment_url(appointment):
+        clinic = clinics.get(appointment.clinic_id) or default_clinic()
+        return {'payment_url': clinic_url(clinic, reverse('appointment_payment', args=[appointment.id]))}
+
+    return len(send_bulk_patient_emails(
+        appointments, "Appointment Available", 'waitlist_offer',
+        context_for=payment_url,
+        hold_minutes=settings.WAITLIST_HOLD_MINUTES,
+    ))
+
+
+@shared_task
+def expire_waitlist_holds():
+    """Release unpaid waitlist holds past their expiry and offer the slots again, on every clinic database."""
+    released = 0
+    for using in clinic_databases():
+        with tenant_database(using):
+            released_ids = expire_holds()
+            enqueue_in_batches(offer_waitlist_slots, released_ids)
+        released += len(released_ids)
+    return released
+
+
+@shared_task
+def complete_past_appointments():
+    """Flip confirmed appointments that have ended to completed, in bounded batches, on every clinic database."""
+    cutoff = timezone.now() - Appointment.DURATION
+    
+    completed = 0
+    for using in clinic_databases():
+        ended = Appointment.objects.using(using).filter(
+            status=Appointment.STATUS_CONFIRMED,
+            appointment_time__lt=cutoff,
+        ).order_by()
+        while True:
+            batch = Appointment.objects.using(using).filter(pk__in=ended.values('pk')[:COMPLETION_BATCH_SIZE])
+            updated = batch.transition(Appointment.STATUS_COMPLETED)
+            completed += updated
+            if updated < COMPLETION_BATCH_SIZE:
+                break
+    logger.info(f"Marked {completed} appointment(s) as completed")
+    return completed
+
+
+@shared_task
+def clear_expired_sessions():
+    """Delete expired sessions in bounded batches instead of one table-wide DELETE."""
+    expired = Session.objects.filter(expire_date__lt=timezone.now()).order_by()
+    
+    cleared = 0
+    while True:
+        keys = list(expired.values_list('session_key', flat=True)[:settings.SESSION_CLEANUP_BATCH_SIZE])
+        if not keys:
+            break
+        cleared += Session.objects.filter(session_key__in=keys).delete()[0]
+    logger.info(f"Cleared {cleared} expired session(s)")
+    return cleared
@@ -0,0 +1,97 @@
+"""
+Clinic (tenant) resolution.
+Maps a request to its clinic by URL prefix (/c/<slug>/...) or hostname, and
+falls back to the default clinic. Lookups use an in-process directory of
+active clinics, loaded in one query and reloaded whenever a clinic changes.
+"""
+
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Clinic
+
+# Clinic that owns rows created without one (and every pre-tenancy row)
+DEFAULT_CLINIC_SLUG = 'default'
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+class ClinicDirectory:
+    """Active clinics indexed by slug and by domain."""
+
+    def __init__(self, clinics):
+        self.by_slug = {clinic.slug: clinic for clinic in clinics}
+        self.by_domain = {clinic.domain.lower(): clinic for clinic in clinics if clinic.domain}
+
+
+def get_directory():
+    """Return the clinic directory, loading it on first use in this process."""
+    directory = _directory
+    if directory is not None:
+        return directory
+    return _load_directory()
+
+
+def _load_directory():
+    global _directory
+    with _directory_lock:
+        if _directory is None:
+            # Clinics always live on the default database
+            clinics = list(Clinic.objects.using(DEFAULT_DB_ALIAS).filter(is_active=True))
+            if not any(clinic.slug == DEFAULT_CLINIC_SLUG for clinic in clinics):
+                default, _ = Clinic.objects.using(DEFAULT_DB_ALIAS).get_or_create(
+                    slug=DEFAULT_CLINIC_SLUG, defaults={'name': 'Default clinic'}
+                )
+                clinics.append(default)
+            _directory = ClinicDirectory(clinics)
+        return _directory
+
+
+def directory_loaded():
+    return _directory is not None
+
+
+def default_clinic():
+    return get_directory().by_slug[DEFAULT_CLINIC_SLUG]
+
+
+def clinic_databases():
+    """Aliases of every database holding clinic rows, the default database first."""
+    aliases = {clinic.database for clinic in get_directory().by_slug.values()} - {DEFAULT_DB_ALIAS}
+    return [DEFAULT_DB_ALIAS, *sorted(aliases)]
+
+
+def clear_clinic_cache(**kwargs):
+    """Drop the clinic directory in this process (it reloads on next use)."""
+    global _directory
+    _directory = None
+
+
+@receiver([post_save, post_delete], sender=Clinic)
+def clinic_changed(sender, **kwargs):
+    clear_clinic_cache()
+
+
+def resolve_clinic(host, path):
+    """
+    Return (clinic, prefix) for a request's host and path.
+
+    prefix is the '/c/<slug>' part of the path when that selected the clinic,
+    otherwise ''. Unknown slugs fall through to the host so they 404 normally.
+    """
+    directory = get_directory()
+    parts = path.split('/', 3)
+    if len(parts) >= 3 and parts[1] == settings.TENANT_URL_PREFIX and parts[2] in directory.by_slug:
+        return directory.by_slug[parts[2]], f'/{parts[1]}/{parts[2]}'
+    clinic = directory.by_domain.get(host.lower())
+    return clinic or directory.by_slug[DEFAULT_CLINIC_SLUG], ''
+
+
+def clinic_url(clinic, path):
+    """Prefix a site path (e.g. from reverse()) so it resolves to the given clinic."""
+    return f'/{settings.TENANT_URL_PREFIX}/{clinic.slug}{path}'
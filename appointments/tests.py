@@ -1,3 +1,2187 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time as time_module
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from .admin import AppointmentAdmin, AppointmentMonthFilter
+from .admission import SlidingWindowLimiter
+from .db import write_transaction
+from .gateways import stripe
+from .instrumentation import metrics, request_timings
+from .middleware import AdmissionControlMiddleware, brotli
+from .models import (
+    Appointment, AppointmentArchive, AppointmentSeries, CalendarCredential, Clinic, PriceRule, Provider,
+    WaitlistEntry,
+)
+from .pagination import EstimatedCountPaginator
+from .pricing import DEFAULT_PRICES, CompiledPricing, quote
+from .routers import REPLICA_ALIAS, tenant_database
+from .series import book_series, expand
+from .stripe_client import get_stripe_client
+from .waitlist import offer_freed_slots
+from .calendar_utils import (
+    CALENDAR_ACCOUNT_SESSION_KEY, CALENDAR_OAUTH_SESSION_KEY, SCOPES, apply_calendar_changes,
+    handle_google_calendar_callback, sync_calendar_changes,
+)
+from .tasks import (
+    cancel_payment_intents, clear_expired_sessions, complete_past_appointments, expire_waitlist_holds,
+    refund_payments, send_waitlist_offers,
+)
+
+
+def create_provider(name='Dr. Test', **kwargs):
+    """Create a provider with default pricing."""
+    return Provider.objects.create(name=name, **kwargs)
+
+
+def create_appointment(provider, days_ahead=7, **kwargs):
+    """Create an appointment for the provider in the future."""
+    kwargs.setdefault('client_email', 'patient@example.com')
+    return Appointment.objects.create(
+        provider=provider,
+        appointment_time=timezone.now() + timedelta(days=days_ahead),
+        **kwargs
+    )
+
+
+class AdminTestCase(TestCase):
+    """Base test case logged in as a superuser."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(self.user)
+
+    def count_queries(self, url):
+        """GET the URL and return the number of queries executed."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+
+class ProviderAdminTests(AdminTestCase):
+    """Provider changelist statistics are annotated, not queried per row."""
+
+    url = reverse('admin:appointments_provider_changelist')
+
+    def add_providers(self, count):
+        for i in range(count):
+            provider = create_provider(f'Dr. {i}')
+            create_appointment(provider, is_paid=True)
+            create_appointment(provider)
+
+    def test_changelist_query_count_is_constant(self):
+        self.add_providers(2)
+        baseline = self.count_queries(self.url)
+
+        self.add_providers(20)
+        self.assertEqual(self.count_queries(self.url), baseline)
+
+    def test_statistics_are_annotated(self):
+        provider = create_provider(consultation_price=Decimal('80.00'))
+        create_appointment(provider, is_paid=True)
+        create_appointment(provider, is_paid=True)
+        create_appointment(provider)
+
+        response = self.client.get(self.url)
+        obj = response.context['cl'].result_list[0]
+        self.assertEqual(obj._appointment_count, 3)
+        self.assertEqual(obj._paid_count, 2)
+        self.assertEqual(obj._total_revenue, Decimal('160.00'))
+
+    def test_sortable_by_revenue(self):
+        low = create_provider('Dr. Low', consultation_price=Decimal('10.00'))
+        high = create_provider('Dr. High', consultation_price=Decimal('90.00'))
+        create_appointment(low, is_paid=True)
+        create_appointment(high, is_paid=True)
+
+        # Column index of total_revenue in list_display (1-based), descending
+        response = self.client.get(self.url, {'o': '-9'})
+        self.assertEqual(list(response.context['cl'].result_list), [high, low])
+
+    def test_filter_no_bookings_in_30_days(self):
+        active = create_provider('Dr. Active')
+        stale = create_provider('Dr. Stale')
+        never = create_provider('Dr. Never')
+        create_appointment(active)
+        old = create_appointment(stale)
+        Appointment.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=45))
+
+        response = self.client.get(self.url, {'booking_activity': 'inactive'})
+        self.assertEqual(set(response.context['cl'].result_list), {stale, never})
+
+        response = self.client.get(self.url, {'booking_activity': 'recent'})
+        self.assertEqual(list(response.context['cl'].result_list), [active])
+
+
+class AppointmentSearchTests(AdminTestCase):
+    """Admin search goes through the FTS5 index kept in sync by triggers."""
+
+    url = reverse('admin:appointments_appointment_changelist')
+
+    def search(self, term):
+        response = self.client.get(self.url, {'q': term})
+        return set(response.context['cl'].result_list)
+
+    def test_matches_email_provider_intent_and_notes(self):
+        provider = create_provider('Dr. Quinn')
+        match = create_appointment(
+            provider,
+            client_email='jane.roe@example.com',
+            stripe_payment_intent_id='pi_3NabcXYZ',
+            notes='Recurring migraine',
+        )
+        other = create_appointment(create_provider('Dr. House'), client_email='bob@example.com')
+
+        self.assertEqual(self.search('roe@exa'), {match})
+        self.assertEqual(self.search('quinn'), {match})
+        self.assertEqual(self.search('pi_3Nabc'), {match})
+        self.assertEqual(self.search('MIGRAINE'), {match})
+        self.assertEqual(self.search('example.com'), {match, other})
+
+    def test_index_follows_updates_deletes_and_provider_renames(self):
+        provider = create_provider('Dr. Quinn')
+        appointment = create_appointment(provider, client_email='old@example.com')
+
+        appointment.client_email = 'new@example.com'
+        appointment.save()
+        self.assertEqual(self.search('old@example'), set())
+        self.assertEqual(self.search('new@example'), {appointment})
+
+        provider.name = 'Dr. Strange'
+        provider.save()
+        self.assertEqual(self.search('strange'), {appointment})
+
+        appointment.delete()
+        self.assertEqual(self.search('new@example'), set())
+
+    def test_short_terms_fall_back_to_like_search(self):
+        appointment = create_appointment(create_provider(), client_email='al@example.com')
+        self.assertEqual(self.search('al'), {appointment})
+
+
+class AppointmentChangelistPaginationTests(AdminTestCase):
+    """The large-table changelist: month filter, keyset cursors and estimated counts."""
+
+    url = reverse('admin:appointments_appointment_changelist')
+
+    def test_month_filter_spans_the_data(self):
+        provider = create_provider()
+        for days_ahead in (-800, 0, 400):
+            create_appointment(provider, days_ahead=days_ahead)
+        first = timezone.localtime(timezone.now() - timedelta(days=800))
+        last = timezone.localtime(timezone.now() + timedelta(days=400))
+
+        response = self.client.get(self.url)
+
+        month_filter = next(f for f in response.context['cl'].filter_specs if isinstance(f, AppointmentMonthFilter))
+        months = [value for value, _ in month_filter.lookup_choices]
+        self.assertEqual(months[0], f'{last.year}-{last.month:02d}')
+        self.assertEqual(months[-1], f'{first.year}-{first.month:02d}')
+        self.assertEqual(len(months), (last.year - first.year) * 12 + last.month - first.month + 1)
+
+        response = self.client.get(self.url, {'appointment_month': months[-1]})
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+
+    def test_keyset_cursor_pages_through_ties_once(self):
+        provider = create_provider()
+        later = timezone.now().replace(microsecond=0) + timedelta(days=7)
+        earlier = later - timedelta(days=1)
+        for appointment_time in (later, later, earlier, earlier, earlier):
+            Appointment.objects.create(
+                provider=provider, appointment_time=appointment_time, client_email='patient@example.com'
+            )
+        expected = list(Appointment.objects.order_by('-appointment_time', '-pk').values_list('pk', flat=True))
+
+        seen = []
+        query_string = ''
+        with mock.patch.object(AppointmentAdmin, 'list_per_page', 2):
+            while True:
+                cl = self.client.get(self.url + query_string).context['cl']
+                seen.extend(appointment.pk for appointment in cl.result_list)
+                if not cl.next_cursor_url:
+                    break
+                query_string = cl.next_cursor_url
+
+        self.assertEqual(seen, expected)
+
+    def test_estimated_count_above_threshold(self):
+        provider = create_provider()
+        appointments = [create_appointment(provider) for _ in range(5)]
+        appointments[1].delete()
+
+        with mock.patch.object(EstimatedCountPaginator, 'LARGE_TABLE_THRESHOLD', 3), \
+                mock.patch.object(EstimatedCountPaginator, 'FILTERED_COUNT_CAP', 2):
+            unfiltered = EstimatedCountPaginator(Appointment.objects.order_by('pk'), 2)
+            filtered = EstimatedCountPaginator(Appointment.objects.filter(provider=provider).order_by('pk'), 2)
+
+            # Unfiltered: the max primary key stands in for COUNT(*), so the deleted row still counts
+            self.assertEqual(unfiltered.count, appointments[-1].pk)
+            # Filtered: counted only up to the cap
+            self.assertEqual(filtered.count, 2)
+
+    def test_deleted_rows_do_not_inflate_a_small_table(self):
+        provider = create_provider()
+        appointments = [create_appointment(provider) for _ in range(5)]
+        Appointment.objects.filter(pk__in=[a.pk for a in appointments[:3]]).delete()
+
+        # The max primary key is past the threshold but only two rows are left
+        with mock.patch.object(EstimatedCountPaginator, 'LARGE_TABLE_THRESHOLD', 3):
+            paginator = EstimatedCountPaginator(Appointment.objects.order_by('pk'), 2)
+            self.assertEqual(paginator.count, 2)
+            self.assertEqual(paginator.num_pages, 1)
+
+    def test_estimated_count_below_threshold_is_exact(self):
+        provider = create_provider()
+        appointments = [create_appointment(provider) for _ in range(5)]
+        appointments[1].delete()
+
+        self.assertEqual(EstimatedCountPaginator(Appointment.objects.order_by('pk'), 2).count, 4)
+
+
+class AppointmentBulkActionTests(AdminTestCase):
+    """Bulk admin actions update rows set-based and batch their side effects."""
+
+    url = reverse('admin:appointments_appointment_changelist')
+
+    def run_action(self, action, appointments):
+        return self.client.post(self.url, {
+            'action': action,
+            '_selected_action': [a.pk for a in appointments],
+        })
+
+    def test_mark_paid_uses_single_update(self):
+        provider = create_provider()
+        appointments = [create_appointment(provider) for _ in range(5)]
+
+        with CaptureQueriesContext(connection) as context:
+            self.run_action('mark_paid', appointments)
+        updates = [q for q in context.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Appointment.objects.filter(is_paid=True).count(), 5)
+
+    def test_cancel_marks_rows_and_sends_emails_in_one_batch(self):
+        provider = create_provider()
+        appointments = [
+            create_appointment(provider, client_email=f'p{i}@example.com', is_paid=True)
+            for i in range(3)
+        ]
+
+        with mock.patch('appointments.email_utils.get_connection') as get_connection:
+            self.run_action('cancel_appointments', appointments)
+
+        self.assertEqual(Appointment.objects.filter(status=Appointment.STATUS_CANCELLED).count(), 3)
+        # One SMTP connection for the whole batch
+        get_connection.assert_called_once()
+        connection_obj = get_connection.return_value.__enter__.return_value
+        self.assertEqual(connection_obj.send_messages.call_count, 3)
+
+
+class CancelScheduleTests(AdminTestCase):
+    """A provider's schedule is cancelled set-based with refunds through a bounded pool."""
+
+    def setUp(self):
+        super().setUp()
+        self.provider = create_provider('Dr. Sick')
+        self.day = (timezone.now() + timedelta(days=3)).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.booked = [
+            Appointment.objects.create(
+                provider=self.provider,
+                appointment_time=self.day + timedelta(hours=9 + i),
+                client_email=f'p{i}@example.com',
+                is_paid=i < 2,
+                stripe_payment_intent_id=f'pi_{i}' if i < 2 else None,
+            )
+            for i in range(4)
+        ]
+        self.next_day = Appointment.objects.create(
+            provider=self.provider, appointment_time=self.day + timedelta(days=1, hours=9),
+            client_email='later@example.com',
+        )
+        self.other = Appointment.objects.create(
+            provider=create_provider('Dr. Well'), appointment_time=self.day + timedelta(hours=9),
+            client_email='other@example.com',
+        )
+
+    def cancelled(self):
+        return set(Appointment.objects.filter(status=Appointment.STATUS_CANCELLED).values_list('pk', flat=True))
+
+    def test_command_cancels_the_day_in_one_update(self):
+        with mock.patch('stripe.Refund.create') as refund, CaptureQueriesContext(connection) as context:
+            call_command(
+                'cancel_provider_schedule', self.provider.pk,
+                start=self.day.date().isoformat(), reason='Provider unwell', stdout=StringIO(),
+            )
+
+        self.assertEqual(self.cancelled(), {a.pk for a in self.booked})
+        updates = [
+            q for q in context.captured_queries
+            if q['sql'].startswith('UPDATE "appointments_appointment"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(
+            sorted((c.kwargs['payment_intent'], c.kwargs['amount'], c.kwargs['idempotency_key']) for c in refund.call_args_list),
+            [(f'pi_{i}', 5000, f'appointment-{a.pk}-refund') for i, a in enumerate(self.booked[:2])],
+        )
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertIn('Provider unwell', mail.outbox[0].body)
+
+    def test_cancellation_subject_names_the_provider(self):
+        with mock.patch('stripe.Refund.create'):
+            call_command(
+                'cancel_provider_schedule', self.provider.pk,
+                start=self.day.date().isoformat(), stdout=StringIO(),
+            )
+
+        self.assertEqual({message.subject for message in mail.outbox}, {'Appointment Cancelled - Dr. Sick'})
+
+    def test_dry_run_changes_nothing(self):
+        out = StringIO()
+        call_command('cancel_provider_schedule', self.provider.pk, start=self.day.date().isoformat(), dry_run=True, stdout=out)
+        self.assertIn('4 appointment(s)', out.getvalue())
+        self.assertEqual(self.cancelled(), set())
+
+    @override_settings(STRIPE_REFUND_WORKERS=2)
+    def test_refunds_run_in_a_bounded_pool(self):
+        Appointment.objects.filter(pk__in=[a.pk for a in self.booked]).update(is_paid=True, stripe_payment_intent_id='pi_x')
+        running, peak, lock = [0], [0], threading.Lock()
+
+        def slow_refund(**kwargs):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time_module.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+        with mock.patch('stripe.Refund.create', side_effect=slow_refund) as refund:
+            call_command('cancel_provider_schedule', self.provider.pk, start=self.day.date().isoformat(), stdout=StringIO())
+        self.assertEqual(refund.call_count, 4)
+        self.assertEqual(peak[0], 2)
+
+    def test_refunds_count_as_stripe_time(self):
+        Appointment.objects.filter(pk__in=[a.pk for a in self.booked]).update(
+            status=Appointment.STATUS_CANCELLED, is_paid=True, stripe_payment_intent_id='pi_x',
+        )
+
+        with mock.patch('stripe.Refund.create'), request_timings() as timings:
+            refund_payments([a.pk for a in self.booked])
+
+        self.assertEqual(timings.counts['stripe'], 1)
+        self.assertGreater(timings.durations['stripe'], 0)
+
+    def test_admin_action_asks_for_the_range(self):
+        url = reverse('admin:appointments_provider_changelist')
+        data = {'action': 'cancel_schedule', '_selected_action': [self.provider.pk]}
+
+        response = self.client.post(url, data)
+        self.assertContains(response, 'Cancel provider schedule')
+        self.assertEqual(self.cancelled(), set())
+
+        with mock.patch('stripe.Refund.create') as refund:
+            response = self.client.post(url, {
+                **data,
+                'apply': '1',
+                'start': self.day.strftime('%Y-%m-%dT%H:%M'),
+                'end': (self.day + timedelta(hours=11)).strftime('%Y-%m-%dT%H:%M'),
+            })
+        self.assertRedirects(response, url)
+        self.assertEqual(self.cancelled(), {a.pk for a in self.booked[:2]})
+        self.assertEqual(refund.call_count, 2)
+
+
+class ProviderRepricingTests(AdminTestCase):
+    """Price changes reprice pending bookings set-based, without per-row saves."""
+
+    def create_pending(self, provider, count, appointment_type='consultation', **kwargs):
+        now = timezone.now()
+        Appointment.objects.bulk_create([
+            Appointment(
+                provider=provider,
+                appointment_time=now + timedelta(days=1, minutes=i),
+                client_email=f'p{i}@example.com',
+                appointment_type=appointment_type,
+                amount_paid=Decimal('50.00'),
+                **kwargs
+            )
+            for i in range(count)
+        ], batch_size=1000)
+
+    def test_reprice_scales_with_constant_queries(self):
+        provider = create_provider(consultation_price=Decimal('75.00'))
+        self.create_pending(provider, 20_000)
+        self.create_pending(provider, 10, stripe_payment_intent_id='pi_stale')
+
+        # Price rules, stale intents and one UPDATE (in a savepoint here), regardless of row count
+        with self.assertNumQueries(5):
+            repriced, stale = provider.reprice_pending_appointments(['consultation'])
+
+        self.assertEqual(repriced, {'consultation': 20_010})
+        self.assertEqual(len(stale), 10)
+        self.assertFalse(Appointment.objects.exclude(amount_paid=Decimal('75.00')).exists())
+        self.assertFalse(Appointment.objects.filter(stripe_payment_intent_id__isnull=False).exists())
+
+    def test_payment_started_after_the_read_is_left_alone(self):
+        provider = create_provider()
+        stale = create_appointment(provider, stripe_payment_intent_id='pi_stale')
+        in_flight = create_appointment(provider)
+        PriceRule.objects.create(provider=provider, appointment_type='consultation', price=Decimal('80.00'))
+        original_quote = CompiledPricing.quote
+
+        def quote_while_patient_pays(compiled, appointment_type, times):
+            # The patient opens the payment page between the read and the UPDATE
+            Appointment.objects.filter(pk=in_flight.pk).update(stripe_payment_intent_id='pi_new')
+            return original_quote(compiled, appointment_type, times)
+
+        with mock.patch.object(CompiledPricing, 'quote', autospec=True, side_effect=quote_while_patient_pays):
+            repriced, stale_ids = provider.reprice_pending_appointments(['consultation'])
+
+        self.assertEqual(repriced, {'consultation': 1})
+        self.assertEqual(stale_ids, ['pi_stale'])
+        stale.refresh_from_db()
+        in_flight.refresh_from_db()
+        self.assertEqual((stale.amount_paid, stale.stripe_payment_intent_id), (Decimal('80.00'), None))
+        self.assertEqual((in_flight.amount_paid, in_flight.stripe_payment_intent_id), (Decimal('50.00'), 'pi_new'))
+
+    def test_only_future_unpaid_appointments_of_changed_type(self):
+        provider = create_provider()
+        pending = create_appointment(provider)
+        paid = create_appointment(provider, is_paid=True)
+        follow_up = create_appointment(provider, appointment_type='follow_up')
+        past = create_appointment(provider, days_ahead=-1)
+
+        provider.consultation_price = Decimal('99.00')
+        provider.save()
+        provider.reprice_pending_appointments(['consultation'])
+
+        amounts = dict(Appointment.objects.values_list('pk', 'amount_paid'))
+        self.assertEqual(amounts[pending.pk], Decimal('99.00'))
+        self.assertEqual(amounts[paid.pk], Decimal('50.00'))
+        self.assertEqual(amounts[follow_up.pk], Decimal('30.00'))
+        self.assertEqual(amounts[past.pk], Decimal('50.00'))
+
+    def test_admin_save_reprices_cancels_intents_and_logs(self):
+        provider = create_provider()
+        create_appointment(provider, stripe_payment_intent_id='pi_old')
+        url = reverse('admin:appointments_provider_change', args=[provider.pk])
+
+        with mock.patch('appointments.tasks.stripe.PaymentIntent.cancel') as cancel:
+            self.client.post(url, {
+                'name': provider.name,
+                'specialty': provider.specialty,
+                'consultation_price': '120.00',
+                'follow_up_price': '30.00',
+                'is_active': 'on',
+                'reprice_pending': 'on',
+                'price_rules-TOTAL_FORMS': '0',
+                'price_rules-INITIAL_FORMS': '0',
+            })
+
+        cancel.assert_called_once_with('pi_old', api_key=mock.ANY)
+        self.assertEqual(Appointment.objects.get().amount_paid, Decimal('120.00'))
+        self.assertTrue(LogEntry.objects.filter(change_message__startswith='Repriced').exists())
+
+
+    def test_stale_intent_that_already_succeeded_is_refunded(self):
+        provider = create_provider()
+        create_appointment(provider, stripe_payment_intent_id='pi_paid')
+        create_appointment(provider, stripe_payment_intent_id='pi_abandoned')
+
+        def cancel(payment_intent_id, **kwargs):
+            raise stripe.error.InvalidRequestError('cannot cancel', None)
+
+        def retrieve(payment_intent_id, **kwargs):
+            status = 'succeeded' if payment_intent_id == 'pi_paid' else 'canceled'
+            return SimpleNamespace(id=payment_intent_id, status=status)
+
+        with mock.patch('appointments.tasks.stripe.PaymentIntent.cancel', side_effect=cancel), \
+                mock.patch('appointments.tasks.stripe.PaymentIntent.retrieve', side_effect=retrieve), \
+                mock.patch('appointments.tasks.stripe.Refund.create') as refund:
+            provider.consultation_price = Decimal('99.00')
+            provider.save()
+            _, intent_ids = provider.reprice_pending_appointments(['consultation'])
+            cancel_payment_intents(intent_ids)
+
+        refund.assert_called_once_with(
+            payment_intent='pi_paid', idempotency_key='pi_paid-stale-refund', api_key=mock.ANY,
+        )
+
+class AppointmentArchiveTests(AdminTestCase):
+    """Old completed appointments move to the archive and stay readable."""
+
+    def test_archive_command_moves_only_old_finished_rows(self):
+        provider = create_provider('Dr. Archive')
+        old_paid = create_appointment(provider, days_ahead=-400, status=Appointment.STATUS_COMPLETED, is_paid=True)
+        old_cancelled = create_appointment(provider, days_ahead=-400, status=Appointment.STATUS_CANCELLED)
+        old_unpaid = create_appointment(provider, days_ahead=-400)
+        recent = create_appointment(provider, days_ahead=-5, status=Appointment.STATUS_COMPLETED, is_paid=True)
+
+        call_command('archive_appointments', older_than=365, batch_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            set(Appointment.objects.values_list('pk', flat=True)), {old_unpaid.pk, recent.pk}
+        )
+        archived = AppointmentArchive.objects.get(pk=old_paid.pk)
+        self.assertEqual(archived.provider_name, 'Dr. Archive')
+        self.assertEqual(archived.created_at, old_paid.created_at)
+        self.assertTrue(AppointmentArchive.objects.filter(pk=old_cancelled.pk).exists())
+
+    def test_export_unions_archive_when_asked(self):
+        provider = create_provider()
+        create_appointment(
+            provider, days_ahead=-400, status=Appointment.STATUS_COMPLETED, client_email='me@example.com'
+        )
+        create_appointment(provider, client_email='me@example.com')
+        call_command('archive_appointments', older_than=365, stdout=StringIO())
+
+        url = reverse('export_appointments')
+        hot_only = b''.join(self.client.get(url, {'email': 'me@example.com'}).streaming_content)
+        with_archive = b''.join(self.client.get(
+            url, {'email': 'me@example.com', 'include_archive': '1'}
+        ).streaming_content)
+        # Header plus one row vs. header plus both rows
+        self.assertEqual(len(hot_only.splitlines()), 2)
+        self.assertEqual(len(with_archive.splitlines()), 3)
+
+    def test_patient_pages_still_serve_archived_appointments(self):
+        appointment = create_appointment(
+            create_provider('Dr. Archive'), days_ahead=-400, status=Appointment.STATUS_COMPLETED, is_paid=True
+        )
+        call_command('archive_appointments', older_than=365, stdout=StringIO())
+        self.assertFalse(Appointment.objects.filter(pk=appointment.pk).exists())
+
+        response = self.client.get(reverse('appointment_success', args=[appointment.pk]))
+        self.assertContains(response, 'This appointment has been archived')
+        self.assertContains(response, 'Dr. Archive')
+        self.assertNotContains(response, reverse('calendar_connect', args=[appointment.pk]))
+
+        response = self.client.get(reverse('download_calendar_file', args=[appointment.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'UID:appointment-{appointment.pk}@', response.content.decode())
+
+        response = self.client.get(reverse('calendar_connect', args=[appointment.pk]))
+        self.assertRedirects(response, reverse('appointment_success', args=[appointment.pk]))
+        self.assertFalse(Appointment.objects.filter(pk=appointment.pk).exists())
+
+        self.assertEqual(self.client.get(reverse('appointment_success', args=[appointment.pk + 1])).status_code, 404)
+
+
+class AppointmentStatusTests(TestCase):
+    """Persisted status follows the state machine and is swept in bulk."""
+
+    def test_transitions_are_enforced(self):
+        appointment = create_appointment(create_provider())
+        self.assertEqual(appointment.status, Appointment.STATUS_PENDING_PAYMENT)
+
+        appointment.transition_to(Appointment.STATUS_CONFIRMED)
+        self.assertTrue(appointment.is_paid)
+        with self.assertRaises(ValidationError):
+            appointment.transition_to(Appointment.STATUS_PENDING_PAYMENT)
+
+        appointment.transition_to(Appointment.STATUS_CANCELLED)
+        self.assertIsNotNone(appointment.cancelled_at)
+        with self.assertRaises(ValidationError):
+            appointment.transition_to(Appointment.STATUS_CONFIRMED)
+
+    def test_queryset_transition_skips_ineligible_rows(self):
+        provider = create_provider()
+        pending = create_appointment(provider)
+        cancelled = create_appointment(provider, status=Appointment.STATUS_CANCELLED)
+
+        updated = Appointment.objects.transition(Appointment.STATUS_CONFIRMED)
+
+        self.assertEqual(updated, 1)
+        pending.refresh_from_db()
+        cancelled.refresh_from_db()
+        self.assertEqual(pending.status, Appointment.STATUS_CONFIRMED)
+        self.assertEqual(cancelled.status, Appointment.STATUS_CANCELLED)
+
+    def test_complete_past_appointments_flips_ended_confirmed_only(self):
+        provider = create_provider()
+        ended = create_appointment(provider, days_ahead=-1, is_paid=True)
+        upcoming = create_appointment(provider, days_ahead=1, is_paid=True)
+        unpaid = create_appointment(provider, days_ahead=-1)
+
+        with mock.patch('appointments.tasks.COMPLETION_BATCH_SIZE', 1):
+            self.assertEqual(complete_past_appointments(), 1)
+
+        statuses = dict(Appointment.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[ended.pk], Appointment.STATUS_COMPLETED)
+        self.assertEqual(statuses[upcoming.pk], Appointment.STATUS_CONFIRMED)
+        self.assertEqual(statuses[unpaid.pk], Appointment.STATUS_PENDING_PAYMENT)
+
+
+class PricingEngineTests(TestCase):
+    """Price rules are compiled once per provider and applied to whole batches."""
+
+    def slot(self, days_ahead, hour):
+        day = timezone.localdate() + timedelta(days=days_ahead)
+        return timezone.make_aware(datetime.combine(day, time(hour)))
+
+    def test_falls_back_to_base_and_default_prices(self):
+        provider = create_provider(consultation_price=Decimal('80.00'))
+
+        self.assertEqual(quote(provider, 'consultation', [self.slot(1, 9)]), [Decimal('80.00')])
+        self.assertEqual(quote(None, 'follow_up', [self.slot(1, 9)]), [DEFAULT_PRICES['follow_up']])
+
+    def test_time_of_day_date_range_and_priority(self):
+        provider = create_provider()
+        PriceRule.objects.create(provider=provider, start_time=time(18), end_time=time(22), price=Decimal('70.00'))
+        PriceRule.objects.create(
+            provider=provider,
+            appointment_type='consultation',
+            valid_from=timezone.localdate() + timedelta(days=5),
+            valid_until=timezone.localdate() + timedelta(days=6),
+            price=Decimal('40.00'),
+            priority=10,
+        )
+
+        prices = quote(provider, 'consultation', [
+            self.slot(1, 9), self.slot(1, 19), self.slot(5, 19), self.slot(7, 19),
+        ])
+
+        self.assertEqual(prices, [Decimal('50.00'), Decimal('70.00'), Decimal('40.00'), Decimal('70.00')])
+        self.assertEqual(quote(provider, 'follow_up', [self.slot(5, 19)]), [Decimal('70.00')])
+
+    def test_batch_quote_uses_compiled_rules(self):
+        provider = create_provider()
+        PriceRule.objects.create(provider=provider, start_time=time(8), end_time=time(12), price=Decimal('65.00'))
+        provider.refresh_from_db()
+        times = [self.slot(1, 0) + timedelta(minutes=15 * i) for i in range(5000)]
+
+        quote(provider, 'consultation', times[:1])
+        with self.assertNumQueries(0):
+            prices = quote(provider, 'consultation', times)
+
+        self.assertEqual(len(prices), 5000)
+        self.assertEqual(prices[8 * 4], Decimal('65.00'))
+        self.assertEqual(prices[12 * 4], Decimal('50.00'))
+
+    def test_rule_changes_invalidate_compiled_pricing(self):
+        provider = create_provider()
+        self.assertEqual(quote(provider, 'consultation', [self.slot(1, 9)]), [Decimal('50.00')])
+
+        rule = PriceRule.objects.create(provider=provider, price=Decimal('55.00'))
+        self.assertEqual(quote(provider, 'consultation', [self.slot(1, 9)]), [Decimal('55.00')])
+
+        rule.delete()
+        self.assertEqual(quote(provider, 'consultation', [self.slot(1, 9)]), [Decimal('50.00')])
+
+    def test_reprice_applies_rules_per_slot(self):
+        provider = create_provider()
+        PriceRule.objects.create(provider=provider, start_time=time(18), end_time=time(22), price=Decimal('70.00'))
+        morning = Appointment.objects.create(provider=provider, appointment_time=self.slot(2, 9), client_email='a@example.com')
+        evening = Appointment.objects.create(provider=provider, appointment_time=self.slot(2, 19), client_email='b@example.com')
+        self.assertEqual(evening.amount_paid, Decimal('70.00'))
+
+        provider.refresh_from_db()
+        provider.consultation_price = Decimal('60.00')
+        provider.save()
+        provider.reprice_pending_appointments(['consultation'])
+
+        morning.refresh_from_db()
+        evening.refresh_from_db()
+        self.assertEqual(morning.amount_paid, Decimal('60.00'))
+        self.assertEqual(evening.amount_paid, Decimal('70.00'))
+
+    def test_quote_endpoint_prices_multiple_slots(self):
+        provider = create_provider()
+        PriceRule.objects.create(provider=provider, start_time=time(18), end_time=time(22), price=Decimal('70.00'))
+
+        response = self.client.get(reverse('price_quote'), {
+            'provider': provider.pk,
+            'type': 'consultation',
+            'time': [self.slot(1, 9).isoformat(), self.slot(1, 19).isoformat()],
+        })
+
+        self.assertEqual(response.json()['prices'], [50.0, 70.0])
+
+    def test_quote_endpoint_rejects_bad_input_with_400(self):
+        provider = create_provider()
+        url = reverse('price_quote')
+
+        for params in (
+            {'provider': 'abc', 'time': '2030-01-07T10:00'},
+            {'time': '2030-01-07T10:00'},
+            {'provider': provider.pk, 'time': '2030-02-30T10:00'},
+            {'provider': provider.pk, 'time': 'tomorrow'},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+
+class ProviderDirectoryTests(TestCase):
+    """The provider directory API searches, pages and caches providers for the booking form."""
+
+    url = reverse('provider_directory')
+
+    def setUp(self):
+        caches[settings.PROVIDER_DIRECTORY_CACHE_ALIAS].clear()
+        self.smith = create_provider('Dr. Jane Smith', specialty='cardiology', consultation_price=Decimal('120.00'))
+        create_provider('Dr. Adam Smithers', consultation_price=Decimal('60.00'))
+        create_provider('Dr. Bob Jones', specialty='cardiology', consultation_price=Decimal('90.00'))
+        create_provider('Smith Clinic Team')
+        create_provider('Dr. Old Smith', is_active=False)
+
+    def names(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [provider['name'] for provider in response.json()['results']]
+
+    def test_search_and_filters(self):
+        self.assertEqual(self.names(q='smi'), ['Dr. Adam Smithers', 'Dr. Jane Smith', 'Smith Clinic Team'])
+        self.assertEqual(self.names(q='ITH'), [])
+        self.assertEqual(self.names(specialty='cardiology'), ['Dr. Bob Jones', 'Dr. Jane Smith'])
+        self.assertEqual(self.names(specialty='cardiology', min_price='100'), ['Dr. Jane Smith'])
+        self.assertEqual(self.names(max_price='60', type='consultation'), ['Dr. Adam Smithers', 'Smith Clinic Team'])
+
+    def test_keyset_pages_cover_every_provider_once(self):
+        names, after = [], ''
+        while True:
+            with self.assertNumQueries(1):
+                page = self.client.get(self.url, {'limit': 2, 'after': after}).json()
+            names += [provider['name'] for provider in page['results']]
+            if not page['next']:
+                break
+            after = page['next']
+        self.assertEqual(names, ['Dr. Adam Smithers', 'Dr. Bob Jones', 'Dr. Jane Smith', 'Smith Clinic Team'])
+
+    def test_pages_are_cached_until_a_provider_changes(self):
+        with self.assertNumQueries(1):
+            first = self.client.get(self.url, {'q': 'jane'})
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, {'q': 'jane'})
+        self.assertEqual(cached.json(), first.json())
+        response = self.client.get(self.url, {'q': 'jane'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self.smith.consultation_price = Decimal('150.00')
+        self.smith.save()
+        response = self.client.get(self.url, {'q': 'jane'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['consultation'], 150.0)
+
+    def test_invalid_parameters_are_rejected(self):
+        for params in [{'specialty': 'astrology'}, {'min_price': 'cheap'}, {'after': 'not-a-cursor'}, {'type': 'x'}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_booking_form_only_renders_the_chosen_provider(self):
+        response = self.client.get(reverse('create_appointment'))
+        self.assertNotContains(response, 'Dr. Bob Jones')
+
+        response = self.client.post(reverse('create_appointment'), {'provider': self.smith.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'data-consultation="120.00"')
+        self.assertNotContains(response, 'Dr. Bob Jones')
+
+
+class WaitlistTests(AdminTestCase):
+    """Freed slots are offered to waiting patients as held bookings."""
+
+    def setUp(self):
+        super().setUp()
+        self.provider = create_provider('Dr. Heart', specialty='cardiology')
+        self.now = timezone.now()
+
+    def join(self, email, provider=None, specialty='', days=(1, 30)):
+        return WaitlistEntry.objects.create(
+            provider=provider,
+            specialty=specialty,
+            client_email=email,
+            window_start=self.now + timedelta(days=days[0]),
+            window_end=self.now + timedelta(days=days[1]),
+        )
+
+    def freed_slot(self, days_ahead=7, hours=0):
+        appointment = create_appointment(self.provider, days_ahead=days_ahead)
+        if hours:
+            appointment.appointment_time += timedelta(hours=hours)
+            appointment.save()
+        Appointment.objects.filter(pk=appointment.pk).transition(Appointment.STATUS_CANCELLED)
+        return appointment
+
+    def test_slots_go_to_the_longest_waiting_patient(self):
+        first = self.join('first@example.com', specialty='cardiology')
+        second = self.join('second@example.com', provider=self.provider)
+        outside = self.join('outside@example.com', provider=self.provider, days=(20, 30))
+        slots = [self.freed_slot(days_ahead=5), self.freed_slot(days_ahead=6)]
+
+        held_ids = offer_freed_slots([slot.pk for slot in slots])
+
+        self.assertEqual(len(held_ids), 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        outside.refresh_from_db()
+        self.assertEqual(first.offered_appointment.appointment_time, slots[0].appointment_time)
+        self.assertEqual(second.offered_appointment.appointment_time, slots[1].appointment_time)
+        self.assertEqual(outside.status, WaitlistEntry.STATUS_WAITING)
+        held = first.offered_appointment
+        self.assertEqual((held.client_email, held.status), ('first@example.com', Appointment.STATUS_PENDING_PAYMENT))
+        self.assertEqual(held.amount_paid, self.provider.consultation_price)
+        self.assertEqual(first.status, WaitlistEntry.STATUS_OFFERED)
+        self.assertIsNotNone(first.hold_expires_at)
+
+    def test_rebooked_slots_are_not_offered(self):
+        self.join('waiting@example.com', provider=self.provider)
+        slot = self.freed_slot()
+        Appointment.objects.create(
+            provider=self.provider, appointment_time=slot.appointment_time, client_email='other@example.com',
+        )
+
+        self.assertEqual(offer_freed_slots([slot.pk]), [])
+
+    def test_matching_cost_does_not_grow_with_the_burst(self):
+        for i in range(40):
+            if i % 2:
+                self.join(f'p{i}@example.com', specialty='cardiology')
+            else:
+                self.join(f'p{i}@example.com', provider=self.provider)
+        small = [self.freed_slot(days_ahead=day).pk for day in (2, 3)]
+        large = [self.freed_slot(days_ahead=4, hours=hour).pk for hour in range(30)]
+
+        with CaptureQueriesContext(connection) as small_run:
+            offer_freed_slots(small)
+        with CaptureQueriesContext(connection) as large_run:
+            self.assertEqual(len(offer_freed_slots(large)), 30)
+        self.assertLessEqual(len(large_run.captured_queries), len(small_run.captured_queries))
+
+    def test_expired_holds_go_to_the_next_patient(self):
+        first = self.join('first@example.com', provider=self.provider)
+        paid = self.join('paid@example.com', specialty='cardiology')
+        second = self.join('second@example.com', provider=self.provider)
+        slot = self.freed_slot()
+        other = self.freed_slot(days_ahead=8)
+        offer_freed_slots([slot.pk, other.pk])
+        paid.refresh_from_db()
+        paid.offered_appointment.transition_to(Appointment.STATUS_CONFIRMED)
+        paid.offered_appointment.save()
+        WaitlistEntry.objects.update(hold_expires_at=self.now - timedelta(minutes=1))
+
+        expire_waitlist_holds()
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        paid.refresh_from_db()
+        self.assertEqual(first.status, WaitlistEntry.STATUS_EXPIRED)
+        self.assertEqual(first.offered_appointment.status, Appointment.STATUS_CANCELLED)
+        self.assertEqual(paid.status, WaitlistEntry.STATUS_BOOKED)
+        self.assertEqual(second.status, WaitlistEntry.STATUS_OFFERED)
+        self.assertEqual(second.offered_appointment.appointment_time, slot.appointment_time)
+
+    def test_admin_cancellation_offers_the_slot(self):
+        entry = self.join('waiting@example.com', provider=self.provider)
+        appointment = create_appointment(self.provider)
+
+        self.client.post(reverse('admin:appointments_appointment_changelist'), {
+            'action': 'cancel_appointments',
+            '_selected_action': [appointment.pk],
+        })
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, WaitlistEntry.STATUS_OFFERED)
+        offers = [message for message in mail.outbox if 'Appointment Available' in message.subject]
+        self.assertEqual([message.to for message in offers], [['waiting@example.com']])
+
+    def test_lapsed_hold_cannot_be_paid_for(self):
+        entry = self.join('late@example.com', provider=self.provider)
+        offer_freed_slots([self.freed_slot().pk])
+        entry.refresh_from_db()
+        held = entry.offered_appointment
+        Appointment.objects.filter(pk=held.pk).update(stripe_payment_intent_id='pi_hold')
+        WaitlistEntry.objects.filter(pk=entry.pk).update(hold_expires_at=self.now - timedelta(minutes=1))
+        intent = SimpleNamespace(id='pi_hold', status='succeeded')
+        client = mock.Mock()
+        client.v1.payment_intents.create_async = mock.AsyncMock(return_value=intent)
+        client.v1.payment_intents.retrieve_async = mock.AsyncMock(return_value=intent)
+
+        with mock.patch('appointments.views.get_stripe_client', return_value=client), \
+                mock.patch('stripe.Refund.create') as refund:
+            page = self.client.get(reverse('appointment_payment', args=[held.pk]))
+            confirm = self.client.post(reverse('confirm_payment', args=[held.pk]))
+
+        self.assertRedirects(page, reverse('appointment_success', args=[held.pk]), fetch_redirect_response=False)
+        client.v1.payment_intents.create_async.assert_not_called()
+        self.assertRedirects(confirm, reverse('appointment_success', args=[held.pk]), fetch_redirect_response=False)
+        held.refresh_from_db()
+        self.assertEqual((held.status, held.is_paid), (Appointment.STATUS_CANCELLED, True))
+        refund.assert_called_once_with(
+            payment_intent='pi_hold', amount=int(held.amount_paid * 100),
+            idempotency_key=f'appointment-{held.pk}-refund', api_key=mock.ANY,
+        )
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, WaitlistEntry.STATUS_EXPIRED)
+        self.assertFalse([message for message in mail.outbox if 'Confirmed' in message.subject])
+
+    def test_offer_links_to_the_clinics_payment_page(self):
+        east = Clinic.objects.create(name='East', slug='east')
+        provider = create_provider('Dr. East', clinic=east)
+        held = create_appointment(provider, status=Appointment.STATUS_PENDING_PAYMENT)
+
+        send_waitlist_offers([held.pk])
+
+        payment_url = f"http://127.0.0.1:8000/c/east/appointments/{held.pk}/payment/"
+        message = mail.outbox[-1]
+        self.assertIn(payment_url, message.body)
+        self.assertIn(payment_url, message.alternatives[0][0])
+
+    def test_patients_can_join_from_the_site(self):
+        window_start = (self.now + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M')
+        window_end = (self.now + timedelta(days=3)).strftime('%Y-%m-%dT%H:%M')
+        response = self.client.post(reverse('join_waitlist'), {
+            'specialty': 'cardiology',
+            'appointment_type': 'consultation',
+            'client_email': 'new@example.com',
+            'window_start': window_start,
+            'window_end': window_end,
+        })
+        self.assertRedirects(response, reverse('join_waitlist'))
+        entry = WaitlistEntry.objects.get()
+        self.assertEqual(entry.clinic, Clinic.objects.get())
+
+        response = self.client.post(reverse('join_waitlist'), {
+            'appointment_type': 'consultation',
+            'client_email': 'new@example.com',
+            'window_start': window_start,
+            'window_end': window_end,
+        })
+        self.assertContains(response, 'Choose a provider or a specialty.')
+
+
+class AppointmentSeriesTests(TestCase):
+    """Recurring series are checked, priced and booked in a constant number of queries."""
+
+    def setUp(self):
+        self.provider = create_provider('Dr. Mind', specialty='psychiatry')
+        self.first = (timezone.now() + timedelta(days=2)).replace(hour=10, minute=0, second=0, microsecond=0)
+
+    def series(self, provider=None, occurrences=4, **kwargs):
+        return AppointmentSeries(
+            provider=provider or self.provider,
+            client_email='patient@example.com',
+            first_appointment_time=self.first,
+            occurrences=occurrences,
+            **kwargs
+        )
+
+    @override_settings(TIME_ZONE='America/New_York')
+    def test_sessions_keep_local_time_across_dst(self):
+        first = timezone.make_aware(datetime(2026, 10, 26, 17, 0))
+        times = expand(AppointmentSeries(first_appointment_time=first, occurrences=3, interval_weeks=1))
+        self.assertEqual([timezone.localtime(t).hour for t in times], [17, 17, 17])
+        self.assertEqual(times[2].astimezone(dt_timezone.utc) - times[0].astimezone(dt_timezone.utc), timedelta(days=14, hours=1))
+
+    def test_books_every_session_priced_in_one_go(self):
+        PriceRule.objects.create(
+            provider=self.provider, appointment_type='follow_up',
+            valid_from=(self.first + timedelta(weeks=2)).date(), price=Decimal('75.00'),
+        )
+        appointments = book_series(self.series(interval_weeks=2))
+
+        saved = list(Appointment.objects.filter(series__isnull=False).order_by('appointment_time'))
+        self.assertEqual([a.pk for a in saved], [a.pk for a in appointments])
+        self.assertEqual([a.appointment_time for a in saved], [self.first + timedelta(weeks=2 * i) for i in range(4)])
+        self.assertEqual([a.amount_paid for a in saved], [self.provider.follow_up_price] + [Decimal('75.00')] * 3)
+        self.assertEqual({a.clinic_id for a in saved}, {self.provider.clinic_id})
+
+    def test_conflicting_session_books_nothing(self):
+        Appointment.objects.create(
+            provider=self.provider, client_email='other@example.com',
+            appointment_time=self.first + timedelta(weeks=2, minutes=30),
+        )
+
+        with self.assertRaises(ValidationError):
+            book_series(self.series())
+        self.assertFalse(AppointmentSeries.objects.exists())
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_query_count_does_not_grow_with_the_series(self):
+        other = create_provider('Dr. Bones')
+        with CaptureQueriesContext(connection) as short:
+            book_series(self.series(occurrences=2))
+        with CaptureQueriesContext(connection) as long:
+            book_series(self.series(provider=other, occurrences=20))
+        self.assertEqual(len(long.captured_queries), len(short.captured_queries))
+
+    def book_and_pay(self, intent):
+        response = self.client.post(reverse('create_series'), {
+            'provider': self.provider.pk,
+            'first_appointment_time': self.first.strftime('%Y-%m-%dT%H:%M'),
+            'interval_weeks': 1,
+            'occurrences': 3,
+            'client_email': 'patient@example.com',
+            'appointment_type': 'follow_up',
+        })
+        series = AppointmentSeries.objects.get()
+        self.assertRedirects(response, reverse('series_payment', args=[series.pk]), fetch_redirect_response=False)
+
+        client = mock.Mock()
+        client.v1.payment_intents.create_async = mock.AsyncMock(return_value=intent)
+        client.v1.payment_intents.retrieve_async = mock.AsyncMock(return_value=intent)
+        with mock.patch('appointments.views.get_stripe_client', return_value=client):
+            self.client.get(reverse('series_payment', args=[series.pk]))
+            response = self.client.post(reverse('confirm_series_payment', args=[series.pk]))
+        return series, client, response
+
+    def test_one_payment_covers_the_series(self):
+        total = 3 * int(self.provider.follow_up_price * 100)
+        series, client, response = self.book_and_pay(
+            SimpleNamespace(id='pi_series', status='succeeded', amount=total)
+        )
+
+        client.v1.payment_intents.create_async.assert_called_once()
+        params = client.v1.payment_intents.create_async.call_args.kwargs['params']
+        self.assertEqual(params['amount'], total)
+        appointments = Appointment.objects.filter(series=series)
+        self.assertEqual(set(appointments.values_list('status', 'stripe_payment_intent_id')), {
+            (Appointment.STATUS_CONFIRMED, 'pi_series'),
+        })
+        self.assertEqual(len(mail.outbox), 3)
+
+    def assert_not_confirmed(self, series, response):
+        self.assertRedirects(response, reverse('series_payment', args=[series.pk]), fetch_redirect_response=False)
+        self.assertEqual(
+            set(Appointment.objects.filter(series=series).values_list('status', flat=True)),
+            {Appointment.STATUS_PENDING_PAYMENT},
+        )
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_unfinished_payment_does_not_confirm_the_series(self):
+        total = 3 * int(self.provider.follow_up_price * 100)
+        series, client, response = self.book_and_pay(
+            SimpleNamespace(id='pi_series', status='requires_payment_method', amount=total)
+        )
+        self.assert_not_confirmed(series, response)
+
+    def test_short_or_over_payment_does_not_confirm_the_series(self):
+        total = 3 * int(self.provider.follow_up_price * 100)
+        for amount in (total - 1, total + 1):
+            with self.subTest(amount=amount):
+                series, client, response = self.book_and_pay(
+                    SimpleNamespace(id='pi_series', status='succeeded', amount=amount)
+                )
+                self.assert_not_confirmed(series, response)
+                Appointment.objects.filter(series=series).delete()
+                series.delete()
+
+    def test_sessions_cancelled_during_payment_are_refunded(self):
+        price = int(self.provider.follow_up_price * 100)
+        intent = SimpleNamespace(id='pi_series', status='requires_payment_method', amount=3 * price)
+        client = mock.Mock()
+        client.v1.payment_intents.create_async = mock.AsyncMock(return_value=intent)
+        client.v1.payment_intents.retrieve_async = mock.AsyncMock(return_value=intent)
+        self.client.post(reverse('create_series'), {
+            'provider': self.provider.pk,
+            'first_appointment_time': self.first.strftime('%Y-%m-%dT%H:%M'),
+            'interval_weeks': 1,
+            'occurrences': 3,
+            'client_email': 'patient@example.com',
+            'appointment_type': 'follow_up',
+        })
+        series = AppointmentSeries.objects.get()
+        with mock.patch('appointments.views.get_stripe_client', return_value=client):
+            self.client.get(reverse('series_payment', args=[series.pk]))
+        first = Appointment.objects.filter(series=series).order_by('appointment_time').first()
+        # Cancelled in bulk while the payment page is open, then paid at the old total
+        with mock.patch('stripe.Refund.create'):
+            call_command('cancel_provider_schedule', self.provider.pk, start=first.appointment_time.isoformat(), stdout=StringIO())
+        intent.status = 'succeeded'
+
+        with mock.patch('appointments.views.get_stripe_client', return_value=client), \
+                mock.patch('stripe.Refund.create') as refund:
+            response = self.client.post(reverse('confirm_series_payment', args=[series.pk]))
+
+        self.assertRedirects(response, reverse('appointment_success', args=[first.pk]), fetch_redirect_response=False)
+        statuses = dict(Appointment.objects.filter(series=series).values_list('pk', 'status'))
+        self.assertEqual(statuses.pop(first.pk), Appointment.STATUS_CANCELLED)
+        self.assertEqual(set(statuses.values()), {Appointment.STATUS_CONFIRMED})
+        refund.assert_called_once_with(
+            payment_intent='pi_series', amount=price,
+            idempotency_key=f'appointment-{first.pk}-refund', api_key=mock.ANY,
+        )
+
+    def test_intent_follows_the_unpaid_total(self):
+        price = int(self.provider.follow_up_price * 100)
+        series, client, _ = self.book_and_pay(
+            SimpleNamespace(id='pi_series', status='requires_payment_method', amount=3 * price)
+        )
+        first = Appointment.objects.filter(series=series).order_by('appointment_time').first()
+        Appointment.objects.filter(pk=first.pk).transition(Appointment.STATUS_CANCELLED)
+        client.v1.payment_intents.update_async = mock.AsyncMock(
+            return_value=SimpleNamespace(id='pi_series', status='requires_payment_method', amount=2 * price)
+        )
+
+        with mock.patch('appointments.views.get_stripe_client', return_value=client):
+            response = self.client.get(reverse('series_payment', args=[series.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        client.v1.payment_intents.update_async.assert_called_once_with(
+            'pi_series', params={'amount': 2 * price, 'metadata': {'sessions': 2}},
+        )
+
+class SQLiteTuningTests(TestCase):
+    """Connections get the configured pragmas; nested write transactions stay plain."""
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_to_connection(self):
+        self.assertEqual(self.pragma('busy_timeout'), settings.SQLITE_BUSY_TIMEOUT_MS)
+        self.assertEqual(self.pragma('cache_size'), -settings.SQLITE_CACHE_SIZE_KB)
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+
+    def test_write_transaction_nests_inside_atomic(self):
+        provider = create_provider()
+        with CaptureQueriesContext(connection) as context:
+            with write_transaction():
+                create_appointment(provider)
+        self.assertFalse(any('IMMEDIATE' in query['sql'] for query in context.captured_queries))
+        self.assertEqual(Appointment.objects.count(), 1)
+
+
+class WriteTransactionConcurrencyTests(TransactionTestCase):
+    """write_transaction takes the write lock up front, so a second writer waits instead of failing."""
+
+    ALIAS = 'write_lock_test'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # A file database: in-memory test databases don't lock like the real one
+        cls.db_dir = tempfile.TemporaryDirectory()
+        connections.settings = connections.configure_settings({
+            **connections.settings,
+            cls.ALIAS: {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(cls.db_dir.name, 'writes.sqlite3'),
+            },
+        })
+        call_command('migrate', database=cls.ALIAS, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[cls.ALIAS].close()
+        del connections[cls.ALIAS]
+        del connections.settings[cls.ALIAS]
+        cls.db_dir.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        # Not one of the test case's databases, so nothing flushes it between tests
+        Provider.objects.using(self.ALIAS).all().delete()
+
+    def add_provider(self, name):
+        Provider(name=name).save(using=self.ALIAS)
+
+    def in_thread(self, target):
+        """Run target on its own connection (connections are per thread)."""
+        def run():
+            try:
+                target()
+            finally:
+                connections.close_all()
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_issues_begin_immediate(self):
+        with CaptureQueriesContext(connections[self.ALIAS]) as context:
+            with write_transaction(using=self.ALIAS):
+                self.add_provider('Dr. Immediate')
+        self.assertEqual(context.captured_queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+    def test_second_writer_waits_for_the_lock(self):
+        holding = threading.Event()
+
+        def hold_lock():
+            with write_transaction(using=self.ALIAS):
+                self.add_provider('Dr. First')
+                holding.set()
+                time_module.sleep(0.3)
+
+        thread = self.in_thread(hold_lock)
+        holding.wait(5)
+        started = time_module.perf_counter()
+        # Read then write, the pattern that fails in a deferred transaction
+        with write_transaction(using=self.ALIAS):
+            existing = Provider.objects.using(self.ALIAS).count()
+            self.add_provider('Dr. Second')
+        waited = time_module.perf_counter() - started
+        thread.join()
+
+        self.assertEqual(existing, 1)
+        self.assertGreaterEqual(waited, 0.2)
+        self.assertEqual(Provider.objects.using(self.ALIAS).count(), 2)
+
+    def test_deferred_read_then_write_fails_without_it(self):
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            with transaction.atomic(using=self.ALIAS):
+                # The read pins this transaction's snapshot...
+                Provider.objects.using(self.ALIAS).count()
+                # ...another writer commits after it...
+                self.in_thread(lambda: self.add_provider('Dr. Other')).join()
+                # ...so this write can't upgrade to the write lock, however long it waits
+                self.add_provider('Dr. Late')
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """Analytics reads go to a replica SQLite file until the session writes."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Registered after the test case setup so queries to it aren't blocked
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        connections.settings = connections.configure_settings({
+            **connections.settings,
+            REPLICA_ALIAS: {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(cls.replica_dir.name, 'replica.sqlite3'),
+            },
+        })
+        call_command('migrate', database=REPLICA_ALIAS, verbosity=0)
+        # Rows that only exist on the replica
+        replica_provider = Provider(name='Dr. Replica')
+        replica_provider.save(using=REPLICA_ALIAS)
+        for i in range(2):
+            Appointment(
+                provider=replica_provider,
+                appointment_time=timezone.now() + timedelta(days=1, hours=i),
+                client_email=f'replica{i}@example.com',
+            ).save(using=REPLICA_ALIAS)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA_ALIAS].close()
+        del connections[REPLICA_ALIAS]
+        del connections.settings[REPLICA_ALIAS]
+        cls.replica_dir.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+    def test_dashboard_and_export_read_from_replica(self):
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.context['total_appointments'], 2)
+
+        response = self.client.get(reverse('export_appointments'))
+        self.assertIn('replica0@example.com', b''.join(response.streaming_content).decode())
+
+    def test_write_pins_session_to_primary(self):
+        provider = create_provider()
+        self.client.post(reverse('create_appointment'), {
+            'provider': provider.pk,
+            'appointment_time': (timezone.localtime() + timedelta(days=2)).strftime('%Y-%m-%dT%H:%M'),
+            'client_email': 'primary@example.com',
+            'appointment_type': 'consultation',
+        })
+        self.assertEqual(Appointment.objects.using('default').count(), 1)
+
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.context['total_appointments'], 1)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver', 'north.example.com'])
+class TenantDatabaseTests(TransactionTestCase):
+    """Clinics resolve from host or /c/<slug>/ and keep their rows on their own SQLite files."""
+
+    TENANT_ALIASES = ['clinic_north', 'clinic_south']
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Registered after the test case setup so queries to them aren't blocked
+        cls.tenant_dir = tempfile.TemporaryDirectory()
+        connections.settings = connections.configure_settings({
+            **connections.settings,
+            **{
+                alias: {
+                    'ENGINE': 'django.db.backends.sqlite3',
+                    'NAME': os.path.join(cls.tenant_dir.name, f'{alias}.sqlite3'),
+                }
+                for alias in cls.TENANT_ALIASES
+            },
+        })
+        for alias in cls.TENANT_ALIASES:
+            call_command('migrate', database=alias, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in cls.TENANT_ALIASES:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.tenant_dir.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.north = Clinic.objects.create(
+            name='North', slug='north', domain='north.example.com', database='clinic_north'
+        )
+        self.south = Clinic.objects.create(name='South', slug='south', database='clinic_south')
+        # Shares the default database with the default clinic
+        self.east = Clinic.objects.create(name='East', slug='east')
+
+    def tearDown(self):
+        # Only the default database is flushed between tests
+        for alias in self.TENANT_ALIASES:
+            Appointment.objects.using(alias).all().delete()
+            AppointmentArchive.objects.using(alias).all().delete()
+            Provider.objects.using(alias).all().delete()
+            # Restart primary keys, as a flush would, so ids line up across clinic databases
+            with connections[alias].cursor() as cursor:
+                cursor.execute("DELETE FROM sqlite_sequence")
+
+    def book(self, provider, path_prefix='', **extra):
+        return self.client.post(path_prefix + reverse('create_appointment'), {
+            'provider': provider.pk,
+            'appointment_time': (timezone.localtime() + timedelta(days=2)).strftime('%Y-%m-%dT%H:%M'),
+            'client_email': 'patient@example.com',
+            'appointment_type': 'consultation',
+        }, **extra)
+
+    def test_bookings_land_in_the_clinic_database(self):
+        with tenant_database(self.north.database):
+            north_provider = create_provider('Dr. North', clinic=self.north)
+        with tenant_database(self.south.database):
+            south_provider = create_provider('Dr. South', clinic=self.south)
+        self.assertEqual(north_provider._state.db, 'clinic_north')
+        self.assertEqual(south_provider._state.db, 'clinic_south')
+
+        response = self.book(north_provider, HTTP_HOST='north.example.com')
+        self.assertEqual(response.status_code, 302)
+        response = self.book(south_provider, path_prefix='/c/south')
+        # Redirects keep the clinic's URL prefix
+        self.assertTrue(response['Location'].startswith('/c/south/appointments/'))
+
+        self.assertEqual(Appointment.objects.using('clinic_north').get().clinic_id, self.north.pk)
+        self.assertEqual(Appointment.objects.using('clinic_south').get().clinic_id, self.south.pk)
+        self.assertFalse(Appointment.objects.using('default').exists())
+
+    def test_clinics_only_see_their_own_rows(self):
+        with tenant_database(self.north.database):
+            north_appointment = create_appointment(create_provider('Dr. North', clinic=self.north))
+        with tenant_database(self.south.database):
+            south_appointment = create_appointment(
+                create_provider('Dr. South', clinic=self.south), client_email='south@example.com'
+            )
+        # Separate databases hand out the same ids
+        self.assertEqual(north_appointment.pk, south_appointment.pk)
+        url = reverse('appointment_success', args=[north_appointment.pk])
+
+        self.assertContains(self.client.get(url, HTTP_HOST='north.example.com'), 'patient@example.com')
+        self.assertContains(self.client.get('/c/south' + url), 'south@example.com')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        # Clinics on the same database are still scoped by clinic
+        default_appointment = create_appointment(create_provider())
+        url = reverse('appointment_success', args=[default_appointment.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get('/c/east' + url).status_code, 404)
+
+        response = self.client.get('/c/east' + reverse('create_appointment'))
+        self.assertQuerySetEqual(response.context['form'].fields['provider'].queryset, [])
+
+    def test_pricing_cache_is_per_database(self):
+        with tenant_database(self.north.database):
+            north_provider = create_provider('Dr. North', clinic=self.north, consultation_price=Decimal('80.00'))
+        with tenant_database(self.south.database):
+            south_provider = create_provider('Dr. South', clinic=self.south, consultation_price=Decimal('20.00'))
+        self.assertEqual(north_provider.pk, south_provider.pk)
+        params = {'provider': north_provider.pk, 'time': '2030-01-07T10:00'}
+
+        response = self.client.get(reverse('price_quote'), params, HTTP_HOST='north.example.com')
+        self.assertEqual(response.json()['prices'], [80.0])
+        response = self.client.get('/c/south' + reverse('price_quote'), params)
+        self.assertEqual(response.json()['prices'], [20.0])
+
+    def test_queued_tasks_run_against_the_enqueuing_clinic_database(self):
+        with tenant_database(self.north.database):
+            provider = create_provider('Dr. North', clinic=self.north)
+            appointment = create_appointment(
+                provider, status=Appointment.STATUS_CONFIRMED, is_paid=True, stripe_payment_intent_id='pi_north'
+            )
+        queued = []
+
+        def enqueue(task, args=None, kwargs=None, **options):
+            queued.append((task, args, kwargs))
+
+        # A real broker: tasks are only queued, then run later by a worker with no clinic context
+        with mock.patch('celery.app.task.Task.apply_async', autospec=True, side_effect=enqueue):
+            call_command(
+                'cancel_provider_schedule', provider.pk, '--clinic', 'north',
+                '--start', timezone.localtime(appointment.appointment_time).date().isoformat(), stdout=StringIO(),
+            )
+            self.assertTrue(queued)
+            self.assertEqual({kwargs['using'] for _, _, kwargs in queued}, {'clinic_north'})
+
+            with mock.patch('stripe.Refund.create') as refund:
+                while queued:
+                    task, args, kwargs = queued.pop(0)
+                    task.run(*args, **kwargs)
+
+        refund.assert_called_once()
+        self.assertEqual(refund.call_args.kwargs['payment_intent'], 'pi_north')
+        self.assertEqual([message.to for message in mail.outbox], [['patient@example.com']])
+        self.assertEqual(
+            Appointment.objects.using('clinic_north').get(pk=appointment.pk).status, Appointment.STATUS_CANCELLED
+        )
+
+    def test_maintenance_reaches_clinic_databases(self):
+        with tenant_database(self.north.database):
+            provider = create_provider('Dr. North', clinic=self.north)
+            old = create_appointment(provider, days_ahead=-400, status=Appointment.STATUS_COMPLETED)
+            synced = create_appointment(
+                provider, client_email='pat@example.com', google_calendar_event_id='event-1', calendar_synced=True,
+            )
+        credential = CalendarCredential.objects.create(client_email='pat@example.com')
+
+        call_command('archive_appointments', older_than=365, stdout=StringIO())
+        with mock.patch(
+            'appointments.management.commands.sync_calendars.sync_calendar_changes',
+            return_value=(True, {'moved': 0, 'deleted': 0}),
+        ) as sync:
+            call_command('sync_calendars', stdout=StringIO())
+        changes = apply_calendar_changes(credential, [{'id': 'event-1', 'status': 'cancelled'}])
+
+        self.assertTrue(AppointmentArchive.objects.using('clinic_north').filter(pk=old.pk).exists())
+        sync.assert_called_once_with(credential)
+        self.assertEqual(changes, {'moved': 0, 'deleted': 1})
+        self.assertFalse(Appointment.objects.using('clinic_north').get(pk=synced.pk).calendar_synced)
+
+    def test_clinic_database_must_be_configured(self):
+        with self.assertRaises(ValidationError):
+            Clinic(name='West', slug='west', database='clinic_west').full_clean()
+        Clinic(name='West', slug='west', database='clinic_north').full_clean()
+
+
+class AsyncPaymentViewTests(TestCase):
+    """Payment views await Stripe through the pooled async client."""
+
+    def stripe_client(self, status='requires_payment_method'):
+        intent = SimpleNamespace(id='pi_async', status=status)
+        client = mock.Mock()
+        client.v1.payment_intents.create_async = mock.AsyncMock(return_value=intent)
+        client.v1.payment_intents.retrieve_async = mock.AsyncMock(return_value=intent)
+        return client
+
+    def test_payment_page_creates_intent(self):
+        appointment = create_appointment(create_provider())
+        client = self.stripe_client()
+
+        with mock.patch('appointments.views.get_stripe_client', return_value=client):
+            response = self.client.get(reverse('appointment_payment', args=[appointment.pk]))
+
+        self.assertContains(response, 'pi_async')
+        params = client.v1.payment_intents.create_async.call_args.kwargs['params']
+        self.assertEqual(params['amount'], 5000)
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.stripe_payment_intent_id, 'pi_async')
+
+    def test_stripe_time_reported_in_server_timing(self):
+        appointment = create_appointment(create_provider())
+
+        with mock.patch('appointments.views.get_stripe_client', return_value=self.stripe_client()):
+            response = self.client.get(reverse('appointment_payment', args=[appointment.pk]))
+
+        self.assertIn('stripe;dur=', response['Server-Timing'])
+
+    def test_confirm_payment_confirms_appointment(self):
+        appointment = create_appointment(create_provider(), stripe_payment_intent_id='pi_async')
+
+        with mock.patch('appointments.views.get_stripe_client', return_value=self.stripe_client('succeeded')):
+            response = self.client.post(reverse('confirm_payment', args=[appointment.pk]))
+
+        self.assertRedirects(response, reverse('appointment_success', args=[appointment.pk]))
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.status, Appointment.STATUS_CONFIRMED)
+        self.assertTrue(appointment.confirmation_sent)
+
+    def test_confirm_payment_rejects_unfinished_intent(self):
+        appointment = create_appointment(create_provider(), stripe_payment_intent_id='pi_async')
+
+        with mock.patch('appointments.views.get_stripe_client', return_value=self.stripe_client()):
+            response = self.client.post(reverse('confirm_payment', args=[appointment.pk]))
+
+        self.assertRedirects(response, reverse('appointment_payment', args=[appointment.pk]), fetch_redirect_response=False)
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.status, Appointment.STATUS_PENDING_PAYMENT)
+        self.assertFalse(appointment.is_paid)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_cancelled_appointment_gets_no_payment_intent(self):
+        appointment = create_appointment(create_provider(), status=Appointment.STATUS_CANCELLED)
+        client = self.stripe_client()
+
+        with mock.patch('appointments.views.get_stripe_client', return_value=client):
+            response = self.client.get(reverse('appointment_payment', args=[appointment.pk]))
+
+        self.assertRedirects(response, reverse('appointment_success', args=[appointment.pk]))
+        client.v1.payment_intents.create_async.assert_not_called()
+
+    def test_payment_for_a_cancelled_appointment_is_refunded(self):
+        appointment = create_appointment(create_provider(), stripe_payment_intent_id='pi_async')
+        Appointment.objects.filter(pk=appointment.pk).transition(Appointment.STATUS_CANCELLED)
+
+        with mock.patch('appointments.views.get_stripe_client', return_value=self.stripe_client('succeeded')), \
+                mock.patch('stripe.Refund.create') as refund:
+            response = self.client.post(reverse('confirm_payment', args=[appointment.pk]))
+
+        self.assertRedirects(response, reverse('appointment_success', args=[appointment.pk]))
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.status, appointment.is_paid), (Appointment.STATUS_CANCELLED, True))
+        refund.assert_called_once_with(
+            payment_intent='pi_async', amount=5000,
+            idempotency_key=f'appointment-{appointment.pk}-refund', api_key=mock.ANY,
+        )
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_open_intent_for_a_cancelled_appointment_is_cancelled(self):
+        appointment = create_appointment(
+            create_provider(), stripe_payment_intent_id='pi_async', status=Appointment.STATUS_CANCELLED,
+        )
+
+        with mock.patch('appointments.views.get_stripe_client', return_value=self.stripe_client()), \
+                mock.patch('appointments.tasks.stripe.PaymentIntent.cancel') as cancel:
+            response = self.client.post(reverse('confirm_payment', args=[appointment.pk]))
+
+        self.assertRedirects(response, reverse('appointment_success', args=[appointment.pk]))
+        cancel.assert_called_once_with('pi_async', api_key=mock.ANY)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_client_pool_closes_with_its_loop(self):
+        async def view():
+            first, second = get_stripe_client(), get_stripe_client()
+            await asyncio.sleep(0)
+            return first, second
+
+        # WSGI runs each async view on its own loop, as async_to_sync does here
+        first, second = async_to_sync(view)()
+        other, _ = async_to_sync(view)()
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+        for client in (first, other):
+            self.assertTrue(client._requestor._client._client_async.is_closed)
+
+
+class SessionTests(TestCase):
+    """Sessions stay small and expired rows are cleared in batches."""
+
+    @override_settings(GOOGLE_CALENDAR_CLIENT_ID='test-client-id')
+    def test_calendar_connect_stores_one_small_entry(self):
+        appointment = create_appointment(create_provider(), is_paid=True)
+
+        response = self.client.get(reverse('calendar_connect', args=[appointment.pk]))
+
+        self.assertEqual(response.status_code, 302)
+        session = self.client.session
+        self.assertEqual(list(session.keys()), [CALENDAR_OAUTH_SESSION_KEY])
+        self.assertEqual(session[CALENDAR_OAUTH_SESSION_KEY]['appointment_id'], appointment.pk)
+
+    @override_settings(SESSION_CLEANUP_BATCH_SIZE=2)
+    def test_clear_expired_sessions_in_batches(self):
+        for _ in range(5):
+            expired = SessionStore()
+            expired.set_expiry(-60)
+            expired.create()
+        live = SessionStore()
+        live.create()
+
+        self.assertEqual(clear_expired_sessions(), 5)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [live.session_key])
+
+
+class CalendarAccountTests(TestCase):
+    """Calendar credentials are only linked to the Google account that owns the patient email."""
+
+    def setUp(self):
+        self.appointment = create_appointment(create_provider(), is_paid=True, client_email='pat@example.com')
+
+    def callback(self, sub='google-1', email='pat@example.com', email_verified=True):
+        """Run the OAuth callback with Google vouching for the given account."""
+        request = RequestFactory().get('/calendar/callback/', {'state': 'state-1', 'code': 'code-1'})
+        request.session = SessionStore()
+        request.session[CALENDAR_OAUTH_SESSION_KEY] = {'state': 'state-1', 'appointment_id': self.appointment.pk}
+        credentials = SimpleNamespace(
+            token='access', refresh_token='refresh', token_uri='https://oauth2.googleapis.com/token',
+            scopes=SCOPES, expiry=None, id_token='id-token',
+        )
+        claims = {'sub': sub, 'email': email, 'email_verified': email_verified}
+        with mock.patch('appointments.calendar_utils.google_flow') as google_flow, \
+                mock.patch('appointments.calendar_utils.google_id_token') as google_id_token:
+            google_flow.Flow.from_client_config.return_value = mock.Mock(credentials=credentials)
+            google_id_token.verify_oauth2_token.return_value = claims
+            success, message = handle_google_calendar_callback(request, self.appointment.client_email)
+        return success, request.session
+
+    def test_links_the_verified_account(self):
+        success, session = self.callback(email='Pat@example.com')
+
+        self.assertTrue(success)
+        credential = CalendarCredential.objects.get(client_email='pat@example.com')
+        self.assertEqual(credential.google_account_id, 'google-1')
+        self.assertEqual(session[CALENDAR_ACCOUNT_SESSION_KEY], 'pat@example.com')
+
+    def test_rejects_an_account_for_another_email(self):
+        success, session = self.callback(email='attacker@example.com')
+
+        self.assertFalse(success)
+        self.assertFalse(CalendarCredential.objects.exists())
+        self.assertNotIn(CALENDAR_ACCOUNT_SESSION_KEY, session)
+
+    def test_rejects_an_unverified_email(self):
+        success, _ = self.callback(email_verified=False)
+
+        self.assertFalse(success)
+        self.assertFalse(CalendarCredential.objects.exists())
+
+    def test_keeps_a_credential_linked_to_another_account(self):
+        CalendarCredential.objects.create(
+            client_email='pat@example.com', google_account_id='google-1', refresh_token='original'
+        )
+
+        success, _ = self.callback(sub='google-2')
+
+        self.assertFalse(success)
+        credential = CalendarCredential.objects.get(client_email='pat@example.com')
+        self.assertEqual(credential.google_account_id, 'google-1')
+        self.assertEqual(credential.refresh_token, 'original')
+
+    def test_connect_without_the_account_goes_through_oauth(self):
+        CalendarCredential.objects.create(client_email='pat@example.com', google_account_id='google-1')
+
+        with mock.patch('appointments.views.get_calendar_credentials') as get_credentials, \
+                mock.patch('appointments.views.create_google_calendar_flow', return_value='https://accounts.google.com/o/oauth2/auth'):
+            response = self.client.get(reverse('calendar_connect', args=[self.appointment.pk]))
+
+        self.assertRedirects(response, 'https://accounts.google.com/o/oauth2/auth', fetch_redirect_response=False)
+        get_credentials.assert_not_called()
+
+    def test_connect_reuses_credentials_for_the_signed_in_account(self):
+        session = self.client.session
+        session[CALENDAR_ACCOUNT_SESSION_KEY] = 'pat@example.com'
+        session.save()
+
+        with mock.patch('appointments.views.get_calendar_credentials', return_value=mock.sentinel.credentials), \
+                mock.patch('appointments.views._add_to_google_calendar') as add_to_calendar:
+            response = self.client.get(reverse('calendar_connect', args=[self.appointment.pk]))
+
+        self.assertRedirects(response, reverse('appointment_success', args=[self.appointment.pk]))
+        add_to_calendar.assert_called_once()
+        self.assertIs(add_to_calendar.call_args.args[2], mock.sentinel.credentials)
+
+
+class CalendarSyncTests(TestCase):
+    """Changes pulled from a patient's calendar only apply to that patient's appointments."""
+
+    def setUp(self):
+        provider = create_provider()
+        self.appointment = create_appointment(
+            provider, client_email='pat@example.com', google_calendar_event_id='event-1', calendar_synced=True
+        )
+        self.other = create_appointment(
+            provider, client_email='other@example.com', google_calendar_event_id='event-1', calendar_synced=True
+        )
+        self.credential = CalendarCredential.objects.create(client_email='pat@example.com', sync_token='token-1')
+        self.new_time = (self.appointment.appointment_time + timedelta(days=1)).replace(microsecond=0)
+
+    def sync(self, *responses):
+        """Sync the credential against a fake events().list() answering with responses in turn."""
+        calls = []
+
+        def list_events(**params):
+            calls.append(params)
+            response = responses[len(calls) - 1]
+            if isinstance(response, Exception):
+                raise response
+            return mock.Mock(execute=mock.Mock(return_value=response))
+
+        service = mock.Mock()
+        service.events.return_value.list.side_effect = list_events
+        with mock.patch('appointments.calendar_utils.get_credentials_for', return_value=mock.sentinel.credentials), \
+                mock.patch('appointments.calendar_utils.google_discovery.build', return_value=service):
+            result = sync_calendar_changes(self.credential)
+        return result, calls
+
+    def test_changes_stay_on_the_credentials_appointments(self):
+        changes = apply_calendar_changes(self.credential, [{'id': 'event-1', 'status': 'cancelled'}])
+
+        self.assertEqual(changes, {'moved': 0, 'deleted': 1})
+        self.appointment.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertIsNone(self.appointment.google_calendar_event_id)
+        self.assertEqual(self.other.google_calendar_event_id, 'event-1')
+        self.assertTrue(self.other.calendar_synced)
+
+    def test_sync_moves_appointments_and_stores_the_next_token(self):
+        event = {'id': 'event-1', 'start': {'dateTime': self.new_time.isoformat()}}
+
+        (success, changes), calls = self.sync({'items': [event], 'nextSyncToken': 'token-2'})
+
+        self.assertTrue(success)
+        self.assertEqual(changes, {'moved': 1, 'deleted': 0})
+        self.assertEqual(calls[0]['syncToken'], 'token-1')
+        self.appointment.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.appointment.appointment_time, self.new_time)
+        self.assertNotEqual(self.other.appointment_time, self.new_time)
+        self.credential.refresh_from_db()
+        self.assertEqual(self.credential.sync_token, 'token-2')
+        self.assertIsNotNone(self.credential.last_synced_at)
+
+    def test_invalidated_sync_token_falls_back_to_a_full_resync(self):
+        gone = HttpError(mock.Mock(status=410, reason='Gone'), b'')
+        event = {'id': 'event-1', 'start': {'dateTime': self.new_time.isoformat()}}
+
+        (success, changes), calls = self.sync(gone, {'items': [event], 'nextSyncToken': 'token-2'})
+
+        self.assertTrue(success)
+        self.assertEqual(changes, {'moved': 1, 'deleted': 0})
+        self.assertEqual(len(calls), 2)
+        self.assertNotIn('syncToken', calls[1])
+        self.assertIn('timeMin', calls[1])
+        self.credential.refresh_from_db()
+        self.assertEqual(self.credential.sync_token, 'token-2')
+
+    def test_other_errors_keep_the_sync_token(self):
+        (success, _), calls = self.sync(HttpError(mock.Mock(status=500, reason='Server Error'), b''))
+
+        self.assertFalse(success)
+        self.assertEqual(len(calls), 1)
+        self.credential.refresh_from_db()
+        self.assertEqual(self.credential.sync_token, 'token-1')
+
+
+class InstrumentationTests(AdminTestCase):
+    """Requests carry Server-Timing and feed the staff-only metrics endpoint."""
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def test_server_timing_header(self):
+        appointment = create_appointment(create_provider())
+
+        response = self.client.get(reverse('appointment_success', args=[appointment.pk]))
+
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('template;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    def test_metrics_endpoint_reports_view_histograms(self):
+        appointment = create_appointment(create_provider())
+        self.client.get(reverse('appointment_success', args=[appointment.pk]))
+
+        response = self.client.get(reverse('metrics'))
+
+        body = response.content.decode()
+        self.assertIn('sofia_request_duration_seconds_count{view="appointment_success",method="GET"} 1', body)
+        self.assertIn('sofia_dependency_calls_total{view="appointment_success",dependency="db"}', body)
+
+    def test_metrics_endpoint_is_staff_only(self):
+        self.client.logout()
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 302)
+
+
+class LoadTestHarnessTests(TransactionTestCase):
+    """The booking funnel load test runs offline and writes comparable JSON results."""
+
+    def test_loadtest_completes_funnel_and_writes_json(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'results.json')
+            call_command(
+                'loadtest_booking', patients=2, concurrency=1,
+                stripe_latency_ms=0, calendar_latency_ms=0, output=output, stdout=StringIO(),
+            )
+            with open(output) as f:
+                results = json.load(f)
+
+        self.assertEqual(results['completed_patients'], 2)
+        self.assertEqual(results['steps']['ics']['requests'], 2)
+        self.assertEqual(sum(step['errors'] for step in results['steps'].values()), 0)
+        self.assertGreater(results['steps']['confirm']['p95_ms'], 0)
+        self.assertFalse(Provider.objects.exists())
+
+
+@override_settings(GOOGLE_CALENDAR_CLIENT_ID='test-client-id')
+class QueryBudgetTests(AdminTestCase):
+    """Every page runs a fixed number of queries, however many rows exist."""
+
+    # Page -> queries, with a logged-in staff session
+    BUDGETS = {
+        'home': 0,
+        'create (GET)': 0,
+        'create (POST)': 5,
+        'price quote': 1,
+        'provider directory': 1,
+        'payment': 1,
+        'confirm payment': 5,
+        'success': 1,
+        'stripe status': 0,
+        'calendar connect': 4,
+        'calendar callback': 4,
+        'ics download': 1,
+        'admin dashboard': 7,
+        'export': 2,
+        'metrics': 1,
+        'appointment changelist': 8,
+        'appointment change': 6,
+        'provider changelist': 5,
+        'provider change': 7,
+        'archive changelist': 4,
+        'calendar credential changelist': 4,
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.provider = create_provider()
+        self.paid = create_appointment(self.provider, is_paid=True)
+        self.unpaid = create_appointment(
+            self.provider, client_email='unpaid@example.com', stripe_payment_intent_id='pi_budget'
+        )
+        intent = SimpleNamespace(id='pi_budget', status='succeeded')
+        stripe_client = mock.Mock()
+        stripe_client.v1.payment_intents.retrieve_async = mock.AsyncMock(return_value=intent)
+        patcher = mock.patch('appointments.views.get_stripe_client', return_value=stripe_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_volume(self, count=25):
+        """Add providers, price rules, appointments, archives and credentials."""
+        for i in range(count):
+            provider = create_provider(f'Dr. Volume {i}')
+            PriceRule.objects.create(provider=provider, price=Decimal('60.00'))
+            appointment = create_appointment(provider, client_email=f'volume{i}@example.com', is_paid=i % 2 == 0)
+            CalendarCredential.objects.create(client_email=appointment.client_email)
+            create_appointment(
+                provider, days_ahead=-400, status=Appointment.STATUS_COMPLETED, client_email=appointment.client_email
+            )
+        call_command('archive_appointments', older_than=365, stdout=StringIO())
+
+    def request_page(self, page):
+        client = self.client
+        paid, unpaid = self.paid.pk, self.unpaid.pk
+        if page == 'home':
+            return client.get(reverse('home'))
+        if page == 'create (GET)':
+            return client.get(reverse('create_appointment'))
+        if page == 'create (POST)':
+            return client.post(reverse('create_appointment'), {
+                'provider': self.provider.pk,
+                'appointment_time': (timezone.localtime() + timedelta(days=3)).strftime('%Y-%m-%dT%H:%M'),
+                'client_email': 'new@example.com',
+                'appointment_type': 'consultation',
+            })
+        if page == 'provider directory':
+            return client.get(reverse('provider_directory'), {'q': 'dr', 'specialty': 'general'})
+        if page == 'price quote':
+            return client.get(reverse('price_quote'), {'provider': self.provider.pk, 'time': '2030-01-07T10:00'})
+        if page == 'payment':
+            return client.get(reverse('appointment_payment', args=[unpaid]))
+        if page == 'confirm payment':
+            return client.post(reverse('confirm_payment', args=[unpaid]))
+        if page == 'success':
+            return client.get(reverse('appointment_success', args=[paid]))
+        if page == 'stripe status':
+            return client.get(reverse('stripe_status'))
+        if page == 'calendar connect':
+            return client.get(reverse('calendar_connect', args=[paid]))
+        if page == 'calendar callback':
+            with mock.patch('appointments.views.handle_google_calendar_callback', return_value=(False, 'denied')):
+                return client.get(reverse('calendar_callback'), {'state': 'budget'})
+        if page == 'ics download':
+            return client.get(reverse('download_calendar_file', args=[paid]))
+        if page == 'admin dashboard':
+            return client.get(reverse('admin_dashboard'))
+        if page == 'export':
+            response = client.get(reverse('export_appointments'))
+            b''.join(response.streaming_content)
+            return response
+        if page == 'metrics':
+            return client.get(reverse('metrics'))
+        if page == 'appointment changelist':
+            return client.get(reverse('admin:appointments_appointment_changelist'))
+        if page == 'appointment change':
+            return client.get(reverse('admin:appointments_appointment_change', args=[paid]))
+        if page == 'provider changelist':
+            return client.get(reverse('admin:appointments_provider_changelist'))
+        if page == 'provider change':
+            return client.get(reverse('admin:appointments_provider_change', args=[self.provider.pk]))
+        if page == 'archive changelist':
+            return client.get(reverse('admin:appointments_appointmentarchive_changelist'))
+        if page == 'calendar credential changelist':
+            return client.get(reverse('admin:appointments_calendarcredential_changelist'))
+        raise AssertionError(f'No request defined for {page}')
+
+    def prepare(self, page):
+        """Reset state a previous request consumed, outside the measured block."""
+        ContentType.objects.clear_cache()
+        caches[settings.PROVIDER_DIRECTORY_CACHE_ALIAS].clear()
+        Appointment.objects.filter(pk=self.unpaid.pk).update(
+            is_paid=False, status=Appointment.STATUS_PENDING_PAYMENT
+        )
+        if page == 'calendar callback':
+            session = self.client.session
+            session[CALENDAR_OAUTH_SESSION_KEY] = {'state': 'budget', 'appointment_id': self.paid.pk}
+            session.save()
+
+    def assert_budgets(self, volume):
+        for page, budget in self.BUDGETS.items():
+            with self.subTest(page=page, volume=volume):
+                self.prepare(page)
+                with CaptureQueriesContext(connection) as context:
+                    response = self.request_page(page)
+                self.assertLess(response.status_code, 400)
+                self.assertEqual(
+                    len(context.captured_queries), budget,
+                    '\n'.join(query['sql'] for query in context.captured_queries),
+                )
+
+    def test_query_budgets_hold_as_data_grows(self):
+        self.assert_budgets('small')
+        self.add_volume()
+        self.assert_budgets('large')
+
+
+class StartupImportTests(TestCase):
+    """Worker boot and management commands leave the integration SDKs unimported."""
+
+    def test_sdks_not_imported_at_startup(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'startup.json')
+            call_command('benchmark_startup', runs=1, output=output, stdout=StringIO())
+            with open(output) as f:
+                results = json.load(f)
+
+        for scenario, result in results.items():
+            self.assertEqual(result['sdk_modules'], [], scenario)
+            self.assertGreater(result['import_s'], 0)
+
+
+class ConditionalResponseTests(TestCase):
+    """Read-only pages answer revalidation with 304s and are served compressed."""
+
+    def setUp(self):
+        self.appointment = create_appointment(create_provider(), is_paid=True)
+
+    def test_success_page_revalidates_with_304(self):
+        url = reverse('appointment_success', args=[self.appointment.pk])
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('private', first['Cache-Control'])
+        self.assertIn('no-cache', first['Cache-Control'])
+        self.assertTrue(first.has_header('Last-Modified'))
+
+        with self.assertNumQueries(1), self.assertTemplateNotUsed('appointments/success.html'):
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b'')
+
+        by_date = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(by_date.status_code, 304)
+
+    def test_changed_appointment_is_rendered_again(self):
+        url = reverse('appointment_success', args=[self.appointment.pk])
+        etag = self.client.get(url)['ETag']
+
+        self.appointment.notes = 'Bring referral letter'
+        self.appointment.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_pending_messages_skip_validators(self):
+        Appointment.objects.filter(pk=self.appointment.pk).update(
+            status=Appointment.STATUS_PENDING_PAYMENT, is_paid=False, stripe_payment_intent_id='pi_conditional',
+        )
+        with mock.patch('appointments.views.get_stripe_client', return_value=mock.Mock(**{
+            'v1.payment_intents.retrieve_async': mock.AsyncMock(return_value=SimpleNamespace(id='pi_conditional', status='succeeded')),
+        })):
+            self.client.post(reverse('confirm_payment', args=[self.appointment.pk]))
+
+        response = self.client.get(reverse('appointment_success', args=[self.appointment.pk]))
+
+        self.assertContains(response, 'Payment confirmed!')
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_ics_and_stripe_status_revalidate_with_304(self):
+        for url in (reverse('download_calendar_file', args=[self.appointment.pk]), reverse('stripe_status')):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_html_and_ics_are_compressed(self):
+        encodings = ['gzip'] + (['br'] if brotli else [])
+        for url in (
+            reverse('appointment_success', args=[self.appointment.pk]),
+            reverse('download_calendar_file', args=[self.appointment.pk]),
+        ):
+            plain = self.client.get(url).content
+            for encoding in encodings:
+                with self.subTest(url=url, encoding=encoding):
+                    response = self.client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+                    self.assertEqual(response['Content-Encoding'], encoding)
+                    self.assertIn('Accept-Encoding', response['Vary'])
+                    self.assertLess(len(response.content), len(plain))
+                    # Weak ETags from compression still validate
+                    revalidated = self.client.get(
+                        url, HTTP_ACCEPT_ENCODING=encoding, HTTP_IF_NONE_MATCH=response['ETag']
+                    )
+                    self.assertEqual(revalidated.status_code, 304)
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_pages_with_forms_only_use_padded_gzip(self):
+        response = self.client.get(reverse('create_appointment'), HTTP_ACCEPT_ENCODING='br, gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+@override_settings(
+    ADMISSION_CONTROL_ENABLED=True,
+    ADMISSION_CLIENT_RATE=2,
+    ADMISSION_GLOBAL_RATE=100,
+    ADMISSION_CLIENT_CONCURRENCY=4,
+    ADMISSION_GLOBAL_CONCURRENCY=32,
+)
+class AdmissionControlTests(TestCase):
+    """Booking pages are shed with 429/503 under load; payment confirmation never is."""
+
+    def setUp(self):
+        caches[settings.ADMISSION_CACHE_ALIAS].clear()
+        metrics.reset()
+        self.appointment = create_appointment(create_provider(), stripe_payment_intent_id='pi_admission')
+
+    def test_client_over_rate_gets_429_with_retry_after(self):
+        url = reverse('create_appointment')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertIn(
+            'sofia_requests_shed_total{view="create_appointment",reason="client_rate"} 1', metrics.render()
+        )
+        # Other clients and uncontrolled pages are unaffected
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.2').status_code, 200)
+        self.assertEqual(self.client.get(reverse('stripe_status')).status_code, 200)
+
+    async def test_async_stack_sheds_too(self):
+        url = reverse('create_appointment')
+        for _ in range(2):
+            await self.async_client.get(url)
+
+        response = await self.async_client.get(url)
+
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(ADMISSION_CLIENT_RATE=100, ADMISSION_GLOBAL_RATE=2)
+    def test_global_rate_gets_503(self):
+        url = reverse('appointment_payment', args=[self.appointment.pk])
+        intent = SimpleNamespace(id='pi_admission', status='requires_payment_method')
+        stripe_client = mock.Mock()
+        stripe_client.v1.payment_intents.retrieve_async = mock.AsyncMock(return_value=intent)
+        with mock.patch('appointments.views.get_stripe_client', return_value=stripe_client):
+            for address in ('10.0.0.1', '10.0.0.2'):
+                self.assertEqual(self.client.get(url, REMOTE_ADDR=address).status_code, 200)
+            response = self.client.get(url, REMOTE_ADDR='10.0.0.3')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+    @override_settings(ADMISSION_CLIENT_RATE=2, ADMISSION_GLOBAL_RATE=4)
+    def test_rejected_client_does_not_use_up_the_global_rate(self):
+        url = reverse('create_appointment')
+        for _ in range(10):
+            self.client.get(url, REMOTE_ADDR='10.0.0.1')
+
+        # The flooding client got two requests in; the other two global slots are still free
+        for address in ('10.0.0.2', '10.0.0.3'):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR=address).status_code, 200)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.4').status_code, 503)
+
+    def test_confirm_payment_is_never_shed(self):
+        for _ in range(3):
+            self.client.get(reverse('create_appointment'))
+        intent = SimpleNamespace(id='pi_admission', status='succeeded')
+        stripe_client = mock.Mock()
+        stripe_client.v1.payment_intents.retrieve_async = mock.AsyncMock(return_value=intent)
+
+        with mock.patch('appointments.views.get_stripe_client', return_value=stripe_client):
+            response = self.client.post(reverse('confirm_payment', args=[self.appointment.pk]))
+
+        self.assertRedirects(response, reverse('appointment_success', args=[self.appointment.pk]))
+
+    @override_settings(ADMISSION_CLIENT_CONCURRENCY=1, ADMISSION_GLOBAL_CONCURRENCY=2)
+    def test_concurrency_limits(self):
+        factory = RequestFactory()
+        url = reverse('create_appointment')
+        inner = {}
+
+        def get_response(request):
+            if not inner:
+                # More requests arrive while the first is still in flight
+                inner['same_client'] = middleware(factory.get(url))
+                inner['other_client'] = middleware(factory.get(url, REMOTE_ADDR='10.0.0.9'))
+                inner['priority'] = middleware(factory.post(reverse('confirm_payment', args=[1])))
+            return HttpResponse('ok')
+
+        middleware = AdmissionControlMiddleware(get_response)
+        self.assertEqual(middleware(factory.get(url)).status_code, 200)
+
+        self.assertEqual(inner['same_client'].status_code, 429)
+        self.assertEqual(inner['other_client'].status_code, 200)
+        self.assertEqual(inner['priority'].status_code, 200)
+        self.assertEqual(middleware.concurrency.total, 0)
+
+    def test_sliding_window_retry_after(self):
+        limiter = SlidingWindowLimiter(settings.ADMISSION_CACHE_ALIAS, limit=10, window=60)
+        # Half way through a window, the previous window counts for half
+        self.assertIsNone(limiter.evaluate(previous=10, current=5, elapsed=0.5))
+        self.assertEqual(limiter.evaluate(previous=10, current=6, elapsed=0.5), 6)
+        # Over the limit within this window alone: wait into the next one
+        self.assertEqual(limiter.evaluate(previous=0, current=20, elapsed=0.5), 60)
+
+        now = 600.0
+        for _ in range(10):
+            self.assertIsNone(limiter.hit('unit', now=now))
+        self.assertEqual(limiter.hit('unit', now=now), 66)
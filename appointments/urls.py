@@ -11,12 +11,18 @@ urlpatterns = [
     # Main appointment flow
     path('', views.home, name='home'),
     path('create/', views.create_appointment, name='create_appointment'),
+    path('series/', views.create_series, name='create_series'),
+    path('series/<int:series_id>/payment/', views.series_payment, name='series_payment'),
+    path('series/<int:series_id>/confirm-payment/', views.confirm_series_payment, name='confirm_series_payment'),
+    path('waitlist/', views.join_waitlist, name='join_waitlist'),
     path('<int:appointment_id>/payment/', views.appointment_payment, name='appointment_payment'),
     path('<int:appointment_id>/confirm-payment/', views.confirm_payment, name='confirm_payment'),
     path('<int:appointment_id>/success/', views.appointment_success, name='appointment_success'),
     
     # Utilities
     path('stripe-status/', views.stripe_status, name='stripe_status'),
+    path('pricing/quote/', views.price_quote, name='price_quote'),
+    path('providers/', views.provider_directory, name='provider_directory'),
     
     # Calendar integration
     path('<int:appointment_id>/calendar/connect/', views.calendar_connect, name='calendar_connect'),
@@ -25,4 +31,6 @@ urlpatterns = [
     
     # Admin analytics
     path('admin-dashboard/', admin_views.admin_dashboard, name='admin_dashboard'),
+    path('admin-dashboard/export/', admin_views.export_appointments, name='export_appointments'),
+    path('admin-dashboard/metrics/', admin_views.metrics, name='metrics'),
 ]
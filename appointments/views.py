@@ -3,16 +3,36 @@ Appointment booking views.
 Handles appointment creation, Stripe payments, email/calendar integration.
 """
 
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
 from django.contrib import messages
 from django.conf import settings
-from django.views.decorators.http import require_http_methods
-from django.http import HttpResponse
-import stripe
+from django.db import connections
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_http_methods
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.core.exceptions import ValidationError
+import hashlib
 import json
 
-from .models import Appointment, Provider
-from .forms import AppointmentForm
+from .models import Appointment, AppointmentArchive, AppointmentSeries, Provider
+from .db import write_transaction
+from .directory import DirectoryQueryError, cache_key, directory_page, parse_query
+from .forms import AppointmentForm, SeriesForm, WaitlistForm
+from .gateways import stripe
+from .instrumentation import timed
+from .pricing import quote
+from .routers import tenant_database
+from .series import book_series
+from .stripe_client import get_stripe_client
+from .tasks import (
+    cancel_payment_intents, enqueue_in_batches, offer_waitlist_slots, refund_payments, send_confirmation_emails,
+)
+from .tenants import clinic_url, get_directory
+from .waitlist import expire_holds, hold_lapsed
 from .email_utils import (
     send_appointment_confirmation, 
     send_appointment_reminder,
@@ -20,24 +40,29 @@ from .email_utils import (
     schedule_appointment_reminder
 )
 from .calendar_utils import (
+    CALENDAR_ACCOUNT_SESSION_KEY,
+    CALENDAR_OAUTH_SESSION_KEY,
     create_google_calendar_flow,
     handle_google_calendar_callback,
+    get_calendar_credentials,
     create_calendar_event,
     generate_ics_file
 )
 
-# Initialize Stripe with secret key
-stripe.api_key = settings.STRIPE_SECRET_KEY
+# Most slots priced by one quote request
+MAX_QUOTE_SLOTS = 2000
 
 
 def create_appointment(request):
     """Create new appointment and redirect to payment page."""
     if request.method == 'POST':
-        form = AppointmentForm(request.POST)
+        form = AppointmentForm(request.POST, clinic=request.clinic)
         if form.is_valid():
             appointment = form.save(commit=False)
+            appointment.clinic = request.clinic
             # Price is automatically calculated in the model's save method
-            appointment.save()
+            with write_transaction():
+                appointment.save()
             
             # Schedule reminder email (in production, this would be a Celery task)
             schedule_appointment_reminder(appointment)
@@ -45,62 +70,160 @@ def create_appointment(request):
             messages.success(request, f'Appointment with {appointment.provider.name} saved! Please complete payment to confirm.')
             return redirect('appointment_payment', appointment_id=appointment.id)
     else:
-        form = AppointmentForm()
-    
-    # Get all active providers with their pricing for JavaScript
-    providers = Provider.objects.filter(is_active=True)
-    provider_pricing = {}
-    for provider in providers:
-        provider_pricing[provider.id] = {
-            'consultation': float(provider.consultation_price),
-            'follow_up': float(provider.follow_up_price),
-            'name': provider.name,
-            'specialty': provider.get_specialty_display(),
-        }
+        form = AppointmentForm(clinic=request.clinic)
     
+    # Providers load on demand from the provider directory API as the patient searches
     context = {
         'form': form,
-        'provider_pricing': json.dumps(provider_pricing),
+        'specialties': Provider.SPECIALTY_CHOICES,
         'default_price': settings.APPOINTMENT_PRICE / 100,  # Fallback price
     }
     return render(request, 'appointments/create.html', context)
 
 
-def appointment_payment(request, appointment_id):
-    """Display payment page and create Stripe PaymentIntent."""
-    appointment = get_object_or_404(Appointment, id=appointment_id)
+def create_series(request):
+    """Book a recurring series of appointments and redirect to one combined payment."""
+    if request.method == 'POST':
+        form = SeriesForm(request.POST, clinic=request.clinic)
+        if form.is_valid():
+            series = form.save(commit=False)
+            try:
+                appointments = book_series(series)
+            except ValidationError as e:
+                form.add_error(None, e)
+            else:
+                messages.success(request, f'{len(appointments)} sessions with {series.provider.name} saved! Please complete payment to confirm them.')
+                return redirect('series_payment', series_id=series.id)
+    else:
+        form = SeriesForm(clinic=request.clinic)
+    
+    context = {
+        'form': form,
+        'max_occurrences': AppointmentSeries.MAX_OCCURRENCES,
+    }
+    return render(request, 'appointments/series.html', context)
+
+
+def join_waitlist(request):
+    """Put the patient on the waitlist for a provider or specialty."""
+    if request.method == 'POST':
+        form = WaitlistForm(request.POST, clinic=request.clinic)
+        if form.is_valid():
+            entry = form.save()
+            messages.success(request, f"You're on the waitlist. We'll email {entry.client_email} if a slot opens up.")
+            return redirect('join_waitlist')
+    else:
+        form = WaitlistForm(clinic=request.clinic)
+    
+    context = {
+        'form': form,
+        'hold_minutes': settings.WAITLIST_HOLD_MINUTES,
+    }
+    return render(request, 'appointments/waitlist.html', context)
+
+
+@require_http_methods(["GET"])
+def price_quote(request):
+    """Price one or more candidate slots (?time=...&time=...) for a provider and type."""
+    try:
+        provider_id = int(request.GET.get('provider', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid provider'}, status=400)
+    provider = get_object_or_404(Provider, pk=provider_id, is_active=True, clinic=request.clinic)
+    appointment_type = request.GET.get('type', 'consultation')
+    if appointment_type not in Provider.PRICE_FIELDS:
+        return JsonResponse({'error': 'Unknown appointment type'}, status=400)
+    
+    raw_times = request.GET.getlist('time')
+    if len(raw_times) > MAX_QUOTE_SLOTS:
+        return JsonResponse({'error': f'At most {MAX_QUOTE_SLOTS} slots per quote'}, status=400)
+    times = []
+    for raw_time in raw_times:
+        try:
+            parsed = parse_datetime(raw_time)
+        except ValueError:
+            # Well-formed but out of range, e.g. 2030-02-30T10:00
+            parsed = None
+        if parsed is None:
+            return JsonResponse({'error': f'Invalid time: {raw_time}'}, status=400)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        times.append(parsed)
+    
+    prices = quote(provider, appointment_type, times)
+    return JsonResponse({
+        'provider': provider.id,
+        'type': appointment_type,
+        'prices': [float(price) for price in prices],
+    })
+
+
+def _provider_directory_etag(request):
+    try:
+        return cache_key(request.clinic, parse_query(request.GET))
+    except DirectoryQueryError:
+        return None
+
+
+@require_http_methods(["GET"])
+@cache_control(no_cache=True)
+@condition(etag_func=_provider_directory_etag)
+def provider_directory(request):
+    """Search the clinic's active providers (?q=&specialty=&type=&min_price=&max_price=&after=&limit=)."""
+    try:
+        page = directory_page(request.clinic, request.GET)
+    except DirectoryQueryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(page)
+
+
+async def appointment_payment(request, appointment_id):
+    """Display payment page and create Stripe PaymentIntent (async: awaits Stripe)."""
+    appointment = await aget_object_or_404(
+        Appointment.objects.select_related('provider', 'waitlist_entry'), id=appointment_id, clinic=request.clinic
+    )
     
     # Redirect if already paid
     if appointment.is_paid:
         messages.info(request, 'This appointment has already been paid for.')
         return redirect('appointment_success', appointment_id=appointment.id)
     
+    # Cancelled (or otherwise closed) bookings and lapsed waitlist holds can't be paid for
+    if appointment.status != Appointment.STATUS_PENDING_PAYMENT or hold_lapsed(appointment):
+        messages.error(request, 'This appointment is no longer awaiting payment.')
+        return redirect('appointment_success', appointment_id=appointment.id)
+    
     # Create Stripe PaymentIntent
     payment_intent = None
     error = None
     
     try:
+        stripe_client = get_stripe_client()
         if not appointment.stripe_payment_intent_id:
             # Create new PaymentIntent with dynamic pricing
             amount_in_cents = int(appointment.amount_paid * 100)
-            payment_intent = stripe.PaymentIntent.create(
-                amount=amount_in_cents,
-                currency='usd',
-                description=f'Appointment with {appointment.provider.name} - {appointment.get_appointment_type_display()}',
-                metadata={
-                    'appointment_id': appointment.id,
-                    'client_email': appointment.client_email,
-                    'provider': appointment.provider.name,
-                    'appointment_type': appointment.appointment_type,
-                }
-            )
+            with timed('stripe'):
+                payment_intent = await stripe_client.v1.payment_intents.create_async(params={
+                    'amount': amount_in_cents,
+                    'currency': 'usd',
+                    'description': f'Appointment with {appointment.provider.name} - {appointment.get_appointment_type_display()}',
+                    'metadata': {
+                        'appointment_id': appointment.id,
+                        'client_email': appointment.client_email,
+                        'provider': appointment.provider.name,
+                        'appointment_type': appointment.appointment_type,
+                    },
+                })
             
             # Save PaymentIntent ID
             appointment.stripe_payment_intent_id = payment_intent.id
-            appointment.save()
+            await appointment.asave()
         else:
             # Retrieve existing PaymentIntent
-            payment_intent = stripe.PaymentIntent.retrieve(appointment.stripe_payment_intent_id)
+            with timed('stripe'):
+                payment_intent = await stripe_client.v1.payment_intents.retrieve_async(
+                    appointment.stripe_payment_intent_id
+                )
     
     except stripe.error.StripeError as e:
         error = str(e)
@@ -112,32 +235,90 @@ def appointment_payment(request, appointment_id):
         'stripe_publishable_key': settings.STRIPE_PUBLISHABLE_KEY,
         'error': error,
     }
-    return render(request, 'appointments/payment.html', context)
+    # Rendering reads the session (messages, user), which is sync-only
+    return await sync_to_async(render)(request, 'appointments/payment.html', context)
+
+
+def _mark_confirmed(appointment):
+    """Confirm a paid appointment if it is still awaiting payment; returns whether it was."""
+    # Conditional UPDATE: the row may have been cancelled since the view loaded it
+    with write_transaction():
+        confirmed = Appointment.objects.filter(pk=appointment.pk).transition(
+            Appointment.STATUS_CONFIRMED, is_paid=True,
+        )
+    if confirmed:
+        appointment.status = Appointment.STATUS_CONFIRMED
+        appointment.is_paid = True
+    return bool(confirmed)
+
+
+def _refund_late_payment(appointment):
+    """
+    Record a payment that succeeded after the appointment was cancelled and queue its refund.
+    
+    Returns False if there was nothing to refund (e.g. the appointment was
+    confirmed by another request in the meantime).
+    """
+    with write_transaction():
+        recorded = Appointment.objects.filter(
+            pk=appointment.pk, status=Appointment.STATUS_CANCELLED, is_paid=False,
+        ).update(is_paid=True, updated_at=timezone.now())
+    if recorded:
+        enqueue_in_batches(refund_payments, [appointment.pk])
+    return bool(recorded)
+
+
+def _release_lapsed_holds():
+    enqueue_in_batches(offer_waitlist_slots, expire_holds())
+
+
+def _send_confirmation_emails(appointment):
+    email_sent = send_appointment_confirmation(appointment)
+    if email_sent:
+        appointment.confirmation_sent = True
+        appointment.save(update_fields=['confirmation_sent', 'updated_at'])
+    send_provider_notification(appointment)
 
 
 @require_http_methods(["POST"])
-def confirm_payment(request, appointment_id):
-    """Confirm payment and send confirmation emails."""
-    appointment = get_object_or_404(Appointment, id=appointment_id)
+async def confirm_payment(request, appointment_id):
+    """Confirm payment and send confirmation emails (async: awaits Stripe)."""
+    appointment = await aget_object_or_404(
+        Appointment.objects.select_related('provider', 'waitlist_entry'), id=appointment_id, clinic=request.clinic
+    )
+    
+    if hold_lapsed(appointment):
+        # Release the lapsed hold now rather than at the next sweep, so it's handled as cancelled below
+        await sync_to_async(_release_lapsed_holds)()
+        await appointment.arefresh_from_db(fields=['status'])
     
     # Verify payment with Stripe and mark as paid
     if appointment.stripe_payment_intent_id:
         try:
             # Retrieve PaymentIntent to verify status
-            payment_intent = stripe.PaymentIntent.retrieve(appointment.stripe_payment_intent_id)
+            with timed('stripe'):
+                payment_intent = await get_stripe_client().v1.payment_intents.retrieve_async(
+                    appointment.stripe_payment_intent_id
+                )
             
-            # Mark as paid (in production, check payment_intent.status == 'succeeded')
-            appointment.is_paid = True
-            appointment.save()
+            if payment_intent.status != 'succeeded':
+                if appointment.status != Appointment.STATUS_PENDING_PAYMENT:
+                    # Stop a payment page left open from charging for it later
+                    await sync_to_async(enqueue_in_batches)(cancel_payment_intents, [appointment.stripe_payment_intent_id])
+                    messages.error(request, 'This appointment is no longer awaiting payment.')
+                    return redirect('appointment_success', appointment_id=appointment.id)
+                messages.error(request, 'Your payment has not been completed yet. Please try again.')
+                return redirect('appointment_payment', appointment_id=appointment.id)
             
-            # Send confirmation email
-            email_sent = send_appointment_confirmation(appointment)
-            if email_sent:
-                appointment.confirmation_sent = True
-                appointment.save()
+            if not await sync_to_async(_mark_confirmed)(appointment):
+                if await sync_to_async(_refund_late_payment)(appointment):
+                    messages.error(request, 'This appointment was cancelled before your payment went through, so it will be refunded.')
+                else:
+                    messages.info(request, 'This appointment has already been paid for.')
+                return redirect('appointment_success', appointment_id=appointment.id)
             
-            # Send provider notification
-            send_provider_notification(appointment)
+            # Send confirmation and provider notification emails
+            await sync_to_async(_send_confirmation_emails)(appointment)
             
             messages.success(request, 'Payment confirmed! Your appointment is booked and confirmation emails have been sent.')
             return redirect('appointment_success', appointment_id=appointment.id)
@@ -150,9 +331,190 @@ def confirm_payment(request, appointment_id):
     return redirect('appointment_payment', appointment_id=appointment.id)
 
 
+async def series_payment(request, series_id):
+    """Display payment for a whole series with one combined PaymentIntent (async: awaits Stripe)."""
+    series = await aget_object_or_404(
+        AppointmentSeries.objects.select_related('provider'), id=series_id, clinic=request.clinic
+    )
+    appointments = [appointment async for appointment in series.appointments.order_by('appointment_time')]
+    unpaid = [appointment for appointment in appointments if appointment.status == Appointment.STATUS_PENDING_PAYMENT]
+    
+    # Redirect if nothing is left to pay for
+    if not unpaid:
+        messages.info(request, 'This series has already been paid for.')
+        return redirect('appointment_success', appointment_id=appointments[0].id)
+    
+    total = sum(appointment.amount_paid for appointment in unpaid)
+    payment_intent = None
+    error = None
+    
+    try:
+        stripe_client = get_stripe_client()
+        if not series.stripe_payment_intent_id:
+            # One PaymentIntent covers every session
+            with timed('stripe'):
+                payment_intent = await stripe_client.v1.payment_intents.create_async(params={
+                    'amount': int(total * 100),
+                    'currency': 'usd',
+                    'description': f'{len(unpaid)} x {series.get_appointment_type_display()} with {series.provider.name}',
+                    'metadata': {
+                        'series_id': series.id,
+                        'client_email': series.client_email,
+                        'provider': series.provider.name,
+                        'appointment_type': series.appointment_type,
+                        'sessions': len(unpaid),
+                    },
+                })
+            
+            # Refunds for single sessions are partial refunds against this intent
+            series.stripe_payment_intent_id = payment_intent.id
+            await series.asave(update_fields=['stripe_payment_intent_id', 'updated_at'])
+            await series.appointments.filter(pk__in=[appointment.pk for appointment in unpaid]).aupdate(
+                stripe_payment_intent_id=payment_intent.id, updated_at=timezone.now(),
+            )
+        else:
+            with timed('stripe'):
+                payment_intent = await stripe_client.v1.payment_intents.retrieve_async(
+                    series.stripe_payment_intent_id
+                )
+            if payment_intent.amount != int(total * 100) and payment_intent.status != 'succeeded':
+                # Sessions were cancelled or repriced since the intent was created
+                with timed('stripe'):
+                    payment_intent = await stripe_client.v1.payment_intents.update_async(
+                        payment_intent.id,
+                        params={'amount': int(total * 100), 'metadata': {'sessions': len(unpaid)}},
+                    )
+    
+    except stripe.error.StripeError as e:
+        error = str(e)
+        messages.error(request, f'Payment error: {error}')
+    
+    context = {
+        'series': series,
+        'appointments': unpaid,
+        'total': total,
+        'payment_intent': payment_intent,
+        'stripe_publishable_key': settings.STRIPE_PUBLISHABLE_KEY,
+        'error': error,
+    }
+    return await sync_to_async(render)(request, 'appointments/series_payment.html', context)
+
+
+def _confirm_series(series, amount):
+    """
+    Settle a succeeded series payment of amount (in cents) and queue the follow-up work.
+    
+    Confirms the unpaid sessions in one UPDATE. Sessions cancelled while the
+    payment page was open were still part of the amount paid, so they are
+    recorded as paid and refunded against the combined intent. Returns the
+    confirmed and refunded ids, or None if the amount matches neither.
+    """
+    with write_transaction():
+        rows = list(series.appointments.filter(is_paid=False).values_list(
+            'pk', 'status', 'stripe_payment_intent_id', 'amount_paid',
+        ))
+        pending = [(pk, price) for pk, status, _, price in rows if status == Appointment.STATUS_PENDING_PAYMENT]
+        cancelled = [
+            (pk, price) for pk, status, intent_id, price in rows
+            if status == Appointment.STATUS_CANCELLED and intent_id == series.stripe_payment_intent_id
+        ]
+        if not pending and not cancelled:
+            return [], []  # Already settled, e.g. a retried confirmation
+        pending_total = int(sum(price for _, price in pending) * 100)
+        if amount == pending_total:
+            cancelled = []
+        elif amount != pending_total + int(sum(price for _, price in cancelled) * 100):
+            return None
+        confirmed_ids = [pk for pk, _ in pending]
+        refunded_ids = [pk for pk, _ in cancelled]
+        series.appointments.filter(pk__in=confirmed_ids).transition(Appointment.STATUS_CONFIRMED, is_paid=True)
+        series.appointments.filter(pk__in=refunded_ids).update(is_paid=True, updated_at=timezone.now())
+    enqueue_in_batches(send_confirmation_emails, confirmed_ids)
+    enqueue_in_batches(refund_payments, refunded_ids)
+    return confirmed_ids, refunded_ids
+
+
+@require_http_methods(["POST"])
+async def confirm_series_payment(request, series_id):
+    """Confirm payment for every session in a series (async: awaits Stripe)."""
+    series = await aget_object_or_404(AppointmentSeries, id=series_id, clinic=request.clinic)
+    
+    if series.stripe_payment_intent_id:
+        try:
+            with timed('stripe'):
+                payment_intent = await get_stripe_client().v1.payment_intents.retrieve_async(
+                    series.stripe_payment_intent_id
+                )
+            
+            if payment_intent.status != 'succeeded':
+                messages.error(request, 'Your payment has not been completed yet. Please try again.')
+                return redirect('series_payment', series_id=series.id)
+            
+            settled = await sync_to_async(_confirm_series)(series, payment_intent.amount)
+            if settled is None:
+                messages.error(request, 'Your payment does not match the sessions left to pay for. Please contact us.')
+                return redirect('series_payment', series_id=series.id)
+            confirmed, refunded = settled
+            first = await series.appointments.order_by('appointment_time').afirst()
+            
+            if refunded:
+                messages.info(request, f'{len(refunded)} sessions were cancelled before your payment went through, so they will be refunded.')
+            if confirmed:
+                messages.success(request, f'Payment confirmed! {len(confirmed)} sessions are booked and confirmation emails are on their way.')
+            elif not refunded:
+                messages.info(request, 'This series has already been paid for.')
+            return redirect('appointment_success', appointment_id=first.id)
+        
+        except stripe.error.StripeError as e:
+            messages.error(request, f'Payment verification failed: {str(e)}')
+            return redirect('series_payment', series_id=series.id)
+    
+    messages.error(request, 'No payment information found.')
+    return redirect('series_payment', series_id=series.id)
+
+
+def _get_appointment_or_archived(appointment_id, clinic):
+    """The appointment, or a read-only copy from the archive once it has been moved there."""
+    appointment = Appointment.objects.filter(id=appointment_id, clinic=clinic).first()
+    if appointment is None:
+        appointment = get_object_or_404(AppointmentArchive, id=appointment_id, clinic=clinic).as_appointment()
+    return appointment
+
+
+def _appointment_for_request(request, appointment_id):
+    """Load the appointment once per request; the conditional GET checks and the view share it."""
+    if getattr(request, '_appointment', None) is None:
+        request._appointment = _get_appointment_or_archived(appointment_id, request.clinic)
+    return request._appointment
+
+
+def _has_pending_messages(request):
+    # Pages showing flash messages differ from any cached copy, so never validate them
+    return len(messages.get_messages(request)) > 0
+
+
+def _appointment_etag(request, appointment_id):
+    if _has_pending_messages(request):
+        return None
+    appointment = _appointment_for_request(request, appointment_id)
+    return f'{appointment.pk}-{appointment.updated_at.timestamp()}'
+
+
+def _appointment_last_modified(request, appointment_id):
+    if _has_pending_messages(request):
+        return None
+    return _appointment_for_request(request, appointment_id).updated_at
+
+
+# Patient-specific pages: browsers may keep a copy but must revalidate it (cheap 304s)
+appointment_conditional = condition(etag_func=_appointment_etag, last_modified_func=_appointment_last_modified)
+
+
+@cache_control(private=True, no_cache=True)
+@appointment_conditional
 def appointment_success(request, appointment_id):
     """Display successful booking confirmation page."""
-    appointment = get_object_or_404(Appointment, id=appointment_id)
+    appointment = _appointment_for_request(request, appointment_id)
     
     context = {
         'appointment': appointment,
@@ -165,69 +527,126 @@ def home(request):
     return redirect('create_appointment')
 
 
-def stripe_status(request):
-    """Display Stripe configuration status (test/live mode check)."""
-    stripe_config = {
+def _stripe_config():
+    return {
         'publishable_key': settings.STRIPE_PUBLISHABLE_KEY,
         'secret_key': settings.STRIPE_SECRET_KEY[:12] + '...' if settings.STRIPE_SECRET_KEY else 'Not set',
         'is_test_mode': settings.STRIPE_SECRET_KEY.startswith('sk_test_') if settings.STRIPE_SECRET_KEY else False,
         'is_live_mode': settings.STRIPE_SECRET_KEY.startswith('sk_live_') if settings.STRIPE_SECRET_KEY else False,
         'appointment_price': settings.APPOINTMENT_PRICE / 100,
     }
-    
-    return render(request, 'appointments/stripe_status.html', {'config': stripe_config})
+
+
+def _stripe_status_etag(request):
+    # The page only changes when the Stripe settings do
+    if _has_pending_messages(request):
+        return None
+    return hashlib.sha256(json.dumps(_stripe_config(), sort_keys=True).encode()).hexdigest()[:32]
+
+
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_stripe_status_etag)
+def stripe_status(request):
+    """Display Stripe configuration status (test/live mode check)."""
+    return render(request, 'appointments/stripe_status.html', {'config': _stripe_config()})
 
 
 def calendar_connect(request, appointment_id):
     """Initiate Google Calendar OAuth flow for appointment."""
-    appointment = get_object_or_404(Appointment, id=appointment_id)
+    appointment = _get_appointment_or_archived(appointment_id, request.clinic)
+    
+    if appointment.is_archived:
+        messages.info(request, 'This appointment has been archived and can no longer be added to Google Calendar.')
+        return redirect('appointment_success', appointment_id=appointment.id)
     
     if not appointment.is_paid:
         messages.error(request, 'Please complete payment before adding to calendar.')
         return redirect('appointment_payment', appointment_id=appointment.id)
     
+    # Reuse stored credentials so returning patients skip the OAuth round trip, but
+    # only in a browser that signed in to that Google account; anyone else who
+    # knows the email goes through OAuth, which checks the account
+    credentials = None
+    if request.session.get(CALENDAR_ACCOUNT_SESSION_KEY) == appointment.client_email.lower():
+        credentials = get_calendar_credentials(appointment.client_email)
+    if credentials:
+        _add_to_google_calendar(request, appointment, credentials)
+        return redirect('appointment_success', appointment_id=appointment.id)
+    
     try:
-        auth_url = create_google_calendar_flow(request)
-        request.session['calendar_appointment_id'] = appointment_id
+        auth_url = create_google_calendar_flow(request, appointment_id)
         return redirect(auth_url)
     except Exception as e:
         messages.error(request, f'Calendar connection failed: {str(e)}')
         return redirect('appointment_success', appointment_id=appointment.id)
 
 
-def calendar_callback(request):
+def _run_blocking(func):
+    """
+    Run a blocking Google client call in a worker thread.
+    
+    The Google libraries have no async API; running them off the main sync
+    thread keeps slow OAuth/Calendar requests from serializing other views.
+    """
+    def run(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # The worker thread opened its own connection; don't leak it
+            connections.close_all()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+async def calendar_callback(request):
     """Handle Google Calendar OAuth callback and create event."""
-    appointment_id = request.session.get('calendar_appointment_id')
+    oauth = await sync_to_async(request.session.get)(CALENDAR_OAUTH_SESSION_KEY, {})
+    appointment_id = oauth.get('appointment_id')
     if not appointment_id:
         messages.error(request, 'Invalid calendar connection request.')
         return redirect('home')
     
-    appointment = get_object_or_404(Appointment, id=appointment_id)
+    # Google returns to one fixed URL, so the clinic comes from the session
+    clinic = get_directory().by_slug.get(oauth.get('clinic'), request.clinic)
+    with tenant_database(clinic.database):
+        appointment = await aget_object_or_404(
+            Appointment.objects.select_related('provider'), id=appointment_id, clinic=clinic
+        )
     
-    # Handle OAuth callback and get credentials
-    success, message = handle_google_calendar_callback(request)
+    # Handle OAuth callback and persist credentials for this patient
+    success, message = await _run_blocking(handle_google_calendar_callback)(request, appointment.client_email)
     
     if success:
         # Create event in Google Calendar
-        credentials_dict = request.session.get('google_calendar_credentials')
-        event_success, event_id = create_calendar_event(appointment, credentials_dict)
-        
-        if event_success:
-            appointment.google_calendar_event_id = event_id
-            appointment.calendar_synced = True
-            appointment.save()
-            messages.success(request, 'Appointment added to your Google Calendar!')
-        else:
-            messages.warning(request, f'Calendar access granted but event creation failed: {event_id}')
+        credentials = await sync_to_async(get_calendar_credentials)(appointment.client_email)
+        await _run_blocking(_add_to_google_calendar)(request, appointment, credentials)
     else:
         messages.error(request, f'Calendar connection failed: {message}')
     
+    # The flow is finished; drop its session entry
+    request.session.pop(CALENDAR_OAUTH_SESSION_KEY, None)
+    if clinic != request.clinic:
+        return redirect(clinic_url(clinic, reverse('appointment_success', args=[appointment.id])))
     return redirect('appointment_success', appointment_id=appointment.id)
 
 
+def _add_to_google_calendar(request, appointment, credentials):
+    """Create the Google Calendar event and record the sync on the appointment."""
+    event_success, event_id = create_calendar_event(appointment, credentials)
+    
+    if event_success:
+        appointment.google_calendar_event_id = event_id
+        appointment.calendar_synced = True
+        appointment.save()
+        messages.success(request, 'Appointment added to your Google Calendar!')
+    else:
+        messages.warning(request, f'Calendar access granted but event creation failed: {event_id}')
+
+
+@cache_control(private=True, no_cache=True)
+@appointment_conditional
 def download_calendar_file(request, appointment_id):
     """Generate and download ICS calendar file."""
-    appointment = get_object_or_404(Appointment, id=appointment_id)
+    appointment = _appointment_for_request(request, appointment_id)
     
     if not appointment.is_paid:
         messages.error(request, 'Please complete payment before downloading calendar file.')
@@ -0,0 +1,188 @@
+"""
+Waitlist slot matching.
+Freed slots (cancelled future appointments) are offered to waiting patients
+in batches: one indexed query loads the candidate entries for the whole
+batch, matching runs in memory in first-come order, and the offers are
+written as held bookings with bulk inserts. Unpaid holds expire and their
+slots go back through the matcher.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .db import write_transaction
+from .models import Appointment, WaitlistEntry
+from .pricing import quote
+
+
+def _open_slots(appointment_ids, now):
+    """Freed slots in the batch that are still in the future and not booked again."""
+    freed = list(
+        Appointment.objects.filter(
+            pk__in=appointment_ids,
+            status=Appointment.STATUS_CANCELLED,
+            provider__isnull=False,
+            appointment_time__gt=now,
+        ).select_related('provider').order_by('appointment_time', 'pk')
+    )
+    if not freed:
+        return []
+    taken = set(
+        Appointment.objects.filter(
+            provider_id__in={slot.provider_id for slot in freed},
+            appointment_time__in={slot.appointment_time for slot in freed},
+            status__in=Appointment.ACTIVE_STATUSES,
+        ).values_list('provider_id', 'appointment_time')
+    )
+    slots = []
+    for slot in freed:
+        key = (slot.provider_id, slot.appointment_time)
+        if key not in taken:
+            # Two cancellations of one slot free it only once
+            taken.add(key)
+            slots.append(slot)
+    return slots
+
+
+def _candidates(slots):
+    """Waiting entries that could take any slot in the batch, oldest first (one query)."""
+    return list(
+        WaitlistEntry.objects.filter(
+            Q(provider_id__in={slot.provider_id for slot in slots})
+            | Q(provider__isnull=True, specialty__in={slot.provider.specialty for slot in slots}),
+            status=WaitlistEntry.STATUS_WAITING,
+            window_start__lte=slots[-1].appointment_time,
+            window_end__gte=slots[0].appointment_time,
+        ).order_by('created_at', 'pk').select_for_update(skip_locked=True)
+    )
+
+
+def match_slots(slots, entries):
+    """
+    Pair slots with waiting entries; returns a list of (slot, entry).
+
+    Each slot goes to the longest-waiting entry whose window covers it, among
+    entries for that provider and entries for its specialty at the same
+    clinic. A patient gets at most one offer per batch.
+    """
+    by_provider = defaultdict(list)
+    by_specialty = defaultdict(list)
+    for entry in entries:
+        if entry.provider_id:
+            by_provider[entry.provider_id].append(entry)
+        else:
+            by_specialty[(entry.clinic_id, entry.specialty)].append(entry)
+
+    offered_emails = set()
+    matches = []
+    for slot in slots:
+        best = best_queue = None
+        for queue in (by_provider[slot.provider_id], by_specialty[(slot.clinic_id, slot.provider.specialty)]):
+            # Queues are in first-come order, so the first fit is that queue's best
+            for entry in queue:
+                if (
+                    entry.client_email not in offered_emails
+                    and entry.window_start <= slot.appointment_time <= entry.window_end
+                ):
+                    if best is None or (entry.created_at, entry.pk) < (best.created_at, best.pk):
+                        best, best_queue = entry, queue
+                    break
+        if best is not None:
+            offered_emails.add(best.client_email)
+            best_queue.remove(best)
+            matches.append((slot, best))
+    return matches
+
+
+def _held_bookings(matches):
+    """Unsaved pending bookings for the matched patients, priced in one pass per provider and type."""
+    groups = defaultdict(list)
+    for slot, entry in matches:
+        groups[(slot.provider_id, entry.appointment_type)].append((slot, entry))
+    held = []
+    for (_, appointment_type), group in groups.items():
+        prices = quote(group[0][0].provider, appointment_type, [slot.appointment_time for slot, _ in group])
+        for (slot, entry), price in zip(group, prices):
+            held.append((entry, Appointment(
+                clinic_id=slot.clinic_id,
+                provider=slot.provider,
+                appointment_time=slot.appointment_time,
+                client_email=entry.client_email,
+                appointment_type=appointment_type,
+                amount_paid=price,
+                notes='Offered from the waitlist',
+            )))
+    return held
+
+
+def offer_freed_slots(appointment_ids):
+    """Offer a batch of cancelled appointments' slots to the waitlist; returns the held booking ids."""
+    now = timezone.now()
+    # One writer at a time, so two matchers never offer the same entry
+    with write_transaction():
+        slots = _open_slots(appointment_ids, now)
+        if not slots:
+            return []
+        matches = match_slots(slots, _candidates(slots))
+        if not matches:
+            return []
+        held = _held_bookings(matches)
+        appointments = Appointment.objects.bulk_create([appointment for _, appointment in held])
+        expires = now + timedelta(minutes=settings.WAITLIST_HOLD_MINUTES)
+        entries = []
+        for (entry, _), appointment in zip(held, appointments):
+            entry.status = WaitlistEntry.STATUS_OFFERED
+            entry.offered_appointment = appointment
+            entry.hold_expires_at = expires
+            entry.updated_at = now
+            entries.append(entry)
+        WaitlistEntry.objects.bulk_update(entries, ['status', 'offered_appointment', 'hold_expires_at', 'updated_at'])
+    return [appointment.pk for appointment in appointments]
+
+
+def expire_holds():
+    """
+    Settle offered entries: paid holds become bookings, unpaid expired holds
+    are cancelled. Returns the ids of the released bookings to offer again.
+    """
+    now = timezone.now()
+    offered = WaitlistEntry.objects.filter(status=WaitlistEntry.STATUS_OFFERED)
+    with write_transaction():
+        offered.filter(offered_appointment__status__in=[
+            Appointment.STATUS_CONFIRMED, Appointment.STATUS_COMPLETED,
+        ]).update(status=WaitlistEntry.STATUS_BOOKED, updated_at=now)
+
+        expired = list(
+            offered.filter(hold_expires_at__lt=now)
+            .values_list('pk', 'offered_appointment_id', 'offered_appointment__status')
+        )
+        if not expired:
+            return []
+        WaitlistEntry.objects.filter(pk__in=[pk for pk, _, _ in expired]).update(
+            status=WaitlistEntry.STATUS_EXPIRED, updated_at=now,
+        )
+        # Holds an admin already cancelled have been released once
+        appointment_ids = [
+            appointment_id for _, appointment_id, status in expired
+            if status == Appointment.STATUS_PENDING_PAYMENT
+        ]
+        Appointment.objects.filter(
+            pk__in=appointment_ids, status=Appointment.STATUS_PENDING_PAYMENT,
+        ).transition(Appointment.STATUS_CANCELLED, cancelled_at=now)
+    return appointment_ids
+
+
+def hold_lapsed(appointment, now=None):
+    """
+    Whether the appointment is a waitlist hold the patient can no longer pay for.
+    
+    Expects waitlist_entry to be select_related, so the check costs no query.
+    """
+    entry = getattr(appointment, 'waitlist_entry', None)
+    if entry is None:
+        return False
+    return entry.status != WaitlistEntry.STATUS_OFFERED or entry.hold_expires_at <= (now or timezone.now())
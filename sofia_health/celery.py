@@ -0,0 +1,14 @@
+"""
+Celery application for background tasks.
+Reads CELERY_* settings from Django settings and autodiscovers app tasks.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sofia_health.settings")
+
+app = Celery("sofia_health")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 from decouple import config, Csv
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -43,11 +44,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "appointments.middleware.InstrumentationMiddleware",
+    "appointments.middleware.CompressionMiddleware",
+    "appointments.middleware.TenantMiddleware",
+    "appointments.middleware.AdmissionControlMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "appointments.middleware.ReplicaStickinessMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -56,7 +62,8 @@ ROOT_URLCONF = "sofia_health.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # Django templates, timed per render for Server-Timing
+        "BACKEND": "appointments.instrumentation.InstrumentedDjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -83,6 +90,125 @@ DATABASES = {
     }
 }
 
+# Optional read replica for analytics reads (dashboard, exports, admin lists)
+DATABASE_REPLICA_NAME = config('DATABASE_REPLICA_NAME', default='')
+if DATABASE_REPLICA_NAME:
+    DATABASES["replica"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": DATABASE_REPLICA_NAME,
+        # Tests run against the primary's test database
+        "TEST": {"MIRROR": "default"},
+    }
+
+# Databases of their own for large clinics: "alias=path,alias=path".
+# Create each with `manage.py migrate --database=<alias>` and point the
+# clinic's database field at the alias.
+TENANT_DATABASES = config('TENANT_DATABASES', default='', cast=Csv())
+DATABASES.update({
+    alias.strip(): {"ENGINE": "django.db.backends.sqlite3", "NAME": name.strip()}
+    for alias, _, name in (entry.partition('=') for entry in TENANT_DATABASES)
+})
+
+DATABASE_ROUTERS = ['appointments.routers.TenantRouter', 'appointments.routers.ReplicaRouter']
+
+# Path prefix selecting a clinic by slug, as in /c/<slug>/appointments/...
+TENANT_URL_PREFIX = 'c'
+
+# Seconds a session keeps reading from the primary after it writes
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=10, cast=int)
+
+# SQLite tuning, applied to every new connection by appointments.db
+SQLITE_TUNING = config('SQLITE_TUNING', default=True, cast=bool)
+SQLITE_JOURNAL_MODE = config('SQLITE_JOURNAL_MODE', default='WAL')
+SQLITE_BUSY_TIMEOUT_MS = config('SQLITE_BUSY_TIMEOUT_MS', default=5000, cast=int)
+SQLITE_SYNCHRONOUS = config('SQLITE_SYNCHRONOUS', default='NORMAL')
+SQLITE_CACHE_SIZE_KB = config('SQLITE_CACHE_SIZE_KB', default=20000, cast=int)
+SQLITE_MMAP_SIZE = config('SQLITE_MMAP_SIZE', default=134217728, cast=int)  # 128 MB
+# Booking/payment writes take the write lock with BEGIN IMMEDIATE
+SQLITE_IMMEDIATE_TRANSACTIONS = config('SQLITE_IMMEDIATE_TRANSACTIONS', default=True, cast=bool)
+
+
+# Caches and sessions
+# Sessions read through Redis when SESSION_CACHE_URL is set and fall back to
+# the database on a miss. A local-memory session cache is only safe with one
+# process (each worker would keep its own stale copy of a changed session),
+# so without a shared cache sessions go straight to the database unless DEBUG.
+SESSION_CACHE_URL = config('SESSION_CACHE_URL', default='')
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "sessions": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "sessions",
+        "OPTIONS": {
+            "MAX_ENTRIES": config('SESSION_CACHE_MAX_ENTRIES', default=10000, cast=int),
+        },
+    },
+}
+if SESSION_CACHE_URL:
+    CACHES["sessions"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": SESSION_CACHE_URL,
+    }
+
+SESSION_ENGINE = config(
+    'SESSION_ENGINE',
+    default='django.contrib.sessions.backends.cached_db' if SESSION_CACHE_URL or DEBUG
+    else 'django.contrib.sessions.backends.db',
+)
+if not (SESSION_CACHE_URL or DEBUG) and SESSION_ENGINE in (
+    'django.contrib.sessions.backends.cache', 'django.contrib.sessions.backends.cached_db',
+):
+    raise ImproperlyConfigured(f"{SESSION_ENGINE} needs a shared session cache: set SESSION_CACHE_URL")
+SESSION_CACHE_ALIAS = "sessions"
+
+# Provider directory API pages, shared through Redis when DIRECTORY_CACHE_URL
+# is set so a provider change invalidates them in every worker
+DIRECTORY_CACHE_URL = config('DIRECTORY_CACHE_URL', default=SESSION_CACHE_URL)
+CACHES["directory"] = {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    "LOCATION": "directory",
+}
+if DIRECTORY_CACHE_URL:
+    CACHES["directory"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": DIRECTORY_CACHE_URL,
+    }
+PROVIDER_DIRECTORY_CACHE_ALIAS = "directory"
+PROVIDER_DIRECTORY_CACHE_SECONDS = config('PROVIDER_DIRECTORY_CACHE_SECONDS', default=300, cast=int)
+
+# Expired sessions removed per DELETE by the cleanup task
+SESSION_CLEANUP_BATCH_SIZE = config('SESSION_CLEANUP_BATCH_SIZE', default=5000, cast=int)
+
+
+# Admission control for the booking endpoints
+# Rate limits are sliding windows in the "admission" cache (shared through
+# Redis when ADMISSION_CACHE_URL is set); concurrency limits are per process.
+ADMISSION_CONTROL_ENABLED = config('ADMISSION_CONTROL_ENABLED', default=not DEBUG, cast=bool)
+ADMISSION_CACHE_URL = config('ADMISSION_CACHE_URL', default=SESSION_CACHE_URL)
+CACHES["admission"] = {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    "LOCATION": "admission",
+}
+if ADMISSION_CACHE_URL:
+    CACHES["admission"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": ADMISSION_CACHE_URL,
+    }
+ADMISSION_CACHE_ALIAS = "admission"
+# Views that are shed under load, and views that are always admitted
+ADMISSION_SHED_VIEWS = ['create_appointment', 'appointment_payment']
+ADMISSION_PRIORITY_VIEWS = ['confirm_payment']
+ADMISSION_WINDOW_SECONDS = config('ADMISSION_WINDOW_SECONDS', default=60, cast=int)
+ADMISSION_GLOBAL_RATE = config('ADMISSION_GLOBAL_RATE', default=1200, cast=int)  # requests per window
+ADMISSION_CLIENT_RATE = config('ADMISSION_CLIENT_RATE', default=30, cast=int)  # requests per window per IP
+ADMISSION_GLOBAL_CONCURRENCY = config('ADMISSION_GLOBAL_CONCURRENCY', default=32, cast=int)
+ADMISSION_CLIENT_CONCURRENCY = config('ADMISSION_CLIENT_CONCURRENCY', default=4, cast=int)
+ADMISSION_RETRY_AFTER = config('ADMISSION_RETRY_AFTER', default=2, cast=int)  # seconds, when overloaded
+# META key holding the client IP, e.g. HTTP_X_REAL_IP behind a proxy that sets it
+ADMISSION_CLIENT_IP_HEADER = config('ADMISSION_CLIENT_IP_HEADER', default='REMOTE_ADDR')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -128,10 +254,15 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Stripe Configuration
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
+STRIPE_TIMEOUT = config('STRIPE_TIMEOUT', default=30, cast=int)  # seconds per API request
+STRIPE_REFUND_WORKERS = config('STRIPE_REFUND_WORKERS', default=4, cast=int)  # concurrent refund calls per task
 
 # Appointment Settings
 APPOINTMENT_PRICE = config('APPOINTMENT_PRICE', default=5000, cast=int)  # in cents ($50.00)
 
+# Minutes a waitlist patient has to pay for an offered slot before it is released
+WAITLIST_HOLD_MINUTES = config('WAITLIST_HOLD_MINUTES', default=30, cast=int)
+
 # Email Configuration
 EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
 EMAIL_HOST = config('EMAIL_HOST', default='')
@@ -146,6 +277,9 @@ GOOGLE_CALENDAR_CLIENT_ID = config('GOOGLE_CALENDAR_CLIENT_ID', default='')
 GOOGLE_CALENDAR_CLIENT_SECRET = config('GOOGLE_CALENDAR_CLIENT_SECRET', default='')
 GOOGLE_CALENDAR_REDIRECT_URI = config('GOOGLE_CALENDAR_REDIRECT_URI', default='http://127.0.0.1:8000/appointments/calendar/callback/')
 
+# Fernet key for encrypting stored OAuth tokens (derived from SECRET_KEY if empty)
+CREDENTIAL_ENCRYPTION_KEY = config('CREDENTIAL_ENCRYPTION_KEY', default='')
+
 # Celery Configuration (for background tasks)
 CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', default='redis://localhost:6379/0')
@@ -153,3 +287,19 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Run tasks inline when no broker is available (development and tests)
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=DEBUG, cast=bool)
+CELERY_BEAT_SCHEDULE = {
+    'complete-past-appointments': {
+        'task': 'appointments.tasks.complete_past_appointments',
+        'schedule': 15 * 60,  # every 15 minutes
+    },
+    'clear-expired-sessions': {
+        'task': 'appointments.tasks.clear_expired_sessions',
+        'schedule': 60 * 60,  # hourly
+    },
+    'expire-waitlist-holds': {
+        'task': 'appointments.tasks.expire_waitlist_holds',
+        'schedule': 60,  # every minute
+    },
+}